@@ -1,8 +1,8 @@
-from app import app as application
-
-from app import db
+from app import create_app, db
 from app.models import *
 
+application = create_app()
+
 @application.shell_context_processor
 def make_shell_context():
     return {
@@ -11,4 +11,4 @@ def make_shell_context():
     }
 
 if __name__ == "__main__":
-    application.run(host="0.0.0.0", port=8888)
\ No newline at end of file
+    application.run(host="0.0.0.0", port=8888)
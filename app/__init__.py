@@ -4,19 +4,56 @@ from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+db = SQLAlchemy()
+migrate = Migrate()
 
-from app.routes import testing_bp, qif_bp, digital_pipelines_bp
 
-app.register_blueprint(qif_bp, url_prefix="/qif")
-app.register_blueprint(digital_pipelines_bp, url_prefix="/digital_pipelines")
+def index():
+    return redirect(url_for("qif.start"))  # Correct blueprint endpoint
 
 
-from app import routes, models
+def create_app(config_class=Config, warmup=False):
+    """
+    Builds the Flask app. With warmup (or WARMUP_ENABLED) the schemas, tag
+    tables and hot catalogue entries are loaded before returning, so a
+    pre-forking server (gunicorn --preload) shares them with every worker
+    copy-on-write instead of each worker building its own (see app.warmup).
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    db.init_app(app)
+    migrate.init_app(app, db)
 
-@app.route("/")
-def index():
-    return redirect(url_for("qif.start"))  # Correct blueprint endpoint
\ No newline at end of file
+    from app.routes import (
+        testing_bp,
+        calculator_stand_in_bp,
+        qif_bp,
+        digital_pipelines_bp,
+        metrics_bp,
+        profiling_bp,
+        warehouse_bp,
+    )
+
+    app.register_blueprint(qif_bp, url_prefix="/qif")
+    app.register_blueprint(testing_bp, url_prefix="/testing")
+    app.register_blueprint(digital_pipelines_bp, url_prefix="/digital_pipelines")
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(profiling_bp, url_prefix="/qif/profiles")
+    app.register_blueprint(warehouse_bp, url_prefix="/qif/warehouse")
+    if app.testing or app.debug:
+        app.register_blueprint(calculator_stand_in_bp, url_prefix="/testing")
+
+    from app.cli import qif_cli
+
+    app.cli.add_command(qif_cli)
+
+    app.add_url_rule("/", "index", index)
+
+    if warmup or app.config.get("WARMUP_ENABLED"):
+        from app.warmup import warm_up
+
+        warm_up(app)
+    return app
+
+
+from app import routes, models
@@ -0,0 +1,388 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import multiprocessing
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+qif_cli = AppGroup(
+    "qif", help="Batch QIF processing (summary, validate, audit, diff, xpath, ingest)."
+)
+
+# Compiled schema, set once per worker process by _init_worker.
+_schema = None
+
+
+def _init_worker():
+    """
+    Pool initializer. With fork the parent's compiled schema is inherited as-is;
+    with spawn importing qif_tools compiles it once for this worker.
+    """
+    global _schema
+    from app.routes.qif_tools import schema_obj
+
+    _schema = schema_obj
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+
+def _load(path):
+    from app.routes.qifsummary import QIFSummary
+
+    return QIFSummary(path, _schema)
+
+
+def _summary(paths):
+    return _load(paths[0]).get_summary()
+
+
+def _validate(paths):
+    qif = _load(paths[0])
+    result = qif.get_schema_validation()
+    result["xml_errors"] = qif.basic_xml_errors
+    return result
+
+
+def _audit(paths):
+    qif = _load(paths[0])
+    result = qif.audit_summary()
+    result["checks"] = qif.get_check_report()
+    return result
+
+
+def _diff(paths):
+    left, right = _load(paths[0]), _load(paths[1])
+    result = left.compare_to(right)
+    result["count"] = len(result["differences"])
+    return result
+
+
+def _xpath(paths, expression, limit=None, xml=False):
+    from app.routes.qifxpath import query_file
+
+    # Each file is queried once per run, so there is nothing to gain from caching trees.
+    record = query_file(
+        paths[0], expression, limit=limit, xml=xml, cache=False, raise_errors=True
+    )
+    del record["path"]
+    return record
+
+
+OPERATIONS = {
+    "summary": _summary,
+    "validate": _validate,
+    "audit": _audit,
+    "diff": _diff,
+    "xpath": _xpath,
+}
+
+
+def _run_task(task):
+    """Runs one (operation, paths, *args) task in a worker; never raises."""
+    operation, paths, *args = task
+    start = time.perf_counter()
+    record = {"operation": operation, "path": paths[0]}
+    if len(paths) > 1:
+        record["other"] = paths[1]
+    try:
+        record["result"] = OPERATIONS[operation](paths, *args)
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def _task_key(record):
+    return (record["operation"], record["path"], record.get("other"))
+
+
+def expand_paths(patterns, extensions):
+    """
+    Expands files, directories (recursively, filtered by extension) and globs
+    into a sorted, de-duplicated list of absolute file paths.
+    """
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, _, filenames in os.walk(pattern):
+                for f in filenames:
+                    if f.rsplit(".", 1)[-1].lower() in extensions:
+                        found.add(os.path.abspath(os.path.join(dirpath, f)))
+        elif os.path.isfile(pattern):
+            found.add(os.path.abspath(pattern))
+        else:
+            matches = [m for m in glob.glob(pattern, recursive=True) if os.path.isfile(m)]
+            if not matches:
+                logger.warning("No files match %s", pattern)
+            found.update(os.path.abspath(m) for m in matches)
+    return sorted(found)
+
+
+def _pair_paths(left, right):
+    """Pairs two file lists by basename, reporting names present on one side only."""
+    if len(left) == 1 and len(right) == 1:
+        return [(left[0], right[0])]
+    right_by_name = {os.path.basename(p): p for p in right}
+    pairs = []
+    for path in left:
+        other = right_by_name.get(os.path.basename(path))
+        if other is None:
+            click.echo(f"No counterpart for {path}", err=True)
+        else:
+            pairs.append((path, other))
+    return pairs
+
+
+def _load_checkpoint(output):
+    """Keys of tasks already recorded in an earlier run's JSONL output."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run; that task simply reruns.
+                continue
+            done.add(_task_key(record))
+    return done
+
+
+def run_batch(tasks, output, jobs, resume, chunksize=1):
+    """
+    Runs tasks over a process pool and writes one JSON line per finished task,
+    in completion order. With resume, tasks already present in output are skipped
+    and new records are appended. Returns (completed, failed, skipped).
+    """
+    if output in (None, "-") and resume:
+        raise click.UsageError("--resume needs --output FILE")
+
+    skipped = 0
+    if resume:
+        done = _load_checkpoint(output)
+        remaining = []
+        for task in tasks:
+            operation, paths = task[:2]
+            key = (operation, paths[0], paths[1] if len(paths) > 1 else None)
+            if key in done:
+                skipped += 1
+            else:
+                remaining.append(task)
+        tasks = remaining
+
+    completed = failed = 0
+    out = sys.stdout if output in (None, "-") else open(output, "a" if resume else "w")
+    try:
+        if not tasks:
+            return completed, failed, skipped
+        with multiprocessing.Pool(min(jobs, len(tasks)), initializer=_init_worker) as pool:
+            for record in pool.imap_unordered(_run_task, tasks, chunksize=chunksize):
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+                completed += 1
+                if record["status"] != "ok":
+                    failed += 1
+                    click.echo(f"FAILED {record['path']}: {record['error']}", err=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return completed, failed, skipped
+
+
+def _batch_options(func):
+    func = click.option(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="Worker processes (default: BATCH_WORKERS).",
+    )(func)
+    func = click.option(
+        "--output", "-o", default="-", help="JSON Lines output file (default: stdout)."
+    )(func)
+    func = click.option(
+        "--resume",
+        is_flag=True,
+        help="Skip tasks already recorded in --output and append the rest.",
+    )(func)
+    return func
+
+
+def _finish(operation, tasks, output, jobs, resume):
+    jobs = jobs or current_app.config.get("BATCH_WORKERS") or os.cpu_count() or 1
+    start = time.perf_counter()
+    completed, failed, skipped = run_batch(tasks, output, jobs, resume)
+    click.echo(
+        f"{operation}: {completed} done, {failed} failed, {skipped} skipped "
+        f"in {time.perf_counter() - start:.1f}s",
+        err=True,
+    )
+    if failed:
+        sys.exit(1)
+
+
+def _single_file_command(operation, help_text):
+    @qif_cli.command(operation, help=help_text)
+    @click.argument("paths", nargs=-1, required=True)
+    @_batch_options
+    def command(paths, output, jobs, resume):
+        files = expand_paths(paths, current_app.config["BATCH_EXTENSIONS"])
+        _finish(operation, [(operation, (f,)) for f in files], output, jobs, resume)
+
+    return command
+
+
+_single_file_command("summary", "Summaries (as on /qif/summary) for every file in PATHS.")
+_single_file_command("validate", "Schema validation for every file in PATHS.")
+_single_file_command(
+    "audit",
+    "Characteristic nominal reference audit and the standard's XSLT checks for every file in PATHS.",
+)
+
+
+@qif_cli.command("diff")
+@click.argument("left", nargs=1)
+@click.argument("right", nargs=1)
+@_batch_options
+def diff_command(left, right, output, jobs, resume):
+    """Compares files in LEFT to same-named files in RIGHT (files, directories or globs)."""
+    extensions = current_app.config["BATCH_EXTENSIONS"]
+    pairs = _pair_paths(expand_paths([left], extensions), expand_paths([right], extensions))
+    _finish("diff", [("diff", pair) for pair in pairs], output, jobs, resume)
+
+
+@qif_cli.command("xpath")
+@click.argument("expression")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--limit", type=int, default=None, help="Results kept per file (default: all).")
+@click.option("--xml", is_flag=True, help="Include the markup of matched elements.")
+@_batch_options
+def xpath_command(expression, paths, limit, xml, output, jobs, resume):
+    """
+    Evaluates EXPRESSION against every file in PATHS, with qif: bound to the
+    QIF namespace, e.g. `flask qif xpath "//qif:DatumLabel/text()" uploads/`.
+    """
+    from lxml import etree
+    from app.routes.qifxpath import compile_xpath
+
+    try:
+        compile_xpath(expression)
+    except etree.XPathSyntaxError as e:
+        raise click.BadParameter(str(e), param_hint="EXPRESSION")
+    files = expand_paths(paths, current_app.config["BATCH_EXTENSIONS"])
+    tasks = [("xpath", (f,), expression, limit, xml) for f in files]
+    _finish("xpath", tasks, output, jobs, resume)
+
+
+def _extract_rows(task):
+    """
+    Worker side of `flask qif ingest`: (filename, path, digest, previous
+    section hashes, previous fingerprint, strip) -> extract_changes() result,
+    or error.
+    """
+    from app.routes.warehouse import extract_changes
+
+    filename, path, digest, *previous = task
+    try:
+        return filename, path, digest, extract_changes(path, *previous), None
+    except Exception as e:
+        return filename, path, digest, None, f"{type(e).__name__}: {e}"
+
+
+@qif_cli.command("ingest")
+@click.argument("filenames", nargs=-1)
+@click.option("--jobs", "-j", type=int, default=None, help="Worker processes (default: BATCH_WORKERS).")
+@click.option("--force", is_flag=True, help="Re-extract every file in full, changed or not.")
+def ingest_command(filenames, jobs, force):
+    """
+    Loads characteristic rows and search terms for uploads into the warehouse
+    (all uploads when no FILENAMES are given). For a new revision of a file
+    already in the warehouse only what its changed sections feed is
+    re-extracted. Parsing runs in a process pool; rows are written from this
+    process.
+    """
+    from app.models import QIFFile
+    from app.routes.response_cache import file_digest
+    from app.routes.warehouse import INGEST_EXTENSIONS, upload_path, store_rows, store_failure
+
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    if not filenames:
+        filenames = sorted(
+            os.path.relpath(os.path.join(root, f), upload_folder)
+            for root, _, files in os.walk(upload_folder)
+            for f in files
+            if f.lower().endswith(INGEST_EXTENSIONS)
+        )
+
+    strip = current_app.config.get("CANONICAL_STRIP", ())
+    tasks = []
+    for filename in filenames:
+        path = upload_path(filename)
+        digest = file_digest(path)
+        existing = QIFFile.get_by_filename(filename)
+        if existing is not None and existing.sha256 == digest and not force:
+            continue
+        previous = existing if not force else None
+        tasks.append(
+            (
+                filename,
+                path,
+                digest,
+                previous.section_hashes if previous is not None else None,
+                previous.fingerprint if previous is not None else None,
+                strip,
+            )
+        )
+    click.echo(f"{len(tasks)} of {len(filenames)} files to ingest", err=True)
+    if not tasks:
+        return
+
+    jobs = jobs or current_app.config.get("BATCH_WORKERS") or os.cpu_count() or 1
+    failed = 0
+    with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+        for filename, path, digest, extract, error in pool.imap_unordered(_extract_rows, tasks):
+            if error:
+                failed += 1
+                click.echo(f"FAILED {filename}: {error}", err=True)
+                store_failure(filename, path, digest, error)
+                continue
+            sections, rows, terms, kinds, fingerprint = extract
+            qif_file = store_rows(
+                filename, path, digest, rows, terms, sections, kinds, fingerprint
+            )
+            click.echo(
+                f"{filename}: {qif_file.characteristic_count} characteristics"
+                + (" (unchanged)" if rows is None else ""),
+                err=True,
+            )
+    if failed:
+        sys.exit(1)
+
+
+@qif_cli.command("purge-jobs")
+@click.option(
+    "--older-than",
+    type=int,
+    default=None,
+    help="Seconds since a job finished (default: JOB_RETENTION).",
+)
+def purge_jobs_command(older_than):
+    """
+    Deletes finished jobs and their stored results past the retention, and
+    fails jobs whose owning process is gone. Web workers do this on their own
+    every JOB_HOUSEKEEPING_INTERVAL while they take submissions.
+    """
+    from app.routes.job_runner import purge_finished_jobs, reap_orphaned_jobs
+
+    if older_than is None:
+        older_than = current_app.config.get("JOB_RETENTION", 24 * 3600)
+    reap_orphaned_jobs()
+    click.echo(f"{purge_finished_jobs(older_than)} finished job(s) purged", err=True)
@@ -1 +1,7 @@
-from .gamescore import GameScore
\ No newline at end of file
+from .gamescore import GameScore
+from .job import Job
+from .qiffile import QIFFile
+from .characteristic import Characteristic
+from .search_term import SearchTerm
+from .pipeline_stage import PipelineStage
+from .document_link import DocumentLink
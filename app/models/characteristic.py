@@ -0,0 +1,89 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+
+
+class Characteristic(db.Model):
+    """
+    One characteristic (nominal plus, when the file has results, one actual) of
+    an ingested QIF file. Denormalised on purpose: cross-file questions such as
+    "Position tolerances below 0.05" or "where does nominal X fail" are single
+    indexed queries on this table.
+    """
+
+    __tablename__ = "characteristics"
+    __table_args__ = (
+        sa.Index("ix_characteristics_type_tolerance", "char_type", "tolerance"),
+        sa.Index("ix_characteristics_name_status", "name", "status"),
+    )
+
+    id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, primary_key=True, autoincrement=True
+    )
+    file_id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, sa.ForeignKey("qif_files.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    file_hash: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False, index=True)
+    nominal_id: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True, index=True)
+    item_id: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True)
+    measurement_id: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True)
+    name: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    char_type: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False)
+    tolerance: so.Mapped[float] = so.mapped_column(sa.Float, nullable=True)
+    lower_limit: so.Mapped[float] = so.mapped_column(sa.Float, nullable=True)
+    upper_limit: so.Mapped[float] = so.mapped_column(sa.Float, nullable=True)
+    target: so.Mapped[float] = so.mapped_column(sa.Float, nullable=True)
+    datums: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    value: so.Mapped[float] = so.mapped_column(sa.Float, nullable=True)
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), nullable=True, index=True)
+
+    file = so.relationship("QIFFile", back_populates="characteristics")
+
+    COLUMNS = (
+        "nominal_id",
+        "item_id",
+        "measurement_id",
+        "name",
+        "char_type",
+        "tolerance",
+        "lower_limit",
+        "upper_limit",
+        "target",
+        "datums",
+        "value",
+        "status",
+    )
+
+    def __repr__(self) -> str:
+        return f"<Characteristic(id={self.id}, name='{self.name}', type='{self.char_type}', status='{self.status}')>"
+
+    def to_dict(self) -> dict:
+        data = {column: getattr(self, column) for column in self.COLUMNS}
+        data["id"] = self.id
+        data["file_hash"] = self.file_hash
+        data["filename"] = self.file.filename if self.file is not None else None
+        return data
+
+    @classmethod
+    def replace_for_file(cls, qif_file, rows):
+        """Replaces all rows of qif_file with `rows` (dicts keyed by COLUMNS) in one bulk insert."""
+        db.session.execute(sa.delete(cls).where(cls.file_id == qif_file.id))
+        if rows:
+            db.session.execute(
+                sa.insert(cls),
+                [
+                    dict(
+                        {column: row.get(column) for column in cls.COLUMNS},
+                        file_id=qif_file.id,
+                        file_hash=qif_file.sha256,
+                    )
+                    for row in rows
+                ],
+            )
+
+    @classmethod
+    def rehash_for_file(cls, qif_file):
+        """Points the rows of qif_file at its current sha256 without rewriting them."""
+        db.session.execute(
+            sa.update(cls).where(cls.file_id == qif_file.id).values(file_hash=qif_file.sha256)
+        )
@@ -0,0 +1,59 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+from .qiffile import QIFFile
+
+
+class DocumentLink(db.Model):
+    """
+    One ExternalQIFDocument entry of an ingested QIF file: another document,
+    identified by its QPId, that the file's references reach into with xId
+    (e.g. results pointing at the plan's characteristic items). Indexed by
+    QPId, so the files referencing a document are found without opening them.
+    """
+
+    __tablename__ = "qif_document_links"
+
+    id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, primary_key=True, autoincrement=True
+    )
+    file_id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, sa.ForeignKey("qif_files.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # QIF id of the ExternalQIFDocument element, the target of the file's xId references
+    ref_id: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    qpid: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False, index=True)
+    uri: so.Mapped[str] = so.mapped_column(sa.String(1024), nullable=True)
+
+    file = so.relationship("QIFFile", back_populates="document_links")
+
+    COLUMNS = ("ref_id", "qpid", "uri")
+
+    def __repr__(self) -> str:
+        return f"<DocumentLink(file_id={self.file_id}, ref_id={self.ref_id}, qpid='{self.qpid}')>"
+
+    def to_dict(self) -> dict:
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    @classmethod
+    def replace_for_file(cls, qif_file, links):
+        """Replaces the links of qif_file with `links` (dicts keyed by COLUMNS)."""
+        db.session.execute(sa.delete(cls).where(cls.file_id == qif_file.id))
+        if links:
+            db.session.execute(
+                sa.insert(cls),
+                [
+                    dict({column: link.get(column) for column in cls.COLUMNS}, file_id=qif_file.id)
+                    for link in links
+                ],
+            )
+
+    @classmethod
+    def referencing(cls, qpid: str):
+        """(filename, ref_id, uri) of every link to the document with this QPId."""
+        return db.session.execute(
+            sa.select(QIFFile.filename, cls.ref_id, cls.uri)
+            .join(QIFFile)
+            .where(cls.qpid == qpid)
+            .order_by(QIFFile.filename, cls.ref_id)
+        ).all()
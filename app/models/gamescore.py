@@ -18,17 +18,32 @@ class GameScore(db.Model):
     def __repr__(self) -> str:
         return f"<GameScore(id={self.id}, name='{self.name}', score={self.score}, timestamp={self.timestamp})>"
 
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "score": self.score}
+
     @classmethod
     def add_game_score(cls, name: str, score: int):
-        """Adds a new game score to the database."""
-        new_score = cls(name=name, score=score)
-        db.session.add(new_score)
+        """Adds a new game score to the database. Returns it as a dict."""
+        return cls.add_game_scores([(name, score)])[0]
+
+    @classmethod
+    def add_game_scores(cls, scores):
+        """
+        Adds many (name, score) pairs in one transaction. Returns them as
+        dicts, ids included, in the order given.
+        """
+        new_scores = [cls(name=name, score=score) for name, score in scores]
+        db.session.add_all(new_scores)
+        db.session.flush()
+        # Read before commit expires them, or each would be reloaded one by one
+        added = [new_score.to_dict() for new_score in new_scores]
         db.session.commit()
+        return added
 
     @classmethod
     def get_high_scores(cls, limit: int = 10):
         """Fetches the top scores from the database."""
-        return db.session.query(cls).order_by(cls.score.desc()).limit(limit).all()
+        return db.session.query(cls).order_by(cls.score.desc(), cls.id).limit(limit).all()
 
     @classmethod
     def get_highest_score(cls):
@@ -49,4 +64,9 @@ class GameScore(db.Model):
     def delete_all_scores(cls):
         """Deletes all game scores from the database."""
         db.session.query(cls).delete()
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+
+# Matches get_high_scores()'s ORDER BY score DESC, id, so SQLite reads the top
+# rows straight off the index instead of sorting them in a temp B-tree.
+sa.Index("ix_game_scores_score_desc_id", GameScore.score.desc(), GameScore.id)
\ No newline at end of file
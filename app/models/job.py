@@ -0,0 +1,141 @@
+import json
+import uuid
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+
+    id: so.Mapped[str] = so.mapped_column(
+        sa.String(36), primary_key=True, default=lambda: uuid.uuid4().hex
+    )
+    kind: so.Mapped[str] = so.mapped_column(sa.String(32), nullable=False)
+    params: so.Mapped[str] = so.mapped_column(sa.Text, nullable=False, default="{}")
+    status: so.Mapped[str] = so.mapped_column(
+        sa.String(16), nullable=False, default="queued", index=True
+    )
+    progress: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False, default=0.0)
+    message: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    result: so.Mapped[str] = so.mapped_column(sa.Text, nullable=True)
+    error: so.Mapped[str] = so.mapped_column(sa.Text, nullable=True)
+    # "<host>:<pid>:<boot id>" of the process running the job
+    owner: so.Mapped[str] = so.mapped_column(sa.String(128), nullable=True, index=True)
+    # sha256 of kind, params and the content of the files they name; identical
+    # submissions reuse the job instead of redoing the work (see job_runner)
+    content_key: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True, index=True)
+    cancel_requested: so.Mapped[bool] = so.mapped_column(
+        sa.Boolean, nullable=False, default=False, server_default=sa.false()
+    )
+    created_at: so.Mapped[sa.DateTime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now(), nullable=False
+    )
+    updated_at: so.Mapped[sa.DateTime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now(), onupdate=sa.func.now(), nullable=False
+    )
+
+    FINISHED = ("done", "failed", "cancelled")
+
+    def __repr__(self) -> str:
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status}', progress={self.progress})>"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in self.FINISHED
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": json.loads(self.params or "{}"),
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    @classmethod
+    def create(cls, kind: str, params: dict, owner: str = None, content_key: str = None):
+        """Inserts a new queued job and returns it."""
+        job = cls(
+            kind=kind,
+            params=json.dumps(params),
+            status="queued",
+            owner=owner,
+            content_key=content_key,
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @classmethod
+    def update(cls, job_id: str, **fields):
+        """Updates columns on a job by ID. Returns False if it doesn't exist."""
+        job = db.session.get(cls, job_id)
+        if job is None:
+            return False
+        for key, value in fields.items():
+            setattr(job, key, value)
+        db.session.commit()
+        return True
+
+    @classmethod
+    def request_cancel(cls, job_id: str) -> bool:
+        """Flags an unfinished job for cancellation. Returns False if it already finished."""
+        updated = (
+            db.session.query(cls)
+            .filter(cls.id == job_id, cls.status.notin_(cls.FINISHED))
+            .update({cls.cancel_requested: True}, synchronize_session=False)
+        )
+        db.session.commit()
+        return bool(updated)
+
+    @classmethod
+    def is_cancel_requested(cls, job_id: str) -> bool:
+        """Reads the cancel flag straight from the table, bypassing the session's identity map."""
+        return bool(
+            db.session.query(cls.cancel_requested).filter(cls.id == job_id).scalar()
+        )
+
+    @classmethod
+    def get_unfinished(cls):
+        """Jobs that are queued or running, in any process."""
+        return db.session.query(cls).filter(cls.status.in_(("queued", "running"))).all()
+
+    @classmethod
+    def get_reusable(cls, content_key: str, since):
+        """
+        The newest job with this content_key that is done (finished after
+        `since`), queued or running, or None.
+        """
+        return (
+            db.session.query(cls)
+            .filter(
+                cls.content_key == content_key,
+                sa.or_(
+                    cls.status.in_(("queued", "running")),
+                    sa.and_(cls.status == "done", cls.updated_at >= since),
+                ),
+            )
+            .order_by(cls.created_at.desc())
+            .first()
+        )
+
+    @classmethod
+    def purge_finished(cls, before) -> int:
+        """Deletes finished jobs last updated before `before`. Returns how many."""
+        deleted = (
+            db.session.query(cls)
+            .filter(cls.status.in_(cls.FINISHED), cls.updated_at < before)
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+        return deleted
+
+    @classmethod
+    def get_recent(cls, limit: int = 20):
+        """Fetches the most recently created jobs."""
+        return db.session.query(cls).order_by(cls.created_at.desc()).limit(limit).all()
@@ -0,0 +1,76 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+from .qiffile import QIFFile
+
+
+class PipelineStage(db.Model):
+    """
+    Latest state of one processing stage (ingest, validation, audit...) of an
+    uploaded QIF file. Every change takes the next `seq`, so the status feed
+    can send clients only what changed since the last sequence they saw.
+    """
+
+    __tablename__ = "pipeline_stages"
+    __table_args__ = (sa.UniqueConstraint("file_id", "stage"),)
+
+    id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, primary_key=True, autoincrement=True
+    )
+    file_id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, sa.ForeignKey("qif_files.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    stage: so.Mapped[str] = so.mapped_column(sa.String(32), nullable=False)
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), nullable=False)
+    detail: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    seq: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False, index=True)
+    updated_at: so.Mapped[sa.DateTime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now(), onupdate=sa.func.now(), nullable=False
+    )
+
+    file = so.relationship("QIFFile", back_populates="pipeline_stages")
+
+    STATUSES = ("running", "done", "failed")
+
+    def __repr__(self) -> str:
+        return f"<PipelineStage(file_id={self.file_id}, stage='{self.stage}', status='{self.status}', seq={self.seq})>"
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "status": self.status,
+            "detail": self.detail,
+            "seq": self.seq,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    @classmethod
+    def latest_seq(cls) -> int:
+        return db.session.query(sa.func.coalesce(sa.func.max(cls.seq), 0)).scalar()
+
+    @classmethod
+    def record(cls, qif_file, stage: str, status: str, detail: str = None):
+        """Creates or updates the stage row of qif_file under a new seq and commits. Returns it."""
+        if status not in cls.STATUSES:
+            raise ValueError(f"Unknown pipeline status: {status}")
+        seq = cls.latest_seq() + 1
+        row = db.session.query(cls).filter_by(file_id=qif_file.id, stage=stage).first()
+        if row is None:
+            row = cls(file_id=qif_file.id, stage=stage)
+            db.session.add(row)
+        row.status = status
+        row.detail = detail[:255] if detail else None
+        row.seq = seq
+        db.session.commit()
+        return row
+
+    @classmethod
+    def changed_since(cls, seq: int = 0):
+        """(stage row, filename) pairs changed after seq, oldest change first."""
+        return (
+            db.session.query(cls, QIFFile.filename)
+            .join(QIFFile, QIFFile.id == cls.file_id)
+            .filter(cls.seq > seq)
+            .order_by(cls.seq)
+            .all()
+        )
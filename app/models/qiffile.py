@@ -0,0 +1,97 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+
+
+class QIFFile(db.Model):
+    """Catalogue entry for an uploaded QIF file, refreshed whenever its content changes."""
+
+    __tablename__ = "qif_files"
+
+    id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, primary_key=True, autoincrement=True
+    )
+    filename: so.Mapped[str] = so.mapped_column(
+        sa.String(255), nullable=False, unique=True, index=True
+    )
+    sha256: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False, index=True)
+    # sha256 of the canonical (C14N 2.0) form, equal for reformatted copies; see qifcanonical.
+    fingerprint: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True, index=True)
+    # QPId of the document, lower case; see DocumentLink for the documents it references.
+    qpid: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True, index=True)
+    size: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    characteristic_count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=0
+    )
+    # {top-level section: sha256} of the ingested revision, see qifsections.
+    section_hashes: so.Mapped[dict] = so.mapped_column(sa.JSON, nullable=True)
+    ingested_at: so.Mapped[sa.DateTime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now(), onupdate=sa.func.now(), nullable=False
+    )
+
+    characteristics = so.relationship(
+        "Characteristic",
+        back_populates="file",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    search_terms = so.relationship(
+        "SearchTerm",
+        back_populates="file",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    pipeline_stages = so.relationship(
+        "PipelineStage",
+        back_populates="file",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    document_links = so.relationship(
+        "DocumentLink",
+        back_populates="file",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    def __repr__(self) -> str:
+        return f"<QIFFile(id={self.id}, filename='{self.filename}', sha256='{self.sha256[:12]}')>"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "sha256": self.sha256,
+            "fingerprint": self.fingerprint,
+            "qpid": self.qpid,
+            "size": self.size,
+            "characteristic_count": self.characteristic_count,
+            "ingested_at": self.ingested_at.isoformat() if self.ingested_at else None,
+        }
+
+    @classmethod
+    def get_by_filename(cls, filename: str):
+        """Fetches the catalogue entry for an upload-relative filename."""
+        return db.session.query(cls).filter_by(filename=filename).first()
+
+    @classmethod
+    def get_by_sha256(cls, sha256: str):
+        """Fetches a catalogued file with this content, if any."""
+        return db.session.query(cls).filter_by(sha256=sha256).first()
+
+    @classmethod
+    def filenames_with_qpid(cls, qpid: str):
+        """Filenames of the catalogued documents with this QPId (copies and revisions share one)."""
+        return db.session.scalars(
+            sa.select(cls.filename).where(cls.qpid == qpid).order_by(cls.filename)
+        ).all()
+
+    @classmethod
+    def get_recent(cls, limit: int = 32):
+        """Fetches the most recently ingested files, newest first."""
+        return db.session.query(cls).order_by(cls.ingested_at.desc(), cls.id.desc()).limit(limit).all()
+
+    @classmethod
+    def get_all(cls):
+        """Fetches every catalogued file, by filename."""
+        return db.session.query(cls).order_by(cls.filename).all()
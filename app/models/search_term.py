@@ -0,0 +1,69 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+
+# Longest term stored; PMI text beyond this is not searchable.
+MAX_TERM_LENGTH = 1024
+
+
+class SearchTerm(db.Model):
+    """
+    One searchable string of an ingested QIF file: a characteristic or feature
+    name, an element id or a line of PMI text. On SQLite the table is mirrored
+    by the FTS5 index search_terms_fts (kept in sync by triggers, see the
+    migration) for word-prefix matching; term_key backs plain prefix lookups
+    everywhere else.
+    """
+
+    __tablename__ = "search_terms"
+    __table_args__ = (sa.Index("ix_search_terms_kind_term_key", "kind", "term_key"),)
+
+    id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, primary_key=True, autoincrement=True
+    )
+    file_id: so.Mapped[int] = so.mapped_column(
+        sa.Integer, sa.ForeignKey("qif_files.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    kind: so.Mapped[str] = so.mapped_column(sa.String(16), nullable=False)
+    term: so.Mapped[str] = so.mapped_column(sa.String(MAX_TERM_LENGTH), nullable=False)
+    term_key: so.Mapped[str] = so.mapped_column(
+        sa.String(MAX_TERM_LENGTH), nullable=False, index=True
+    )
+    element_id: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True)
+    tag: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=True)
+
+    file = so.relationship("QIFFile", back_populates="search_terms")
+
+    COLUMNS = ("kind", "term", "element_id", "tag")
+
+    def __repr__(self) -> str:
+        return f"<SearchTerm(id={self.id}, kind='{self.kind}', term='{self.term[:30]}')>"
+
+    @staticmethod
+    def key(term: str) -> str:
+        """Case-folded form stored in term_key and compared against prefixes."""
+        return term.casefold()[:MAX_TERM_LENGTH]
+
+    @classmethod
+    def replace_for_file(cls, qif_file, terms, kinds=None):
+        """
+        Replaces the terms of qif_file with `terms` (dicts keyed by COLUMNS) in
+        one bulk insert; only those of the given kinds when kinds is set.
+        """
+        query = sa.delete(cls).where(cls.file_id == qif_file.id)
+        if kinds is not None:
+            query = query.where(cls.kind.in_(kinds))
+        db.session.execute(query)
+        if terms:
+            db.session.execute(
+                sa.insert(cls),
+                [
+                    dict(
+                        {column: term.get(column) for column in cls.COLUMNS},
+                        term=term["term"][:MAX_TERM_LENGTH],
+                        term_key=cls.key(term["term"]),
+                        file_id=qif_file.id,
+                    )
+                    for term in terms
+                ],
+            )
@@ -1,3 +1,6 @@
-from .testing import testing_bp
+from .testing import testing_bp, calculator_stand_in_bp
 from .qif_tools import qif_bp
-from .digital_pipelines import digital_pipelines_bp
\ No newline at end of file
+from .digital_pipelines import digital_pipelines_bp
+from .metrics import metrics_bp
+from .profiling import profiling_bp
+from .warehouse import warehouse_bp
\ No newline at end of file
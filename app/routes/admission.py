@@ -0,0 +1,243 @@
+import os
+import time
+import threading
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests, ServiceUnavailable
+from .metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionGate:
+    """
+    Admission control for expensive endpoints.
+
+    A request is admitted when both hold:
+      - fewer than `limit` requests for the same key are in flight, and
+      - its estimated memory cost fits in what is left of the global budget.
+
+    Otherwise it waits in a bounded queue for up to `timeout` seconds. If the
+    queue is already full it gets a 429, and if it times out while waiting it
+    gets a 503. Both carry a Retry-After header. A single request that is larger
+    than the whole budget is still admitted, but only when nothing else is
+    running, so one huge file degrades to serial processing instead of failing.
+
+    Callers that pass timeout=None (background jobs, already queued by the job
+    runner) wait indefinitely. They are counted in `waiting`, not `queued`, so
+    they neither hit the queue cap nor use up the queue HTTP requests get.
+    """
+
+    # Longest single wait, so `check` runs regularly while blocked
+    WAIT_SLICE = 0.5
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.in_flight = Counter()
+        self.queued = Counter()
+        self.waiting = Counter()
+        self.admitted = Counter()
+        self.rejected = Counter()  # (key, status) -> count
+        self.memory_in_use = 0
+        self.memory_budget = 0
+
+    def _fits(self, key, cost, limit):
+        if self.in_flight[key] >= limit:
+            return False
+        if self.memory_in_use == 0:
+            return True
+        return self.memory_in_use + cost <= self.memory_budget
+
+    def reject(self, key, exc_cls, reason, retry_after):
+        """Counts a rejection for `key` and raises the matching HTTP error."""
+        self.rejected[(key, exc_cls.code)] += 1
+        logger.warning("Admission rejected %s (%s): %s", key, exc_cls.code, reason)
+        raise exc_cls(description=reason, retry_after=retry_after)
+
+    def acquire(
+        self, key, cost, limit, memory_budget, max_queue, timeout, retry_after, check=None
+    ):
+        """
+        Blocks until `key` may run. `check`, if given, is called between wait
+        slices of at most WAIT_SLICE seconds, without the gate's lock held;
+        raise from it to give up waiting (e.g. when a job is cancelled).
+        """
+        with self._cond:
+            self.memory_budget = memory_budget
+            if not self._fits(key, cost, limit):
+                unbounded = timeout is None
+                if not unbounded and (
+                    timeout == 0 or sum(self.queued.values()) >= max_queue
+                ):
+                    self.reject(
+                        key, TooManyRequests, "Server is busy, try again later.", retry_after
+                    )
+                waiters = self.waiting if unbounded else self.queued
+                waiters[key] += 1
+                deadline = None if unbounded else time.monotonic() + timeout
+                try:
+                    while not self._fits(key, cost, limit):
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.reject(
+                                key,
+                                ServiceUnavailable,
+                                "Timed out waiting for capacity, try again later.",
+                                retry_after,
+                            )
+                        if check is not None:
+                            # check may hit the database; don't hold up every
+                            # other acquire/release/stats meanwhile.
+                            self._cond.release()
+                            try:
+                                check()
+                            finally:
+                                self._cond.acquire()
+                            remaining = min(remaining or self.WAIT_SLICE, self.WAIT_SLICE)
+                        self._cond.wait(remaining)
+                finally:
+                    waiters[key] -= 1
+            self.in_flight[key] += 1
+            self.memory_in_use += cost
+            self.admitted[key] += 1
+
+    def release(self, key, cost):
+        with self._cond:
+            self.in_flight[key] -= 1
+            self.memory_in_use -= cost
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, key, cost, timeout=-1, check=None):
+        """
+        Context manager around acquire/release using the app's ADMISSION_* config.
+        timeout=-1 means ADMISSION_QUEUE_TIMEOUT, None means wait indefinitely.
+        """
+        cfg = current_app.config
+        if timeout == -1:
+            timeout = cfg.get("ADMISSION_QUEUE_TIMEOUT", 10)
+        limit = cfg.get("ADMISSION_CONCURRENCY", {}).get(
+            key, cfg.get("ADMISSION_DEFAULT_CONCURRENCY", 4)
+        )
+        self.acquire(
+            key,
+            cost,
+            limit,
+            cfg.get("ADMISSION_MEMORY_BUDGET", 1024 * 1024 * 1024),
+            cfg.get("ADMISSION_MAX_QUEUE", 16),
+            timeout,
+            cfg.get("ADMISSION_RETRY_AFTER", 5),
+            check,
+        )
+        try:
+            yield
+        finally:
+            self.release(key, cost)
+
+    def stats(self):
+        with self._cond:
+            keys = set(self.in_flight) | set(self.queued) | set(self.waiting)
+            keys |= set(self.admitted)
+            keys |= {key for key, _ in self.rejected}
+            return {
+                "memory_in_use": self.memory_in_use,
+                "memory_budget": self.memory_budget,
+                "queue_depth": sum(self.queued.values()),
+                "jobs_waiting": sum(self.waiting.values()),
+                "endpoints": {
+                    key: {
+                        "in_flight": self.in_flight[key],
+                        "queued": self.queued[key],
+                        "waiting": self.waiting[key],
+                        "admitted": self.admitted[key],
+                        "rejected_429": self.rejected[(key, 429)],
+                        "rejected_503": self.rejected[(key, 503)],
+                    }
+                    for key in sorted(keys)
+                },
+            }
+
+
+admission_gate = AdmissionGate()
+
+
+@register_collector
+def _admission_metrics():
+    stats = admission_gate.stats()
+    endpoints = stats["endpoints"]
+    yield (
+        "qif_admission_queue_depth",
+        "gauge",
+        "Requests waiting for admission, across all endpoints.",
+        [({}, stats["queue_depth"])],
+    )
+    yield (
+        "qif_admission_memory_in_use_bytes",
+        "gauge",
+        "Estimated working memory of admitted requests.",
+        [({}, stats["memory_in_use"])],
+    )
+    yield (
+        "qif_admission_in_flight",
+        "gauge",
+        "Admitted requests currently running.",
+        [({"endpoint": key}, e["in_flight"]) for key, e in endpoints.items()],
+    )
+    yield (
+        "qif_admission_rejected_total",
+        "counter",
+        "Requests rejected by admission control.",
+        [
+            ({"endpoint": key, "status": str(code)}, e[f"rejected_{code}"])
+            for key, e in endpoints.items()
+            for code in (429, 503)
+        ],
+    )
+
+
+def estimate_cost(key, filenames):
+    """
+    Estimates peak memory for processing `filenames` under `key`: file size times
+    the key's ADMISSION_COST_FACTORS multiplier (lxml tree plus whatever copies
+    the operation makes, e.g. the nested dict and JSON for dictxml).
+    """
+    cfg = current_app.config
+    factor = cfg.get("ADMISSION_COST_FACTORS", {}).get(
+        key, cfg.get("ADMISSION_DEFAULT_COST_FACTOR", 10)
+    )
+    upload_folder = cfg["UPLOAD_FOLDER"]
+    total = 0
+    for filename in filenames:
+        if not filename:
+            continue
+        try:
+            total += os.path.getsize(os.path.join(upload_folder, filename))
+        except OSError:
+            pass
+    return total * factor
+
+
+def admission_controlled(files=None):
+    """
+    Decorator for expensive views. The admission key is the request endpoint.
+
+    Args:
+        files (callable, optional): (view kwargs) -> list of upload-relative
+            filenames used for the cost estimate. Defaults to the "filename"
+            URL argument.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.endpoint
+            filenames = files(kwargs) if files else [kwargs.get("filename")]
+            with admission_gate.admit(key, estimate_cost(key, filenames)):
+                return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -5,11 +5,108 @@ from flask import (
     render_template,
     jsonify,
     request,
-    abort
+    abort,
+    current_app,
+    Response,
+    stream_with_context,
+    make_response,
 )
+from .qif_tools import load_reference_graph
+from .pipeline_status import status_feed, status_stream, stream_slots
+from .pipeline_layout import layout_graph, pipeline_layout
 
 digital_pipelines_bp = Blueprint("digital_pipelines", __name__)
 
 @digital_pipelines_bp.route("/")
 def test():
     return render_template("digital_pipelines/digital_pipelines.html", title="Digital Pipelines")
+
+
+@digital_pipelines_bp.route("/layout")
+def layout():
+    """
+    The pipeline graph (tool chain plus one node per catalogued file) with
+    every node positioned, as fractions of the canvas size. Computed once per
+    graph version, which is also the ETag, so open dashboards revalidate with
+    a 304 until a file or stage changes.
+    """
+    version, graph = pipeline_layout(
+        current_app.config["PIPELINE_STAGE_NODES"],
+        current_app.config["PIPELINE_REFRESH_INTERVAL"],
+    )
+    if request.if_none_match.contains(version):
+        response = make_response("", 304)
+    else:
+        response = jsonify(dict(graph, version=version))
+    response.set_etag(version)
+    response.cache_control.no_cache = True
+    return response
+
+
+@digital_pipelines_bp.route("/status")
+def status():
+    """
+    Every catalogued file's journey through the pipeline, from the stages
+    recorded by ingestion, validation and audit:
+
+        {"seq": N, "statuses": {filename: {"success_journey": [node ids], ...}}}
+
+    Pass ?since=N to get only the files whose stages changed after seq N.
+    """
+    max_age = current_app.config["PIPELINE_REFRESH_INTERVAL"]
+    since = request.args.get("since", type=int)
+    if since is None:
+        seq, statuses = status_feed.snapshot(max_age)
+    else:
+        seq, statuses = status_feed.changes(since, 0, max_age)
+    return jsonify({"seq": seq, "statuses": statuses})
+
+
+@digital_pipelines_bp.route("/status/stream")
+def status_events():
+    """
+    Server-Sent Events feed of the same statuses: a "snapshot" event, then a
+    "status" event with the changed files whenever a stage is recorded.
+    Reconnecting browsers send Last-Event-ID and only get what they missed.
+
+    Each stream holds a worker thread, so past PIPELINE_MAX_STREAMS per worker
+    this answers 503 and the page falls back to polling /status?since=.
+    """
+    if not stream_slots.try_acquire(current_app.config["PIPELINE_MAX_STREAMS"]):
+        interval = current_app.config["PIPELINE_POLL_INTERVAL"]
+        response = jsonify({"error": "Too many open status streams, poll instead."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(interval)
+        return response
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    response = Response(
+        stream_with_context(status_stream(last_event_id)), mimetype="text/event-stream"
+    )
+    response.call_on_close(stream_slots.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    return response
+
+
+@digital_pipelines_bp.route("/qif/<path:filename>")
+def qif_graph(filename):
+    """The file's reference graph (or one element's neighbourhood with ?id=) in the pipeline tree view."""
+    element_id = request.args.get("id", type=int)
+    graph = load_reference_graph(filename).export_tree(
+        element_id,
+        depth=request.args.get("depth", 2, type=int),
+        max_nodes=min(request.args.get("max_nodes", 60, type=int), 1000),
+    )
+    if graph is None:
+        abort(404, f"No element with id {element_id} in {filename}")
+    graph = dict(
+        layout_graph(graph["zones"], graph["nodes"], graph["connections"]),
+        truncated=graph.get("truncated", False),
+    )
+    return render_template(
+        "digital_pipelines/reference_graph.html",
+        title=f"{filename} references",
+        filename=filename,
+        element_id=element_id,
+        graph=graph,
+    )
@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import datetime
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.exceptions import HTTPException, TooManyRequests
+from werkzeug.security import safe_join
+from app.models import Job
+from .admission import admission_gate, estimate_cost
+from .response_cache import file_digest
+from .profiling import is_profiling
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised from inside a job's progress callback once cancellation is requested."""
+
+
+class JobKind:
+    """A registered background operation: the callable plus how to render its result."""
+
+    def __init__(self, name, func, template=None, context=None, files=None, reuse=False):
+        self.name = name
+        self.func = func
+        self.template = template
+        self.context = context or (lambda params, result: {"result": result})
+        self.files = files or (lambda params: [params.get("filename")])
+        self.reuse = reuse
+
+
+_kinds = {}
+# job_id -> threading.Event for the jobs this process runs. Only a fast path:
+# cancellation is recorded in the jobs table, which every worker polls.
+_cancel_flags = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+# Identifies this process in Job.owner. The boot id tells a restarted worker
+# that happens to get a dead worker's pid apart from it, so it is drawn per
+# process: workers forked from a preloaded master must not share its value.
+_HOSTNAME = socket.gethostname()
+_boot = (None, None)  # (pid, boot id)
+
+
+def _boot_id():
+    global _boot
+    pid, boot_id = _boot
+    if pid != os.getpid():
+        _boot = (os.getpid(), uuid.uuid4().hex[:12])
+    return _boot[1]
+
+
+def process_owner():
+    """The Job.owner value for jobs submitted by this process."""
+    return f"{_HOSTNAME}:{os.getpid()}:{_boot_id()}"
+
+
+def owner_alive(owner):
+    """
+    True if the process named by a Job.owner may still be running the job.
+    Owners on other hosts can't be checked from here and count as alive.
+    """
+    try:
+        host, pid, boot_id = owner.rsplit(":", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False  # rows from before owners were recorded
+    if host != _HOSTNAME:
+        return True
+    if pid == os.getpid():
+        return boot_id == _boot_id()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def _utcnow():
+    # updated_at is stored by the database as naive UTC
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def purge_finished_jobs(retention):
+    """Deletes finished jobs, results included, older than `retention` seconds. Returns how many."""
+    purged = Job.purge_finished(_utcnow() - datetime.timedelta(seconds=retention))
+    if purged:
+        logger.info("Purged %d finished job(s)", purged)
+    return purged
+
+
+_last_housekeeping = 0.0
+
+
+def _housekeeping(app):
+    """reap_orphaned_jobs() plus the JOB_RETENTION purge, at most every JOB_HOUSEKEEPING_INTERVAL."""
+    global _last_housekeeping
+    now = time.monotonic()
+    if _last_housekeeping and now - _last_housekeeping < app.config.get(
+        "JOB_HOUSEKEEPING_INTERVAL", 600
+    ):
+        return
+    _last_housekeeping = now
+    reap_orphaned_jobs()
+    purge_finished_jobs(app.config.get("JOB_RETENTION", 24 * 3600))
+
+
+def reap_orphaned_jobs():
+    """
+    Fails queued/running jobs whose owning process is gone, so clients don't
+    poll them forever. Jobs of other live workers are left alone.
+    """
+    reaped = 0
+    for job in Job.get_unfinished():
+        if not owner_alive(job.owner):
+            job.status = "failed"
+            job.error = "Interrupted by server restart."
+            reaped += 1
+    if reaped:
+        Job.query.session.commit()
+        logger.info("Marked %d orphaned job(s) as failed", reaped)
+    return reaped
+
+
+def job_kind(name, template=None, context=None, files=None, reuse=False):
+    """
+    Registers func(params, progress) -> JSON-serialisable result as a job kind.
+
+    Args:
+        name (str): The kind used in POST /qif/jobs.
+        template (str, optional): Template used by the job view once the job is done.
+        context (callable, optional): (params, result) -> template kwargs.
+        files (callable, optional): params -> upload filenames, for admission cost.
+            Defaults to params["filename"].
+        reuse (bool): The result depends only on params and the content of those
+            files, so an identical submission gets the pending job, or the done
+            one within JOB_RETENTION, instead of a new one.
+    """
+
+    def decorator(func):
+        _kinds[name] = JobKind(name, func, template, context, files, reuse)
+        return func
+
+    return decorator
+
+
+def get_kind(name):
+    return _kinds.get(name)
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get("JOB_WORKERS", 2),
+                thread_name_prefix="qif-job",
+            )
+        return _executor
+
+
+class _ProgressReporter:
+    """
+    The progress callback handed to QIFSummary. Checks the local cancel event on
+    every call, but only touches the database (progress write, cancel_requested
+    poll for cancels made by other workers) every JOB_PROGRESS_INTERVAL seconds
+    so tight loops don't turn into a stream of SQLite queries.
+    """
+
+    def __init__(self, job_id, cancel_event, interval):
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.interval = interval
+        self._last_write = 0.0
+        self._last_poll = 0.0
+
+    def cancelled(self):
+        """True once cancellation was requested, from this process or any other."""
+        if self.cancel_event.is_set():
+            return True
+        now = time.monotonic()
+        if now - self._last_poll >= self.interval:
+            self._last_poll = now
+            if Job.is_cancel_requested(self.job_id):
+                self.cancel_event.set()
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raises JobCancelled once cancellation was requested."""
+        if self.cancelled():
+            raise JobCancelled()
+
+    def __call__(self, stage, done=None, total=None):
+        self.check_cancelled()
+        now = time.monotonic()
+        if now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        fields = {"message": stage if total is None else f"{stage} {done}/{total}"}
+        if total:
+            fields["progress"] = min(float(done or 0) / total, 1.0)
+        Job.update(self.job_id, **fields)
+
+
+def _run_job(app, job_id, kind, params, cancel_event):
+    with app.app_context():
+        try:
+            reporter = _ProgressReporter(
+                job_id, cancel_event, app.config.get("JOB_PROGRESS_INTERVAL", 0.5)
+            )
+            if reporter.cancelled():
+                Job.update(job_id, status="cancelled", message="cancelled")
+                return
+            job_kind = _kinds[kind]
+            key = f"job.{kind}"
+            Job.update(job_id, status="running", message="waiting for capacity")
+            # Jobs are already queued, so they wait for memory indefinitely
+            # rather than being rejected, but still notice a cancel meanwhile.
+            with admission_gate.admit(
+                key,
+                estimate_cost(key, job_kind.files(params)),
+                timeout=None,
+                check=reporter.check_cancelled,
+            ):
+                reporter.check_cancelled()
+                Job.update(job_id, message="starting")
+                result = job_kind.func(params, reporter)
+            Job.update(
+                job_id,
+                status="done",
+                progress=1.0,
+                message="done",
+                result=json.dumps(result, default=str),
+            )
+        except JobCancelled:
+            logger.info("Job %s cancelled", job_id)
+            Job.update(job_id, status="cancelled", message="cancelled")
+        except HTTPException as e:
+            Job.update(job_id, status="failed", message="failed", error=e.description)
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job_id, kind)
+            Job.update(job_id, status="failed", message="failed", error=str(e))
+        finally:
+            _cancel_flags.pop(job_id, None)
+
+
+def _content_key(app, kind, params):
+    """
+    sha256 of the kind, params, app version and content of the files the job
+    reads, or None if a file is missing or the kind names none.
+    """
+    filenames = [f for f in _kinds[kind].files(params) if f]
+    if not filenames:
+        return None
+    digests = []
+    for filename in filenames:
+        path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        digests.append(file_digest(path))
+    key = json.dumps(
+        [kind, params, digests, app.config.get("APP_VERSION")], sort_keys=True, default=str
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def submit_job(kind, params):
+    """
+    Creates the Job row and schedules it on the worker pool. Returns the Job,
+    or for kinds registered with reuse the existing job for the same request.
+    A profiled request runs the job inline instead.
+    """
+    if kind not in _kinds:
+        raise ValueError(f"Unknown job kind: {kind}")
+    app = current_app._get_current_object()
+    executor = _get_executor(app)
+    _housekeeping(app)
+    # A profiled request must do the work itself, so it neither reuses a job
+    # nor hands off to the pool (see below).
+    profiled = is_profiling()
+    content_key = (
+        _content_key(app, kind, params) if _kinds[kind].reuse and not profiled else None
+    )
+    if content_key is not None:
+        since = _utcnow() - datetime.timedelta(seconds=app.config.get("JOB_RETENTION", 24 * 3600))
+        job = Job.get_reusable(content_key, since)
+        if job is not None and (job.status == "done" or owner_alive(job.owner)):
+            logger.debug("Reusing job %s (%s) for %s", job.id, kind, params)
+            return job
+    if len(_cancel_flags) >= app.config.get("JOB_MAX_PENDING", 32):
+        admission_gate.reject(
+            "jobs.submit",
+            TooManyRequests,
+            "Too many pending jobs, try again later.",
+            app.config.get("ADMISSION_RETRY_AFTER", 5),
+        )
+    job = Job.create(kind, params, owner=process_owner(), content_key=content_key)
+    cancel_event = threading.Event()
+    _cancel_flags[job.id] = cancel_event
+    if profiled:
+        # cProfile only sees this thread: run the job here so the report covers
+        # the work and not just the submission. The job is done on return.
+        logger.debug("Running job %s (%s) in the profiled request", job.id, kind)
+        _run_job(app, job.id, kind, params, cancel_event)
+        return job
+    executor.submit(_run_job, app, job.id, kind, params, cancel_event)
+    logger.debug("Submitted job %s (%s): %s", job.id, kind, params)
+    return job
+
+
+def pending_jobs():
+    """Number of jobs queued or running in this process."""
+    return len(_cancel_flags)
+
+
+def cancel_job(job_id):
+    """
+    Requests cancellation through the jobs table, so it reaches the job whichever
+    worker runs it. Queued jobs never start; running jobs stop at the next
+    progress report. Returns False if the job is unknown or already finished.
+    """
+    if not Job.request_cancel(job_id):
+        return False
+    cancel_event = _cancel_flags.get(job_id)
+    if cancel_event is not None:
+        cancel_event.set()
+    return True
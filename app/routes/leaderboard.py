@@ -0,0 +1,56 @@
+import time
+import bisect
+import threading
+from app.models import GameScore
+
+
+class Leaderboard:
+    """
+    The top `size` game scores, held in memory so the testing page doesn't
+    sort game_scores on every render. Scores added through add() are merged
+    in place; the board is reloaded from the database (one indexed query)
+    when it is older than max_age seconds, which picks up scores added or
+    deleted by other processes.
+    """
+
+    def __init__(self):
+        self.size = None
+        self._entries = []  # sorted (-score, id, name), best first
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, size):
+        self._entries = [(-s.score, s.id, s.name) for s in GameScore.get_high_scores(limit=size)]
+        self.size = size
+        self._loaded_at = time.monotonic()
+
+    def top(self, limit, size, max_age):
+        """[{"name", "score"}] of the best `limit` scores (at most size)."""
+        limit = min(limit, size)
+        with self._lock:
+            if (
+                self._loaded_at is None
+                or self.size != size
+                or time.monotonic() - self._loaded_at > max_age
+            ):
+                self._load(size)
+            return [{"name": name, "score": -neg} for neg, _, name in self._entries[:limit]]
+
+    def add(self, scores):
+        """Merges newly committed score dicts ({"id", "name", "score"}) into the board."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for score in scores:
+                entry = (-score["score"], score["id"], score["name"])
+                if len(self._entries) >= self.size and entry >= self._entries[-1]:
+                    continue
+                bisect.insort(self._entries, entry)
+                del self._entries[self.size:]
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+leaderboard = Leaderboard()
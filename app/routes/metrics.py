@@ -0,0 +1,203 @@
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from flask import Blueprint, Response, g, request, has_request_context
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint("metrics", __name__)
+
+DEBUG_TIMINGS_HEADER = "X-Debug-Timings"
+
+# Latency buckets in seconds, roughly log-spaced from 1 ms to 2 minutes.
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    labels = key + (("le", repr(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(labels)} {count}")
+                labels = key + (("le", "+Inf"),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {entry[-1]}")
+        return lines
+
+
+_metrics = []
+_collectors = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(func):
+    """
+    Registers func() -> iterable of (name, type, help, [(labels_dict, value), ...]),
+    evaluated at scrape time. Used for state that already lives elsewhere
+    (cache stats, admission counters).
+    """
+    _collectors.append(func)
+    return func
+
+
+stage_duration = register(
+    Histogram(
+        "qif_stage_duration_seconds",
+        "Time spent in each QIFSummary processing stage.",
+        ("stage",),
+    )
+)
+request_duration = register(
+    Histogram(
+        "qif_http_request_duration_seconds",
+        "HTTP request latency by endpoint.",
+        ("endpoint", "method", "status"),
+    )
+)
+cache_requests = register(
+    Counter(
+        "qif_response_cache_requests_total",
+        "Per-file view cache lookups by outcome (etag_304, hit, miss).",
+        ("endpoint", "result"),
+    )
+)
+
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Times a block as `stage`: observed in qif_stage_duration_seconds and, inside a
+    request, accumulated into g.stage_timings for the debug header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage)
+        if has_request_context():
+            timings = g.setdefault("stage_timings", {})
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def render_prometheus():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            logger.error("Metrics collector %s failed: %s", collector.__name__, e)
+            continue
+        for name, metric_type, documentation, values in samples:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in values:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@metrics_bp.before_app_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def _record_request(response):
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    request_duration.observe(
+        elapsed,
+        endpoint=request.endpoint or "unknown",
+        method=request.method,
+        status=response.status_code,
+    )
+
+    if request.headers.get(DEBUG_TIMINGS_HEADER):
+        timings = dict(g.get("stage_timings", {}))
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name.replace(' ', '_')};dur={seconds * 1000:.2f}"
+            for name, seconds in timings.items()
+        )
+        if response.is_json and not response.direct_passthrough:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                data["_timings"] = timings
+                response.set_data(json.dumps(data))
+                # The body is no longer the representation the ETag names.
+                response.headers.pop("ETag", None)
+                response.headers.pop("Last-Modified", None)
+                response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """Prometheus text exposition of stage timings, route latency and cache/admission state."""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
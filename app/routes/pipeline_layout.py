@@ -0,0 +1,306 @@
+import threading
+import logging
+from collections import OrderedDict
+from .pipeline_status import CATALOGUED_STAGES, status_feed
+
+logger = logging.getLogger(__name__)
+
+# The tool chain drawn on /digital_pipelines (formerly static/js/digital_pipelines/tree.js).
+PIPELINE_ZONES = [
+    {"name": "3D Experience (Design Engineer)"},
+    {"name": "3D Experience (PMI/DX Engineer)"},
+    {"name": "MBDVidia (DX Validation)"},
+    {"name": "Calypso & KOTEM (Quality Engineering)"},
+]
+PIPELINE_NODES = {
+    # Zone 1 nodes
+    1: {"id": 1, "title": "3D Experience", "type": "Software", "PMI": False, "proprietary": True, "zone": 1, "version": "2022 hotfix9", "failure_mode": False},
+    2: {"id": 2, "title": "3dxml", "type": "File Package", "PMI": False, "proprietary": True, "zone": 1, "failure_mode": False, "components": [".3Dxml", ".CATProduct"]},
+    # Zone 2 nodes
+    3: {"id": 3, "title": "3D Experience", "type": "Software", "PMI": False, "proprietary": True, "zone": 2, "version": "2025 hotfix1.1", "failure_mode": False},
+    4: {"id": 4, "title": "3dxml", "type": "File Format", "PMI": True, "proprietary": True, "zone": 2, "failure_mode": False},
+    5: {"id": 5, "title": ".CATProduct", "type": "File Format", "PMI": True, "proprietary": True, "zone": 2, "failure_mode": False, "version": "CATIA v5 r2016"},
+    6: {"id": 6, "title": "STEP242", "type": "File Format", "PMI": True, "proprietary": False, "zone": 2, "version": "ed3", "failure_mode": False},
+    # Zone 3 nodes
+    7: {"id": 7, "title": "Unsupported", "type": "File Format", "PMI": False, "proprietary": False, "zone": 3, "failure_mode": True},
+    8: {"id": 8, "title": ".CATProduct", "type": "File Format", "PMI": True, "proprietary": True, "zone": 3, "failure_mode": False},
+    9: {"id": 9, "title": "STEP242", "type": "File Format", "PMI": True, "proprietary": False, "zone": 3, "failure_mode": False},
+    10: {"id": 10, "title": "QIF", "type": "File Format", "PMI": True, "proprietary": False, "zone": 3, "failure_mode": False, "version": "+ Dimensions"},
+    11: {"id": 11, "title": "QIF", "type": "File Format", "PMI": True, "proprietary": False, "zone": 3, "failure_mode": False, "version": "+ Dimensions"},
+    # Zone 4 nodes
+    12: {"id": 12, "title": "Kotem", "type": "Software", "PMI": False, "proprietary": True, "zone": 4, "failure_mode": False},
+    13: {"id": 13, "title": "Calypso", "type": "Software", "PMI": False, "proprietary": True, "zone": 4, "failure_mode": False},
+    14: {"id": 14, "title": "Inspection Data", "type": "File Package", "PMI": True, "proprietary": True, "zone": 4, "components": ["QIF + Measurement Plan", "Point Cloud"], "failure_mode": False},
+}
+PIPELINE_CONNECTIONS = [
+    # Zone 1 connections
+    {"from": 1, "to": 2, "type": "strong"},
+    {"from": 2, "to": 3, "type": "strong"},
+    # Zone 2 connections
+    {"from": 3, "to": 6, "type": "strong"},
+    {"from": 3, "to": 4, "type": "weak"},
+    {"from": 3, "to": 5, "type": "weak"},
+    {"from": 4, "to": 7, "type": "weak"},
+    {"from": 5, "to": 8, "type": "weak"},
+    {"from": 6, "to": 9, "type": "strong"},
+    # Zone 3 connections
+    {"from": 8, "to": 10, "type": "weak"},
+    {"from": 9, "to": 11, "type": "strong"},
+    # Cross-zone connections from Zone 3 to Zone 4
+    {"from": 11, "to": 13, "type": "strong"},
+    {"from": 10, "to": 13, "type": "weak"},
+    {"from": 13, "to": 14, "type": "strong"},
+    {"from": 14, "to": 12, "type": "strong"},
+]
+
+# Geometry, as fractions of the canvas width (x) or height (y).
+BOX_WIDTH = 0.1
+BOX_HEIGHT = 0.05
+ZONE_PADDING = 0.02
+ZONE_START = 0.01
+MARGIN = 0.05
+LEVEL_SPACING = 0.08
+ZONE_TOP_MARGIN = 0.04
+NODE_BOTTOM_MARGIN = 0.02
+GRID_GAP = 0.01
+
+# Leaf children weigh less than subtrees when a node's width is shared out.
+LEAF_WEIGHT = 1
+NON_LEAF_WEIGHT = 3
+
+
+class _Node:
+    __slots__ = ("id", "zone", "gridded", "parent", "children", "depth", "level", "x", "y")
+
+    def __init__(self, node_id, zone, gridded=False):
+        self.id = node_id
+        self.zone = zone
+        self.gridded = gridded  # placed by _layout_grid, not by its parent
+        self.parent = None  # the first node connecting to it
+        self.children = []
+        self.depth = None
+        self.level = 0
+        self.x = 0.0
+        self.y = 0.0
+
+
+def _link(nodes, connections):
+    for conn in connections:
+        parent, child = nodes.get(conn["from"]), nodes.get(conn["to"])
+        if parent is None or child is None:
+            continue
+        if child.parent is None:
+            child.parent = parent
+        parent.children.append(child)
+
+
+def _zone_levels(nodes):
+    """Depth below the topmost node of each zone, pushed down so no child sits level with its parent."""
+    for node in nodes.values():
+        chain = []
+        current = node
+        # Walk up to the first node with a known depth; a cycle counts as a root.
+        while current is not None and current.depth is None and current not in chain:
+            chain.append(current)
+            current = current.parent
+        depth = current.depth if current is not None and current.depth is not None else -1
+        for n in reversed(chain):
+            depth += 1
+            n.depth = depth
+
+    min_depth = {}
+    for node in nodes.values():
+        min_depth[node.zone] = min(min_depth.get(node.zone, node.depth), node.depth)
+    for node in nodes.values():
+        node.level = node.depth - min_depth[node.zone]
+
+    # Children in their parent's zone go at least one level below it. Bounded,
+    # as a cycle would otherwise push levels down forever.
+    for _ in range(len(nodes)):
+        moved = False
+        for node in nodes.values():
+            for child in node.children:
+                if child.zone == node.zone and child.level <= node.level:
+                    child.level = node.level + 1
+                    moved = True
+        if not moved:
+            break
+
+    # A node whose parent is in another zone starts its own zone at the top.
+    for node in nodes.values():
+        if node.parent is not None and node.parent.zone != node.zone:
+            node.level = 0
+            _cascade_levels(node, {node})
+
+
+def _cascade_levels(node, seen):
+    for child in node.children:
+        if child.zone == node.zone and child not in seen:
+            seen.add(child)
+            child.level = node.level + 1
+            _cascade_levels(child, seen)
+
+
+def _weight(node):
+    return NON_LEAF_WEIGHT if any(not c.gridded for c in node.children) else LEAF_WEIGHT
+
+
+def _layout_tree(node, min_x, max_x, on_path):
+    """Centres leaves in their slot and parents over their children, sharing the slot out by weight."""
+    on_path = on_path | {node}
+    children = [c for c in node.children if c not in on_path and not c.gridded]
+    if not children:
+        node.x = (min_x + max_x) / 2
+    else:
+        _share_out(children, min_x, max_x, on_path)
+        node.x = sum(child.x for child in children) / len(children)
+    node.y = node.level * LEVEL_SPACING
+
+
+def _share_out(nodes, min_x, max_x, on_path=frozenset()):
+    total = sum(_weight(n) for n in nodes)
+    cumulative = 0
+    for n in nodes:
+        weight = _weight(n)
+        cumulative += weight
+        centre = min_x + (max_x - min_x) * ((cumulative - weight / 2) / total)
+        half = (max_x - min_x) * (weight / total) / 2
+        _layout_tree(n, centre - half, centre + half, on_path)
+
+
+def _layout_grid(nodes):
+    """Rows of boxes across the full width, in the given order."""
+    columns = max(1, int((1 - 2 * MARGIN + GRID_GAP) // (BOX_WIDTH + GRID_GAP)))
+    for i, node in enumerate(nodes):
+        row, column = divmod(i, columns)
+        node.x = MARGIN + column * (BOX_WIDTH + GRID_GAP)
+        node.y = row * (BOX_HEIGHT + NODE_BOTTOM_MARGIN)
+
+
+def layout_graph(zones, nodes, connections, grid_zones=()):
+    """
+    Positions a {zones, nodes, connections} graph (as drawn by
+    static/js/digital_pipelines/app.js): zones stacked top to bottom, each
+    zone's trees laid out by level, zones in grid_zones (1-based) as rows of
+    boxes instead. x is a fraction of the canvas width, y of its height.
+
+    Returns {"zones": [{name, yStart, yEnd}], "nodes": {id: node + x, y},
+    "connections", "box": {"width", "height"}, "height"}; height is where the
+    last zone ends, and may exceed 1. Node ids become strings, as they would
+    as JSON object keys anyway.
+    """
+    laid = {
+        node_id: _Node(node_id, node.get("zone"), node.get("zone") in grid_zones)
+        for node_id, node in nodes.items()
+    }
+    _link(laid, connections)
+    _zone_levels(laid)
+
+    targets = {conn["to"] for conn in connections}
+    roots_by_zone = {}
+    for node in laid.values():
+        if node.id not in targets:
+            roots_by_zone.setdefault(node.zone, []).append(node)
+    for zone in range(1, len(zones) + 1):
+        if zone in grid_zones:
+            _layout_grid([n for n in laid.values() if n.zone == zone])
+        elif zone in roots_by_zone:
+            _share_out(roots_by_zone[zone], MARGIN, 1 - MARGIN)
+
+    positioned_zones = []
+    y = ZONE_START
+    for zone_number, zone in enumerate(zones, start=1):
+        members = [n for n in laid.values() if n.zone == zone_number]
+        if not members:
+            y_end = y + BOX_HEIGHT + ZONE_PADDING
+        else:
+            offset = y + ZONE_TOP_MARGIN - min(n.y for n in members)
+            for n in members:
+                n.y += offset
+            y_end = max(n.y for n in members) + BOX_HEIGHT + NODE_BOTTOM_MARGIN
+        positioned_zones.append(dict(zone, yStart=round(y, 5), yEnd=round(y_end, 5)))
+        y = y_end + ZONE_PADDING
+
+    return {
+        "zones": positioned_zones,
+        "nodes": {
+            str(node_id): dict(node, x=round(laid[node_id].x, 5), y=round(laid[node_id].y, 5))
+            for node_id, node in nodes.items()
+        },
+        "connections": connections,
+        "box": {"width": BOX_WIDTH, "height": BOX_HEIGHT},
+        "height": round(y, 5),
+    }
+
+
+def pipeline_graph(statuses, stage_nodes):
+    """
+    The tool chain plus a zone with one node per catalogued file, connected
+    from the last node its furthest recorded stage reached (or failed at).
+    """
+    zones = PIPELINE_ZONES + [{"name": f"Uploaded files ({len(statuses)})"}]
+    file_zone = len(zones)
+    nodes = dict(PIPELINE_NODES)
+    connections = list(PIPELINE_CONNECTIONS)
+    by_attachment = []
+    for filename, status in statuses.items():
+        attach, last_stage, last_status = 0, None, None
+        for stage, stage_ids in stage_nodes.items():
+            state = status["stages"].get(stage, {}).get("status") or CATALOGUED_STAGES.get(stage)
+            if state and stage_ids:
+                attach, last_stage, last_status = stage_ids[-1], stage, state
+        by_attachment.append((attach, filename, last_stage, last_status))
+    # Files reaching the same node sit next to each other.
+    by_attachment.sort()
+    for attach, filename, last_stage, last_status in by_attachment:
+        node_id = f"file:{filename}"
+        nodes[node_id] = {
+            "id": node_id,
+            "title": filename,
+            "type": "File",
+            "version": f"{last_stage}: {last_status}" if last_stage else None,
+            "PMI": False,
+            "proprietary": False,
+            "zone": file_zone,
+            "failure_mode": last_status == "failed",
+        }
+        if attach:
+            connections.append({"from": attach, "to": node_id, "type": "weak"})
+    return layout_graph(zones, nodes, connections, grid_zones=(file_zone,))
+
+
+class _LayoutCache:
+    """Positioned pipeline graphs keyed by graph version."""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, version, compute):
+        with self._lock:
+            if version in self._entries:
+                self._entries.move_to_end(version)
+                return self._entries[version]
+        value = compute()
+        with self._lock:
+            self._entries[version] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+layout_cache = _LayoutCache()
+
+
+def pipeline_layout(stage_nodes, max_age=0.0):
+    """
+    (version, positioned pipeline graph). The version changes whenever a file
+    is catalogued or one of its stages changes, so the layout is computed once
+    per change, not per dashboard.
+    """
+    seq, statuses = status_feed.snapshot(max_age)
+    version = f"{seq}-{len(statuses)}"
+    return version, layout_cache.get_or_compute(
+        version, lambda: pipeline_graph(statuses, stage_nodes)
+    )
@@ -0,0 +1,195 @@
+import json
+import time
+import threading
+import logging
+from flask import current_app
+from app import db
+from app.models import QIFFile, PipelineStage
+
+logger = logging.getLogger(__name__)
+
+# Stages every catalogued file has been through, recorded or not: it was
+# uploaded, and files ingested before stages were recorded have no ingest row.
+CATALOGUED_STAGES = {"upload": "done", "ingest": "done"}
+
+
+def record_stage(filename, stage, status, detail=None):
+    """
+    Records the outcome of a processing stage of an uploaded file and wakes
+    the status feed. Files not yet in the catalogue are ignored. Returns the
+    PipelineStage row, or None.
+    """
+    qif_file = QIFFile.get_by_filename(filename)
+    if qif_file is None:
+        logger.debug("Not recording %s %s: %s is not catalogued", stage, status, filename)
+        return None
+    row = PipelineStage.record(qif_file, stage, status, detail)
+    status_feed.notify()
+    return row
+
+
+def journey(filename, stages, stage_nodes):
+    """
+    The view's status for one file: the tree nodes its stages reached, failed
+    at or are working on, plus the stage rows themselves.
+
+        {"name", "success_journey", "failure_journey", "in_progress", "stages"}
+    """
+    lists = {"done": [], "failed": [], "running": []}
+    for stage, nodes in stage_nodes.items():
+        status = stages.get(stage, {}).get("status") or CATALOGUED_STAGES.get(stage)
+        if status in lists:
+            lists[status].extend(nodes)
+    return {
+        "name": filename,
+        "success_journey": lists["done"],
+        "failure_journey": lists["failed"],
+        "in_progress": lists["running"],
+        "stages": stages,
+    }
+
+
+class StatusFeed:
+    """
+    Every catalogued file's journey, held in memory and brought up to date
+    from pipeline_stages by sequence number. Stage changes made in this
+    process wake waiting streams at once; changes from other processes (the
+    CLI, other workers) are picked up at most PIPELINE_REFRESH_INTERVAL late. However
+    many dashboards are open, each refresh is one query for the rows past the
+    last seen seq.
+    """
+
+    def __init__(self):
+        self.seq = None  # None until the first load
+        self.statuses = {}  # filename -> journey()
+        self.file_seq = {}  # filename -> seq of its latest stage change
+        self._stages = {}  # filename -> {stage: row dict}
+        self._dirty = True
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()  # one refresh at a time
+        self._changed = threading.Condition()
+
+    def notify(self):
+        with self._changed:
+            self._dirty = True
+            self._changed.notify_all()
+
+    def refresh(self, max_age=0.0):
+        """Applies stage changes since the last refresh, unless it is under max_age seconds old and nothing was notified."""
+        with self._lock:
+            if not self._dirty and time.monotonic() - self._last_refresh < max_age:
+                return self.seq
+            self._dirty = False
+            self._last_refresh = time.monotonic()
+            stage_nodes = current_app.config["PIPELINE_STAGE_NODES"]
+            if self.seq is None:
+                for qif_file in QIFFile.get_all():
+                    self._stages.setdefault(qif_file.filename, {})
+                    self.file_seq.setdefault(qif_file.filename, 0)
+            rows = PipelineStage.changed_since(self.seq or 0)
+            db.session.remove()  # streams hold no connection while they wait
+            changed = set(self._stages) if self.seq is None else set()
+            for row, filename in rows:
+                self._stages.setdefault(filename, {})[row.stage] = row.to_dict()
+                self.file_seq[filename] = row.seq
+                changed.add(filename)
+            for filename in changed:
+                self.statuses[filename] = journey(filename, self._stages[filename], stage_nodes)
+            seq = rows[-1][0].seq if rows else self.seq or 0
+        with self._changed:
+            if changed or self.seq is None:
+                self.seq = seq
+                self._changed.notify_all()
+        return self.seq
+
+    def snapshot(self, max_age=0.0):
+        """(seq, {filename: journey}) for every catalogued file."""
+        seq = self.refresh(max_age)
+        with self._lock:
+            return seq, dict(self.statuses)
+
+    def changes(self, since, timeout, max_age):
+        """
+        Blocks until there are stage changes after seq `since` (or timeout
+        seconds pass), then returns (seq, {filename: journey}) of the files
+        that changed; the dict is empty on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.refresh(max_age)
+            if seq > since:
+                with self._lock:
+                    return seq, {
+                        filename: self.statuses[filename]
+                        for filename, file_seq in self.file_seq.items()
+                        if file_seq > since
+                    }
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return seq, {}
+            with self._changed:
+                if not self._dirty:
+                    self._changed.wait(min(remaining, max_age or remaining))
+
+
+status_feed = StatusFeed()
+
+
+class StreamSlots:
+    """
+    Caps the SSE streams one worker holds open. Each stream occupies a WSGI
+    thread for as long as its dashboard is open, so past the cap clients are
+    turned away and poll /status?since= instead, leaving threads for the rest
+    of the app.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, limit):
+        with self._lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def sse_event(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in json.dumps(data).splitlines())
+    return "\n".join(lines) + "\n\n"
+
+
+def status_stream(last_event_id=None):
+    """
+    Generator for the SSE feed: a "snapshot" event with every file's journey
+    (unless the client resumes with Last-Event-ID), then a "status" event with
+    the changed files whenever stages change, and comments as keep-alives.
+    Event ids are stage sequence numbers.
+    """
+    heartbeat = current_app.config["PIPELINE_STREAM_HEARTBEAT"]
+    max_age = current_app.config["PIPELINE_REFRESH_INTERVAL"]
+    seq, statuses = status_feed.snapshot(max_age)
+    if last_event_id is None or last_event_id > seq:
+        # A new client, or one resuming from before the stage table was reset
+        yield sse_event("snapshot", statuses, seq)
+    else:
+        seq = last_event_id
+    while True:
+        seq, changed = status_feed.changes(seq, heartbeat, max_age)
+        if changed:
+            yield sse_event("status", changed, seq)
+        else:
+            yield ": keep-alive\n\n"
@@ -0,0 +1,248 @@
+import os
+import io
+import json
+import time
+import uuid
+import hmac
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import logging
+from urllib.parse import urlencode
+from flask import (
+    Blueprint,
+    render_template,
+    jsonify,
+    request,
+    current_app,
+    send_from_directory,
+    abort,
+    g,
+    has_request_context,
+)
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+profiling_bp = Blueprint("profiling", __name__)
+
+PROFILE_HEADER = "X-Profile"
+TOKEN_HEADER = "X-Profile-Token"
+
+# tracemalloc is process-wide, so only one profiled request runs at a time.
+_profile_lock = threading.Lock()
+
+
+def is_profiling_admin():
+    """
+    True if the request carries the configured PROFILING_TOKEN in the
+    X-Profile-Token header. It is checked on every request: there is no
+    session unlock (rotating the token revokes access at once) and no query
+    parameter (it would end up in URLs and logs). With no token configured,
+    profiling is disabled entirely.
+    """
+    token = current_app.config.get("PROFILING_TOKEN")
+    if not token:
+        return False
+    supplied = request.headers.get(TOKEN_HEADER)
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _requested_modes():
+    raw = request.headers.get(PROFILE_HEADER) or request.args.get("profile")
+    if not raw:
+        return set()
+    modes = {m.strip().lower() for m in raw.split(",")}
+    if modes & {"1", "true", "all"}:
+        return {"cpu", "memory"}
+    return modes & {"cpu", "memory"}
+
+
+def start_profiling():
+    """before_request hook: starts cProfile and/or tracemalloc for admin requests."""
+    modes = _requested_modes()
+    if not modes or not is_profiling_admin():
+        return
+    if not _profile_lock.acquire(blocking=False):
+        raise TooManyRequests(
+            description="Another profiled request is running.", retry_after=5
+        )
+
+    g.profile_modes = modes
+    g.profile_started = time.perf_counter()
+    if "memory" in modes:
+        tracemalloc.start(current_app.config.get("PROFILING_TRACEMALLOC_FRAMES", 1))
+    if "cpu" in modes:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _stop_profiling():
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    snapshot = None
+    peak = None
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return profiler, snapshot, peak
+
+
+def _top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append(
+            {
+                "function": f"{func} ({os.path.basename(filename)}:{lineno})",
+                "path": filename,
+                "calls": nc,
+                "primitive_calls": cc,
+                "total_time": tt,
+                "cumulative_time": ct,
+            }
+        )
+    by_cumulative = sorted(rows, key=lambda r: r["cumulative_time"], reverse=True)
+    by_total = sorted(rows, key=lambda r: r["total_time"], reverse=True)
+    return by_cumulative[:limit], by_total[:limit]
+
+
+def _top_allocations(snapshot, limit):
+    snapshot = snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        )
+    )
+    allocations = []
+    for stat in snapshot.statistics("lineno")[:limit]:
+        frame = stat.traceback[0]
+        allocations.append(
+            {
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size": stat.size,
+                "count": stat.count,
+            }
+        )
+    return allocations
+
+
+def _profiled_path():
+    """The request path and query string, without the admin's profile_token."""
+    args = [(k, v) for k, v in request.args.items(multi=True) if k != "profile_token"]
+    if not args:
+        return request.path
+    return f"{request.path}?{urlencode(args)}"
+
+
+def is_profiling():
+    """True while the current request is being profiled."""
+    return has_request_context() and "profile_modes" in g
+
+
+def finish_profiling(response):
+    """after_request hook: stops profiling, stores the report and links it on the response."""
+    if "profile_modes" not in g:
+        return response
+    # Popped up front so abort_profiling cannot release the lock a second time
+    # if anything below raises.
+    modes = g.pop("profile_modes")
+    started = g.pop("profile_started")
+    try:
+        profiler, snapshot, peak = _stop_profiling()
+        elapsed = time.perf_counter() - started
+        limit = current_app.config.get("PROFILING_TOP_N", 40)
+        profile_id = uuid.uuid4().hex
+        folder = current_app.config["PROFILE_FOLDER"]
+        os.makedirs(folder, exist_ok=True)
+
+        report = {
+            "id": profile_id,
+            "path": _profiled_path(),
+            "method": request.method,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "modes": sorted(modes),
+            "wall_time": elapsed,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(folder, f"{profile_id}.prof"))
+            report["top_cumulative"], report["top_total"] = _top_functions(profiler, limit)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+            report["pstats_text"] = text.getvalue()
+        if snapshot is not None:
+            report["peak_memory"] = peak
+            report["top_allocations"] = _top_allocations(snapshot, limit)
+
+        with open(os.path.join(folder, f"{profile_id}.json"), "w") as f:
+            json.dump(report, f)
+        logger.info("Stored profile %s for %s", profile_id, _profiled_path())
+        response.headers["X-Profile-Id"] = profile_id
+        response.headers["X-Profile-Url"] = f"/qif/profiles/{profile_id}"
+    finally:
+        _profile_lock.release()
+    return response
+
+
+def abort_profiling(exc):
+    """teardown_request hook: never leave the profiler running after an error."""
+    if "profile_modes" in g:
+        g.pop("profile_modes")
+        _stop_profiling()
+        _profile_lock.release()
+
+
+def _load_report(profile_id):
+    if not all(c in "0123456789abcdef" for c in profile_id):
+        abort(404)
+    path = os.path.join(current_app.config["PROFILE_FOLDER"], f"{profile_id}.json")
+    if not os.path.exists(path):
+        abort(404, f"Profile not found: {profile_id}")
+    with open(path) as f:
+        return json.load(f)
+
+
+@profiling_bp.before_request
+def require_admin():
+    if not is_profiling_admin():
+        abort(403)
+
+
+@profiling_bp.route("/")
+def list_profiles():
+    folder = current_app.config["PROFILE_FOLDER"]
+    reports = []
+    if os.path.isdir(folder):
+        for f in sorted(os.listdir(folder), reverse=True):
+            if f.endswith(".json"):
+                with open(os.path.join(folder, f)) as fh:
+                    report = json.load(fh)
+                report.pop("pstats_text", None)
+                reports.append(report)
+    reports.sort(key=lambda r: r["created"], reverse=True)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(reports)
+    return render_template("qif_tools/profiles.html", reports=reports)
+
+
+@profiling_bp.route("/<profile_id>")
+def view_profile(profile_id):
+    report = _load_report(profile_id)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report)
+    return render_template("qif_tools/profile_report.html", report=report)
+
+
+@profiling_bp.route("/<profile_id>/download")
+def download_profile(profile_id):
+    """Raw cProfile stats (open with pstats or snakeviz), or the JSON report for memory-only runs."""
+    report = _load_report(profile_id)
+    folder = current_app.config["PROFILE_FOLDER"]
+    filename = f"{profile_id}.prof" if "top_cumulative" in report else f"{profile_id}.json"
+    return send_from_directory(folder, filename, as_attachment=True)
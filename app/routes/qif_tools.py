@@ -1,4 +1,8 @@
 import os
+import io
+import json
+import time
+from contextlib import ExitStack
 from flask import (
     Blueprint,
     render_template,
@@ -11,11 +15,38 @@ from flask import (
     send_from_directory,
     abort,
     Response,
+    stream_with_context,
 )
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.exceptions import TooManyRequests
 import xmlschema
 from lxml import etree
+import numpy as np
 from .qifsummary import QIFSummary
+from .qifsnapshot import open_snapshot
+from .qifarrays import find_array_elements, describe_array_element, decode_array
+from .qifunits import array_to_si, unit_table
+from .qifstats import lot_capability
+from .qifxpath import compile_xpath, query_files
+from .qifgraph import DIRECTIONS, reference_graph
+from .qifset import characteristic_starts, linked_filenames, resolve_characteristic
+from .qifrawdiff import diff_files, raw_diff_cache
+from .warehouse import ingest_upload, catalogued_file, catalogued_fingerprint
+from .pipeline_status import record_stage
+from .response_cache import cached_file_view, file_digest
+from .job_runner import (
+    job_kind,
+    get_kind,
+    submit_job,
+    cancel_job,
+    pending_jobs,
+    owner_alive,
+)
+from .admission import admission_gate, admission_controlled, estimate_cost
+from .profiling import start_profiling, finish_profiling, abort_profiling
+from app import db
+from app.models import Job
 import logging
 
 base_dir = os.path.join(os.getcwd(), "QIF3.0-2018-ANSI", "xsd", "QIFApplications")
@@ -28,31 +59,78 @@ schema_obj = etree.XMLSchema(schema_doc)
 
 
 qif_bp = Blueprint("qif", __name__)
+qif_bp.before_request(start_profiling)
+qif_bp.after_request(finish_profiling)
+qif_bp.teardown_request(abort_profiling)
 
 logger = logging.getLogger(__name__)
 
 
-def load_qif_summary(filename):
+def load_qif_summary(filename, progress=None):
     """
     Helper function to:
      1) Build the full path to the QIF file
      2) Load / create the schema object from QIFDocument.xsd (or some location)
-     3) Construct a QIFSummary instance
+     3) Construct a QIFSummary instance (optionally reporting progress to a job),
+        over the file's binary snapshot when ingest wrote one, with the section
+        hashes and canonical fingerprint the catalogue holds for its content
     """
     upload_folder = current_app.config["UPLOAD_FOLDER"]
     filepath = os.path.join(upload_folder, filename)
     if not os.path.exists(filepath):
         abort(404, f"File not found: {filename}")
 
+    snapshot = None
+    if current_app.config.get("SNAPSHOT_ENABLED"):
+        snapshot = open_snapshot(current_app.config["SNAPSHOT_FOLDER"], file_digest(filepath))
+    # Section hashes and fingerprint stored at ingest, when the catalogue has
+    # this exact content, so they are not recomputed from the tree
+    qif_file = catalogued_file(filepath)
+    canonical = None
+    sections = None
+    if qif_file is not None:
+        sections = qif_file.section_hashes
+        if qif_file.fingerprint is not None:
+            canonical = (qif_file.fingerprint, tuple(current_app.config.get("CANONICAL_STRIP", ())))
+
     # Create a QIFSummary instance:
     try:
-        qif_summary = QIFSummary(filepath, schema_obj)
+        qif_summary = QIFSummary(
+            filepath,
+            schema_obj,
+            progress=progress,
+            snapshot=snapshot,
+            canonical=canonical,
+            section_hashes=sections,
+        )
         return qif_summary
     except Exception as e:
         logger.error("Failed to init QIFSummary: %s", e)
         abort(500, f"QIFSummary init error: {e}")
 
 
+def canonical_match(file1, file2):
+    """
+    compare_to()'s result for two uploads with the same content, byte for
+    byte or canonically (catalogued fingerprints, see qifcanonical), so they
+    are not loaded and compared at all; None otherwise.
+    """
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    paths = [safe_join(upload_folder, filename or "") for filename in (file1, file2)]
+    if not all(path and os.path.isfile(path) for path in paths):
+        return None
+    if file_digest(paths[0]) != file_digest(paths[1]):
+        fingerprint = catalogued_fingerprint(paths[0])
+        if fingerprint is None or fingerprint != catalogued_fingerprint(paths[1]):
+            return None
+    return {
+        "differences": [],
+        "name1": os.path.basename(paths[0]),
+        "name2": os.path.basename(paths[1]),
+        "canonical_match": True,
+    }
+
+
 # Helper function to check allowed file types
 def allowed_file(filename):
     return (
@@ -78,11 +156,17 @@ def start():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             file.save(os.path.join(current_app.config["UPLOAD_FOLDER"], filename))
+            ingest_upload(filename)
             flash(f"File '{filename}' uploaded successfully!", "success")
             return redirect(url_for("qif.start"))
 
         flash("Invalid file type!", "error")
 
+    return render_template("qif_tools/start.html", files=list_qif_uploads())
+
+
+def list_qif_uploads():
+    """Upload-relative paths of every .qif file in UPLOAD_FOLDER."""
     upload_folder = current_app.config["UPLOAD_FOLDER"]
     qif_files = []
     for root, dirs, files in os.walk(upload_folder):
@@ -91,8 +175,7 @@ def start():
                 location = os.path.join(root, f)
                 relative_location = os.path.relpath(location, upload_folder)
                 qif_files.append(relative_location)
-
-    return render_template("qif_tools/start.html", files=qif_files)
+    return qif_files
 
 
 @qif_bp.route("/download/<path:filename>")
@@ -103,6 +186,8 @@ def download_file(filename):
 
 
 @qif_bp.route("/details/<path:filename>")
+@cached_file_view()
+@admission_controlled()
 def qif_details(filename):
     """
     Uses the QIFSummary class to extract all metadata from the QIF file,
@@ -119,35 +204,116 @@ def compare_files():
     # Get file names from the form
     file1 = request.form.get("file1")
     file2 = request.form.get("file2")
+    if request.form.get("mode") == "raw":
+        return redirect(url_for("qif.raw_diff", file1=file1, file2=file2), code=303)
 
-    logger.debug("Comparing files: %s and %s", file1, file2)
-    # Create QIFSummary instances for both files.
-    try:
-        qif_summary1 = load_qif_summary(file1)
-        qif_summary2 = load_qif_summary(file2)
-    except Exception as e:
-        logger.error("Error creating QIFSummary: %s", e)
-        abort(500, f"Error processing files: {e}")
+    identical = canonical_match(file1, file2)
+    if identical is not None:
+        return render_template("qif_tools/qiff_diff_results.html", diff=identical)
+
+    if current_app.config.get("ASYNC_JOBS_ENABLED"):
+        job = submit_job("compare", {"file1": file1, "file2": file2})
+        return redirect(url_for("qif.job_view", job_id=job.id), code=303)
 
-    # Compare the two summaries.
-    differences = qif_summary1.compare_to(qif_summary2)
-    print(differences)
+    logger.debug("Comparing files: %s and %s", file1, file2)
+    key = request.endpoint
+    with admission_gate.admit(key, estimate_cost(key, [file1, file2])):
+        # Create QIFSummary instances for both files.
+        try:
+            qif_summary1 = load_qif_summary(file1)
+            qif_summary2 = load_qif_summary(file2)
+        except Exception as e:
+            logger.error("Error creating QIFSummary: %s", e)
+            abort(500, f"Error processing files: {e}")
+
+        # Compare the two summaries.
+        differences = qif_summary1.compare_to(qif_summary2)
     logger.debug("Differences: %s", differences)
 
     # Return the differences as a JSON response.
     return render_template("qif_tools/qiff_diff_results.html", diff=differences)
 
 
+@qif_bp.route("/raw-diff")
+def raw_diff():
+    """
+    Line diff of the two files' raw XML, side by side, a page of rows at a time:
+      GET /qif/raw-diff?file1=a.qif&file2=b.qif&page=2
+    The diff is computed once per pair of file contents and cached; format=json
+    returns the page's rows instead of the HTML view.
+    """
+    file1 = request.args.get("file1")
+    file2 = request.args.get("file2")
+    paths = []
+    for filename in (file1, file2):
+        path = safe_join(current_app.config["UPLOAD_FOLDER"], filename or "")
+        if not filename or path is None or not os.path.isfile(path):
+            abort(404, f"File not found: {filename}")
+        paths.append(path)
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+    except ValueError:
+        abort(400, "page must be an int")
+
+    cfg = current_app.config
+    context = cfg.get("RAW_DIFF_CONTEXT", 3)
+    max_cost = cfg.get("RAW_DIFF_MAX_COST", 1000)
+    per_page = cfg.get("RAW_DIFF_ROWS_PER_PAGE", 200)
+    cache_key = (file_digest(paths[0]), file_digest(paths[1]), context, max_cost)
+    key = request.endpoint
+    with admission_gate.admit(key, estimate_cost(key, [file1, file2])):
+        diff = raw_diff_cache.get_or_compute(
+            cache_key, lambda: diff_files(paths[0], paths[1], context, max_cost)
+        )
+        pages = diff.pages(per_page)
+        page = min(page, pages)
+        rows = diff.page(page, per_page, cfg.get("RAW_DIFF_MAX_LINE_CHARS", 2000))
+
+    # every difference is formatting when the files are canonically the same
+    identical = bool(diff.hunks) and canonical_match(file1, file2) is not None
+    if request.args.get("format") == "json":
+        return jsonify(
+            {
+                "file1": file1,
+                "file2": file2,
+                "page": page,
+                "pages": pages,
+                "hunks": len(diff.hunks),
+                "stats": diff.stats,
+                "canonical_match": identical,
+                "rows": rows,
+            }
+        )
+    return render_template(
+        "qif_tools/raw_diff.html",
+        file1=file1,
+        file2=file2,
+        page=page,
+        pages=pages,
+        hunks=len(diff.hunks),
+        stats=diff.stats,
+        canonical_match=identical,
+        rows=rows,
+    )
+
+
 @qif_bp.route("/search-feature", methods=["POST"])
 def search_feature():
     filename = request.form.get("qif_file")
     feature_name = request.form.get("feature_name")
 
-    qif_summary = load_qif_summary(filename)
-    chase_result = qif_summary.chase_feature(feature_name)
-    print(chase_result)
-    print()
-    qif_summary.assert_symmetry()
+    if current_app.config.get("ASYNC_JOBS_ENABLED"):
+        job = submit_job(
+            "search_feature", {"filename": filename, "feature_name": feature_name}
+        )
+        return redirect(url_for("qif.job_view", job_id=job.id), code=303)
+
+    key = request.endpoint
+    with admission_gate.admit(key, estimate_cost(key, [filename])):
+        qif_summary = load_qif_summary(filename)
+        chase_result = qif_summary.chase_feature(feature_name)
+        logger.debug("Chase result: %s", chase_result)
+        qif_summary.assert_symmetry()
 
     # Render a new template that presents chase_result
     return render_template(
@@ -172,6 +338,8 @@ def serve_raw_qif_xml(filename):
 
 
 @qif_bp.route("/dictxml/<path:filename>")
+@cached_file_view()
+@admission_controlled()
 def serve_qif_dict(filename):
     """
     Returns the *entire* QIF XML as a fully traversed nested dict (converted to JSON).
@@ -185,6 +353,8 @@ def serve_qif_dict(filename):
 
 
 @qif_bp.route("/summary/<path:filename>")
+@cached_file_view()
+@admission_controlled()
 def serve_qif_summary(filename):
     """
     Returns a 'high-level summary' dict (filename, size, version, top sections, etc.)
@@ -197,6 +367,327 @@ def serve_qif_summary(filename):
     summary_data = qif_summary.get_summary()
     return jsonify(summary_data)
 
+@qif_bp.route("/arrays/<path:filename>")
+@admission_controlled()
+def list_qif_arrays(filename):
+    """
+    Lists the numeric arrays (point lists, ArrayDouble/ArrayPoint, base64
+    binary arrays) in a QIF file, without decoding them.
+    Example usage:
+      GET /arrays/SomeFile.qif
+    """
+    qif_summary = load_qif_summary(filename)
+    arrays = [
+        dict(describe_array_element(element), index=i)
+        for i, element in enumerate(find_array_elements(qif_summary.tree))
+    ]
+    return jsonify({"filename": filename, "arrays": arrays})
+
+
+@qif_bp.route("/array/<int:index>/<path:filename>")
+@admission_controlled()
+def serve_qif_array(index, filename):
+    """
+    Decodes one array (index from /arrays/<filename>) with NumPy.
+
+    Query args:
+      format=json (typed JSON, default) | bin (raw little-endian, shape/dtype
+        in X-Array-* headers) | npy (NumPy .npy file)
+      max_bytes=N: downsample to at most N bytes of decoded data. Always capped
+        at ARRAY_JSON_MAX_BYTES (json) or ARRAY_MAX_BYTES (bin/npy).
+      si=1: convert lengths (points, control points, deviations...) to meters
+        using the file's units; the unit is reported in JSON and X-Array-Unit.
+    Example usage:
+      GET /array/3/SomeFile.qif?format=bin&max_bytes=1048576&si=1
+    """
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "bin", "npy"):
+        abort(400, f"Unknown format: {fmt}")
+    limit = current_app.config[
+        "ARRAY_JSON_MAX_BYTES" if fmt == "json" else "ARRAY_MAX_BYTES"
+    ]
+    max_bytes = request.args.get("max_bytes", type=int)
+    max_bytes = min(max_bytes, limit) if max_bytes else limit
+
+    qif_summary = load_qif_summary(filename)
+    elements = find_array_elements(qif_summary.tree)
+    if not 0 <= index < len(elements):
+        abort(404, f"No array {index} in {filename}")
+    try:
+        array = decode_array(elements[index], max_bytes=max_bytes)
+    except ValueError as e:
+        abort(422, f"Could not decode array {index}: {e}")
+    if request.args.get("si", type=int):
+        array.data, array.unit = array_to_si(
+            unit_table(qif_summary.filepath), elements[index], array.data
+        )
+
+    if fmt == "json":
+        return jsonify(array.to_json())
+
+    if fmt == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, array.data)
+        response = Response(buffer.getvalue(), mimetype="application/octet-stream")
+        response.headers["Content-Disposition"] = (
+            f"attachment; filename={os.path.basename(filename)}.{index}.npy"
+        )
+    else:
+        response = Response(array.to_bytes(), mimetype="application/octet-stream")
+    response.headers["X-Array-Dtype"] = array.data.dtype.newbyteorder("<").str
+    response.headers["X-Array-Shape"] = ",".join(str(n) for n in array.data.shape)
+    response.headers["X-Array-Stride"] = str(array.stride)
+    response.headers["X-Array-Total-Rows"] = str(array.total_rows)
+    if array.unit:
+        response.headers["X-Array-Unit"] = array.unit
+    return response
+
+
+@qif_bp.route("/capability", methods=["GET", "POST"])
+def capability():
+    """
+    GET: file picker. POST (form "files" or JSON {"files": [...]}; all uploads
+    when empty): Cp/Cpk and out-of-tolerance statistics per characteristic
+    across the selected results files.
+    """
+    if request.method == "GET":
+        return render_template("qif_tools/capability.html", files=list_qif_uploads())
+
+    data = request.get_json(silent=True)
+    files = data.get("files") if data else request.form.getlist("files")
+    files = files or list_qif_uploads()
+
+    if current_app.config.get("ASYNC_JOBS_ENABLED"):
+        job = submit_job("capability", {"files": files})
+        return redirect(url_for("qif.job_view", job_id=job.id), code=303)
+
+    key = request.endpoint
+    with admission_gate.admit(key, estimate_cost(key, files)):
+        report = run_capability(files)
+    if data is not None:
+        return jsonify(report)
+    return render_template("qif_tools/capability_results.html", report=report)
+
+
+def run_capability(files, progress=None):
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    paths = []
+    for filename in files:
+        path = safe_join(upload_folder, filename)
+        if path is None:
+            abort(400, f"Invalid filename: {filename}")
+        paths.append(path)
+    return lot_capability(
+        paths,
+        progress=progress,
+        workers=current_app.config.get("CAPABILITY_WORKERS", 1),
+        parallel_min=current_app.config.get("CAPABILITY_PARALLEL_MIN", 64),
+    )
+
+
+@qif_bp.route("/xpath", methods=["GET", "POST"])
+def xpath_query():
+    """
+    Runs an XPath expression (prefix qif: is bound to the QIF namespace)
+    against the given uploads, or all of them, e.g.
+      GET /qif/xpath?q=//qif:PositionCharacteristicNominal&file=part.qif
+      GET /qif/xpath?q=count(//qif:CharacteristicMeasurements/*)&format=ndjson
+    Arguments (query string, form or JSON body): q, file (repeatable),
+    offset/limit (results per file), page/per_page (files), xml=1 to include
+    element markup, format=json|ndjson. ndjson streams one line per file as
+    it finishes, then a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    args = request.values
+
+    def arg(name, default=None, type=None):
+        value = data.get(name, args.get(name))
+        if value in (None, ""):
+            return default
+        if type is not None:
+            try:
+                return type(value)
+            except (TypeError, ValueError):
+                abort(400, f"{name} must be a {type.__name__}")
+        return value
+
+    expression = arg("q")
+    if not expression:
+        abort(400, "Missing XPath expression (q)")
+    try:
+        compile_xpath(expression)
+    except etree.XPathSyntaxError as e:
+        abort(400, f"Invalid XPath: {e}")
+
+    cfg = current_app.config
+    files = data.get("files") or args.getlist("file") or sorted(list_qif_uploads())
+    page = max(1, arg("page", 1, int))
+    per_page = min(max(1, arg("per_page", 50, int)), cfg.get("XPATH_MAX_FILES_PER_PAGE", 200))
+    offset = max(0, arg("offset", 0, int))
+    limit = min(max(1, arg("limit", 100, int)), cfg.get("XPATH_MAX_RESULTS", 1000))
+    xml = bool(arg("xml", False, int))
+    fmt = arg("format", "json")
+    if fmt not in ("json", "ndjson"):
+        abort(400, f"Unknown format: {fmt}")
+
+    page_files = files[(page - 1) * per_page : page * per_page]
+    upload_folder = cfg["UPLOAD_FOLDER"]
+    paths = {}
+    for filename in page_files:
+        path = safe_join(upload_folder, filename)
+        if path is None:
+            abort(400, f"Invalid filename: {filename}")
+        paths[path] = filename
+
+    meta = {
+        "expression": expression,
+        "page": page,
+        "per_page": per_page,
+        "total_files": len(files),
+        "offset": offset,
+        "limit": limit,
+    }
+    key = request.endpoint
+    admission = ExitStack()
+    admission.enter_context(admission_gate.admit(key, estimate_cost(key, page_files)))
+
+    def records():
+        for record in query_files(
+            list(paths),
+            expression,
+            offset=offset,
+            limit=limit,
+            xml=xml,
+            workers=cfg.get("XPATH_WORKERS", 1),
+            parallel_min=cfg.get("XPATH_PARALLEL_MIN", 4),
+            cache_bytes=cfg.get("XPATH_TREE_CACHE_BYTES", 256 * 1024 * 1024),
+        ):
+            record["filename"] = paths[record.pop("path")]
+            yield record
+
+    start = time.perf_counter()
+    if fmt == "ndjson":
+
+        def stream():
+            yield json.dumps(meta) + "\n"
+            matches = 0
+            for record in records():
+                matches += record.get("count", 0)
+                yield json.dumps(record, default=str) + "\n"
+            summary = {"matches": matches, "total_s": round(time.perf_counter() - start, 6)}
+            yield json.dumps({"summary": summary}) + "\n"
+
+        # The admission slot is held until the stream is finished or dropped.
+        response = Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+        response.call_on_close(admission.close)
+        return response
+
+    with admission:
+        order = {filename: i for i, filename in enumerate(page_files)}
+        results = sorted(records(), key=lambda r: order[r["filename"]])
+    meta["files"] = results
+    meta["matches"] = sum(r.get("count", 0) for r in results)
+    meta["total_s"] = round(time.perf_counter() - start, 6)
+    return jsonify(meta)
+
+
+def load_reference_graph(filename):
+    path = safe_join(current_app.config["UPLOAD_FOLDER"], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404, f"File not found: {filename}")
+    try:
+        return reference_graph(path)
+    except etree.XMLSyntaxError as e:
+        abort(422, f"Could not parse {filename}: {e}")
+
+
+@qif_bp.route("/graph/<path:filename>")
+@cached_file_view()
+@admission_controlled()
+def graph_summary(filename):
+    """Node, edge and dangling-reference counts of the file's reference graph."""
+    return jsonify(load_reference_graph(filename).summary())
+
+
+@qif_bp.route("/graph/element/<int:element_id>/<path:filename>")
+@admission_controlled()
+def graph_element(element_id, filename):
+    """
+    Direct references from and to one element, plus everything reachable:
+    ?direction=impact (default) lists what depends on it, directly or not;
+    direction=depends what it depends on. ?depth= limits the number of hops.
+    """
+    direction = request.args.get("direction", "impact")
+    if direction not in DIRECTIONS:
+        abort(400, f"direction must be one of {', '.join(DIRECTIONS)}")
+    result = load_reference_graph(filename).query(
+        element_id, direction, request.args.get("depth", type=int)
+    )
+    if result is None:
+        abort(404, f"No element with id {element_id} in {filename}")
+    return jsonify(result)
+
+
+@qif_bp.route("/graph/tree/<path:filename>")
+@admission_controlled()
+def graph_tree(filename):
+    """
+    The reference graph in the digital_pipelines tree format. ?id= exports
+    the neighbourhood of one element (?depth=, ?max_nodes=); without it, the
+    graph of element types.
+    """
+    graph = load_reference_graph(filename).export_tree(
+        request.args.get("id", type=int),
+        depth=request.args.get("depth", 2, type=int),
+        max_nodes=min(request.args.get("max_nodes", 200, type=int), 1000),
+    )
+    if graph is None:
+        abort(404, f"No element with id {request.args['id']} in {filename}")
+    return jsonify(graph)
+
+
+@qif_bp.route("/set/characteristic")
+@qif_bp.route("/set/characteristic/<path:filename>")
+def resolve_set_characteristic(filename=None):
+    """
+    Follows a characteristic across the uploaded QIF set, from features and
+    definitions through nominal and items to measurements in other files
+    (linked by QPId and xId; see qifset), e.g.
+      GET /qif/set/characteristic/results.qif?id=3    from any element of the chain
+      GET /qif/set/characteristic?name=CH12           by Name or designator, every file
+    Only ingested files are linked; filename narrows a name lookup to that file.
+    """
+    element_id = request.args.get("id", type=int)
+    name = request.args.get("name")
+    if element_id is None and not name:
+        abort(400, "id or name is required")
+    if filename is not None:
+        path = safe_join(current_app.config["UPLOAD_FOLDER"], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404, f"File not found: {filename}")
+    if element_id is not None:
+        if filename is None:
+            abort(400, "id needs a filename")
+        starts = [(filename, element_id)]
+    else:
+        starts = characteristic_starts(
+            name, filename, current_app.config.get("SET_MAX_STARTS", 20)
+        )
+        if not starts:
+            abort(404, f"No characteristic named {name}")
+
+    key = request.endpoint
+    files = linked_filenames({start for start, _ in starts})
+    with admission_gate.admit(key, estimate_cost(key, files)):
+        try:
+            result = resolve_characteristic(current_app.config["UPLOAD_FOLDER"], starts)
+        except etree.XMLSyntaxError as e:
+            abort(422, f"Could not parse {filename}: {e}")
+    if result is None:
+        abort(404, f"No element with id {element_id} in {filename}")
+    return jsonify(result)
+
+
 @qif_bp.route("/visualize/<path:filename>")
 def visualize_qif(filename):
     """
@@ -204,3 +695,207 @@ def visualize_qif(filename):
     and does a simple or 'artistic' visualization.
     """
     return render_template("qif_tools/qif_visualize.html", filename=filename)
+
+
+# -----------------------------------------------------------------------------
+# BACKGROUND JOBS
+# -----------------------------------------------------------------------------
+
+
+@job_kind(
+    "details",
+    template="qif_tools/qif_details.html",
+    context=lambda params, result: {"metadata": result},
+    reuse=True,
+)
+def details_job(params, progress):
+    summary = load_qif_summary(params["filename"], progress=progress).get_summary()
+    record_validation(params["filename"], summary["validation"])
+    return summary
+
+
+def record_validation(filename, validation):
+    """Records a get_schema_validation() result as the file's validation stage."""
+    errors = validation["errors"]
+    if validation["schema_valid"]:
+        record_stage(filename, "validation", "done", "schema valid")
+    else:
+        record_stage(
+            filename,
+            "validation",
+            "failed",
+            f"{len(errors)} schema errors" if isinstance(errors, list) else errors,
+        )
+
+
+@job_kind("validate")
+def validate_job(params, progress):
+    """Schema validation, nominal audit and XSLT checks of an upload, recorded as its pipeline stages."""
+    filename = params["filename"]
+    pending = ["validation", "audit"]
+    for stage in pending:
+        record_stage(filename, stage, "running")
+    try:
+        qif_summary = load_qif_summary(filename, progress=progress)
+        validation = qif_summary.get_schema_validation()
+        record_validation(filename, validation)
+        pending.remove("validation")
+        audit = qif_summary.audit_summary()
+        checks = qif_summary.get_check_report()
+    except Exception as e:
+        for stage in pending:
+            record_stage(filename, stage, "failed", str(e))
+        raise
+    message = f"{audit['incomplete']} of {audit['nominals']} nominals incomplete"
+    if not checks["checks_passed"]:
+        errors = checks["errors"]
+        message += (
+            f", {len(errors)} XSLT check errors"
+            if isinstance(errors, list)
+            else f", XSLT checks failed: {errors}"
+        )
+    record_stage(filename, "audit", "failed" if audit["incomplete"] else "done", message)
+    return {"validation": validation, "audit": audit, "checks": checks}
+
+
+@job_kind(
+    "compare",
+    template="qif_tools/qiff_diff_results.html",
+    context=lambda params, result: {"diff": result},
+    files=lambda params: [params.get("file1"), params.get("file2")],
+    reuse=True,
+)
+def compare_job(params, progress):
+    identical = canonical_match(params["file1"], params["file2"])
+    if identical is not None:
+        return identical
+    qif_summary1 = load_qif_summary(params["file1"], progress=progress)
+    qif_summary2 = load_qif_summary(params["file2"], progress=progress)
+    return qif_summary1.compare_to(qif_summary2)
+
+
+@job_kind(
+    "search_feature",
+    template="qif_tools/search_results.html",
+    context=lambda params, result: {
+        "file": params["filename"],
+        "feature_name": params["feature_name"],
+        "chase_result": result,
+    },
+    reuse=True,
+)
+def search_feature_job(params, progress):
+    qif_summary = load_qif_summary(params["filename"], progress=progress)
+    return qif_summary.chase_feature(params["feature_name"])
+
+
+@job_kind(
+    "capability",
+    template="qif_tools/capability_results.html",
+    context=lambda params, result: {"report": result},
+    files=lambda params: params.get("files") or [],
+    reuse=True,
+)
+def capability_job(params, progress):
+    return run_capability(params.get("files") or list_qif_uploads(), progress=progress)
+
+
+@job_kind("dictxml", reuse=True)
+def dictxml_job(params, progress):
+    return load_qif_summary(params["filename"], progress=progress).as_dict()
+
+
+@qif_bp.route("/admission")
+def admission_stats():
+    """
+    Admission-control counters: in-flight, queued, admitted and rejected (429/503)
+    per endpoint, plus global queue depth, estimated memory in use and pending jobs.
+    """
+    stats = admission_gate.stats()
+    stats["jobs_pending"] = pending_jobs()
+    return jsonify(stats)
+
+
+@qif_bp.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Submits a background job. Accepts JSON or form data with a "kind" plus that
+    kind's parameters, e.g. {"kind": "details", "filename": "SomeFile.qif"}.
+    Returns 202 with URLs to poll, or 429 with an "error" and Retry-After when
+    too many jobs are pending.
+    """
+    params = dict(request.get_json(silent=True) or request.form)
+    kind = params.pop("kind", None)
+    if get_kind(kind) is None:
+        return jsonify({"error": f"Unknown job kind: {kind}"}), 400
+
+    try:
+        job = submit_job(kind, params)
+    except TooManyRequests as e:
+        return jsonify({"error": e.description}), 429, {"Retry-After": str(e.retry_after)}
+    return (
+        jsonify(
+            {
+                "job_id": job.id,
+                "status_url": url_for("qif.job_status", job_id=job.id),
+                "result_url": url_for("qif.job_result", job_id=job.id),
+                "view_url": url_for("qif.job_view", job_id=job.id),
+            }
+        ),
+        202,
+    )
+
+
+@qif_bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = db.get_or_404(Job, job_id)
+    if not job.finished and not owner_alive(job.owner):
+        # The worker that ran it died; don't leave the client polling forever.
+        Job.update(job.id, status="failed", error="Interrupted by server restart.")
+    return jsonify(job.to_dict())
+
+
+@qif_bp.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.status != "done":
+        return jsonify(job.to_dict()), 409
+    return Response(job.result, mimetype="application/json")
+
+
+@qif_bp.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    job = db.get_or_404(Job, job_id)
+    if not cancel_job(job.id):
+        return jsonify({"error": f"Job is already {job.status}."}), 409
+    return jsonify({"job_id": job.id, "cancel_requested": True}), 202
+
+
+@qif_bp.route("/jobs/<job_id>/view")
+def job_view(job_id):
+    """
+    Renders the job's result with the template of its kind once it is done;
+    until then, renders a page that polls the status endpoint.
+    """
+    job = db.get_or_404(Job, job_id)
+    kind = get_kind(job.kind)
+    if job.status != "done" or kind is None or kind.template is None:
+        return render_template("qif_tools/job_status.html", job=job.to_dict())
+    params = json.loads(job.params)
+    result = json.loads(job.result)
+    return render_template(kind.template, **kind.context(params, result))
+
+
+@qif_bp.route("/run/<kind>/<path:filename>")
+def run_job_page(kind, filename):
+    """
+    Non-blocking entry point for links: renders the polling page, which submits a
+    <kind> job for <filename> from the browser and follows it to the result.
+    """
+    if get_kind(kind) is None:
+        abort(404, f"Unknown job kind: {kind}")
+    return render_template(
+        "qif_tools/job_status.html",
+        job=None,
+        submit={"kind": kind, "filename": filename},
+    )
@@ -0,0 +1,297 @@
+import re
+import base64
+import logging
+import numpy as np
+from lxml import etree
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Whitespace-separated lists without a count attribute (MeasuredPointSetType and
+# friends), with the number of values per row.
+LIST_TAG_WIDTHS = {
+    "Points": 3,
+    "Normals": 3,
+    "Directions": 3,
+    "Deviations": 1,
+    "ProbeRadii": 1,
+    "Compensations": 1,
+    "Colors": 3,
+}
+
+# Scalar type stored in base64 ArrayBinaryType elements. sizeElement is the size
+# of one row, so a BinaryPoints row of 24 bytes decodes as 3 x float64.
+BINARY_TAG_DTYPES = {
+    "BinaryColors": np.dtype("u1"),
+    "BinaryCompensated": np.dtype("u1"),
+    "BinaryQuality": np.dtype("u1"),
+    "BinaryPointIndices": np.dtype("<u4"),
+}
+DEFAULT_BINARY_DTYPE = np.dtype("<f8")
+
+# Characters per slice when decoding text in capped mode; keeps the transient
+# float64 buffer around 1-2 MB regardless of array size.
+TEXT_CHUNK_CHARS = 1 << 20
+BINARY_CHUNK_CHARS = 4 * (1 << 18)  # a multiple of 4 base64 characters
+
+_whitespace = re.compile(r"\s+")
+_namespace = re.compile(r"\{[^}]*\}")
+
+
+def element_path(element):
+    """Namespace-free ElementPath from the root, e.g. MeasuredPointSets/MeasuredPointSet[2]/Points."""
+    return _namespace.sub("", element.getroottree().getelementpath(element))
+
+
+class DecodedArray:
+    """
+    A numeric QIF array decoded into a 2-D NumPy array of shape (rows, width).
+
+    If decoding was capped, `data` holds every `stride`-th row of the
+    `total_rows` in the document. `unit` is set once the data has been
+    converted to SI (see qifunits.array_to_si).
+    """
+
+    def __init__(self, element, data, total_rows, stride, encoding):
+        self.tag = etree.QName(element).localname
+        self.path = element_path(element)
+        self.data = data
+        self.total_rows = total_rows
+        self.stride = stride
+        self.encoding = encoding
+        self.unit = None
+
+    @property
+    def downsampled(self):
+        return self.stride > 1
+
+    def describe(self):
+        return {
+            "tag": self.tag,
+            "path": self.path,
+            "encoding": self.encoding,
+            "dtype": self.data.dtype.name,
+            "shape": list(self.data.shape),
+            "total_rows": self.total_rows,
+            "stride": self.stride,
+            "unit": self.unit,
+        }
+
+    def to_json(self):
+        """Typed JSON: dtype and shape alongside the (possibly downsampled) rows."""
+        result = self.describe()
+        result["data"] = self.data.tolist()
+        return result
+
+    def to_bytes(self):
+        """Raw little-endian, C-order bytes; shape and dtype travel in describe()."""
+        return np.ascontiguousarray(self.data).astype(
+            self.data.dtype.newbyteorder("<"), copy=False
+        ).tobytes()
+
+
+def is_array_element(element):
+    """True for leaf elements holding a numeric list or a base64 binary array."""
+    if not isinstance(element.tag, str) or len(element) or not element.text:
+        return False
+    if "sizeElement" in element.attrib:
+        return True
+    if "count" in element.attrib:
+        return True
+    return etree.QName(element).localname in LIST_TAG_WIDTHS
+
+
+def find_array_elements(root):
+    """All array elements under root, in document order."""
+    return [el for el in root.iter() if is_array_element(el)]
+
+
+def describe_array_element(element):
+    """Array metadata that can be read off the element without decoding it."""
+    tag = etree.QName(element).localname
+    info = {
+        "tag": tag,
+        "path": element_path(element),
+        "parent": etree.QName(element.getparent()).localname
+        if element.getparent() is not None
+        else None,
+        "parent_id": element.getparent().get("id")
+        if element.getparent() is not None
+        else None,
+        "encoding": "base64" if "sizeElement" in element.attrib else "text",
+        "count": int(element.get("count")) if element.get("count") else None,
+        "chars": len(element.text),
+    }
+    if "sizeElement" in element.attrib:
+        info["size_element"] = int(element.get("sizeElement"))
+    return info
+
+
+def _text_width(element, values=None):
+    tag = etree.QName(element).localname
+    count = element.get("count")
+    if count and values is not None and int(count):
+        return max(1, values // int(count))
+    return LIST_TAG_WIDTHS.get(tag, 1)
+
+
+def _count_tokens(text):
+    """Number of whitespace-separated tokens, counted on bytes without parsing them."""
+    total = 0
+    previous_ws = True
+    for chunk in _iter_text_chunks(text, TEXT_CHUNK_CHARS):
+        b = np.frombuffer(chunk.encode("ascii", "ignore"), dtype=np.uint8)
+        if not b.size:
+            continue
+        ws = (b == 32) | (b == 10) | (b == 9) | (b == 13)
+        starts = ~ws & np.concatenate(([previous_ws], ws[:-1]))
+        total += int(np.count_nonzero(starts))
+        previous_ws = bool(ws[-1])
+    return total
+
+
+def _iter_text_chunks(text, chunk_chars):
+    """Slices text at whitespace so no number is split across chunks."""
+    start = 0
+    n = len(text)
+    while start < n:
+        end = min(start + chunk_chars, n)
+        if end < n:
+            ws = _whitespace.search(text, end)
+            end = ws.start() if ws else n
+        yield text[start:end]
+        start = end
+
+
+class _StridedRows:
+    """
+    Accumulates rows while keeping at most max_rows of them: rows whose global
+    index is a multiple of `stride` are kept, and the stride doubles (dropping
+    every other kept row) whenever the cap is exceeded. Works without knowing
+    the total row count up front.
+    """
+
+    def __init__(self, width, dtype, max_rows, stride=1):
+        self.width = width
+        self.dtype = dtype
+        self.max_rows = max(1, max_rows) if max_rows else None
+        self.stride = stride
+        self.rows_seen = 0
+        self.kept_rows = 0
+        self._parts = []
+        self._carry = np.empty(0, dtype=dtype)
+
+    def add_values(self, values):
+        if self._carry.size:
+            values = np.concatenate((self._carry, values))
+        full = (values.size // self.width) * self.width
+        self._carry = values[full:].copy()
+        self.add_rows(values[:full].reshape(-1, self.width))
+
+    def add_rows(self, rows):
+        first = (-self.rows_seen) % self.stride
+        kept = rows[first :: self.stride]
+        self.rows_seen += len(rows)
+        if len(kept):
+            self._parts.append(kept.copy() if self.stride > 1 else kept)
+            self.kept_rows += len(kept)
+        while self.max_rows is not None and self.kept_rows > self.max_rows:
+            merged = np.concatenate(self._parts)[::2]
+            self._parts = [merged]
+            self.kept_rows = len(merged)
+            self.stride *= 2
+
+    def result(self):
+        if self._carry.size:
+            logger.debug("Ignoring %d trailing values", self._carry.size)
+        if not self._parts:
+            return np.empty((0, self.width), dtype=self.dtype)
+        if len(self._parts) == 1:
+            return self._parts[0]
+        return np.concatenate(self._parts)
+
+
+def _initial_stride(total_rows, max_rows):
+    if not max_rows or total_rows is None or total_rows <= max_rows:
+        return 1
+    return -(-total_rows // max_rows)
+
+
+def _max_rows(max_bytes, width, dtype):
+    if not max_bytes:
+        return None
+    return max(1, max_bytes // (width * dtype.itemsize))
+
+
+def _decode_text(element, max_bytes):
+    text = element.text
+    count = int(element.get("count")) if element.get("count") else None
+    dtype = np.dtype("f8")
+    if not max_bytes:
+        # Whole-array fast path: one C-level parse, no Python float objects.
+        values = np.fromstring(text, dtype=dtype, sep=" ")
+        width = _text_width(element, values.size)
+        rows = values[: (values.size // width) * width].reshape(-1, width)
+        return rows, len(rows), 1
+
+    # Counting tokens is a cheap byte scan; it gives the row width for counted
+    # arrays and an exact stride up front instead of repeated halving.
+    tokens = _count_tokens(text)
+    width = LIST_TAG_WIDTHS.get(etree.QName(element).localname, 1)
+    if count:
+        width = max(1, tokens // count)
+    max_rows = _max_rows(max_bytes, width, dtype)
+    acc = _StridedRows(width, dtype, max_rows, _initial_stride(tokens // width, max_rows))
+    for chunk in _iter_text_chunks(text, TEXT_CHUNK_CHARS):
+        acc.add_values(np.fromstring(chunk, dtype=dtype, sep=" "))
+    return acc.result(), acc.rows_seen, acc.stride
+
+
+def _decode_binary(element, max_bytes):
+    tag = etree.QName(element).localname
+    count = int(element.get("count"))
+    size_element = int(element.get("sizeElement"))
+    scalar = BINARY_TAG_DTYPES.get(tag, DEFAULT_BINARY_DTYPE)
+    if size_element % scalar.itemsize:
+        # e.g. a 3-byte row where doubles were expected: fall back to raw bytes
+        scalar = np.dtype("u1")
+    width = max(1, size_element // scalar.itemsize)
+
+    text = element.text
+    if _whitespace.search(text):
+        text = _whitespace.sub("", text)
+
+    if not max_bytes:
+        raw = base64.b64decode(text)
+        values = np.frombuffer(raw, dtype=scalar)
+        rows = values[: (values.size // width) * width].reshape(-1, width)
+        return rows, len(rows), 1
+
+    max_rows = _max_rows(max_bytes, width, scalar)
+    acc = _StridedRows(width, scalar, max_rows, _initial_stride(count, max_rows))
+    leftover = b""
+    for start in range(0, len(text), BINARY_CHUNK_CHARS):
+        raw = leftover + base64.b64decode(text[start : start + BINARY_CHUNK_CHARS])
+        usable = (len(raw) // scalar.itemsize) * scalar.itemsize
+        leftover = raw[usable:]
+        acc.add_values(np.frombuffer(raw[:usable], dtype=scalar))
+    return acc.result(), acc.rows_seen, acc.stride
+
+
+def decode_array(element, max_bytes=None):
+    """
+    Decodes one array element into a DecodedArray.
+
+    Args:
+        element: an element for which is_array_element() is true.
+        max_bytes (int, optional): cap on the decoded array's size. Larger
+            arrays are uniformly downsampled (every stride-th row) while
+            decoding, so the full array is never materialised.
+    """
+    binary = "sizeElement" in element.attrib
+    with stage_timer("arrays.decode"):
+        if binary:
+            data, total_rows, stride = _decode_binary(element, max_bytes)
+        else:
+            data, total_rows, stride = _decode_text(element, max_bytes)
+    return DecodedArray(element, data, total_rows, stride, "base64" if binary else "text")
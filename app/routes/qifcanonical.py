@@ -0,0 +1,91 @@
+"""
+Canonical fingerprints of QIF documents: the sha256 of the document's
+C14N 2.0 form, so files that differ only in formatting fingerprint the same.
+
+The file is fed to lxml's C14N 2.0 writer a chunk at a time and its output
+hashed as it is written; no tree is built. Canonicalisation sorts attributes,
+drops comments, strips the whitespace around text (indentation and line
+breaks) and rewrites namespace prefixes to n0, n1... in order of use, so
+qif:Name and a default-namespace Name are the same element. Volatile fields
+(strip, e.g. "Version/TimeCreated", paths of local names below QIFDocument)
+are left out together with their subtrees.
+"""
+
+import hashlib
+from lxml import etree
+
+_CHUNK = 1024 * 1024
+
+
+def _localname(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+class _StripTarget:
+    """Parser target forwarding events to `target`, except for the subtrees at `strip` paths."""
+
+    def __init__(self, target, strip):
+        self._target = target
+        self._strip = {tuple(path.split("/")) for path in strip}
+        self._path = []  # local names from the root element down
+        self._skip = 0  # depth inside a stripped subtree
+        self._ns = []  # declarations for the next start(), dropped with a stripped element
+
+    def start_ns(self, prefix, uri):
+        if not self._skip:
+            self._ns.append((prefix, uri))
+
+    def start(self, tag, attrib):
+        if self._skip:
+            self._skip += 1
+            return
+        ns, self._ns = self._ns, []
+        self._path.append(_localname(tag))
+        if tuple(self._path[1:]) in self._strip:
+            self._path.pop()
+            self._skip = 1
+            return
+        for prefix, uri in ns:
+            self._target.start_ns(prefix, uri)
+        self._target.start(tag, attrib)
+
+    def end(self, tag):
+        if self._skip:
+            self._skip -= 1
+            return
+        self._path.pop()
+        self._target.end(tag)
+
+    def data(self, data):
+        if not self._skip:
+            self._target.data(data)
+
+    def pi(self, target, data):
+        if not self._skip:
+            self._target.pi(target, data)
+
+    def close(self):
+        return self._target.close()
+
+
+def canonical_fingerprint(path, strip=()):
+    """
+    sha256 hex digest of the C14N 2.0 form of the XML file at path, without
+    the elements at the `strip` paths. Raises etree.XMLSyntaxError for a
+    file that is not well-formed.
+    """
+    digest = hashlib.sha256()
+    target = etree.C14NWriterTarget(
+        lambda text: digest.update(text.encode("utf-8")),
+        with_comments=False,
+        strip_text=True,
+        rewrite_prefixes=True,
+    )
+    if strip:
+        target = _StripTarget(target, strip)
+    parser = etree.XMLParser(target=target, huge_tree=True)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            parser.feed(chunk)
+    parser.close()
+    return digest.hexdigest()
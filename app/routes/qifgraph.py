@@ -0,0 +1,492 @@
+import threading
+import logging
+from collections import OrderedDict, Counter
+import numpy as np
+from lxml import etree
+from .metrics import stage_timer
+from .response_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+QIF_NS = "{http://qifstandards.org/xsd/qif3}"
+
+# Children whose text names the element that owns them.
+NAME_TAGS = ("Name", "FeatureName")
+
+# Children of an ExternalQIFDocument that identify the document it stands for.
+EXTERNAL_TAGS = ("QPId", "URI")
+
+DIRECTIONS = ("impact", "depends")
+
+
+def _local(tag):
+    return tag[tag.rfind("}") + 1 :] if isinstance(tag, str) else None
+
+
+def _csr(keys, values, n):
+    """(offsets, values sorted by key) so values[offsets[i]:offsets[i + 1]] belong to key i."""
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return offsets, values[order], order
+
+
+class ReferenceGraph:
+    """
+    Every element with an id in one QIF document, and every reference between
+    them, held in flat arrays:
+
+        ids[i], tags[i] (index into tag_names), sections[i] (index into
+        section_names), names[i]
+        out_offsets / out_targets / out_labels  edges i -> j ("i references j"), CSR
+        in_offsets / in_sources / in_labels     the same edges reversed
+
+    A reference is any leaf element named Id or *Id whose text is an id, e.g.
+    <FeatureNominalId>, <CharacteristicItemId>, or the <Id> entries of
+    <FeatureNominalIds>, <Reference> and the like. Its source is the nearest
+    enclosing element with an id and its label is the element name (the
+    parent's name for a bare <Id>). References to ids that are not in the
+    document are counted per label in `dangling`.
+
+    A reference into another document (<CharacteristicItemId xId="5">1</...>)
+    is an edge to the local ExternalQIFDocument (id 1) whose out_xids /
+    in_xids entry is the id in the other document (5; -1 for local edges).
+    `qpid` is the document's own QPId and `external` maps the id of each
+    ExternalQIFDocument to (QPId, URI), QPIds in lower case; see qifset for
+    following them across files. `values` and `statuses` hold, by node index,
+    the <Value> child and the first *StatusEnum (PASS, FAIL...) of elements
+    that have them, e.g. characteristic measurements.
+    """
+
+    def __init__(
+        self,
+        ids,
+        tags,
+        tag_names,
+        sections,
+        section_names,
+        names,
+        src,
+        dst,
+        labels,
+        label_names,
+        dangling,
+        xids=None,
+        qpid=None,
+        external=None,
+        values=None,
+        statuses=None,
+    ):
+        self.ids = ids
+        self.tags = tags
+        self.tag_names = tag_names
+        self.sections = sections
+        self.section_names = section_names
+        self.names = names
+        self.label_names = label_names
+        self.dangling = dangling
+        self.qpid = qpid
+        self.external = external or {}
+        self.values = values or {}
+        self.statuses = statuses or {}
+        if xids is None:
+            xids = np.full(len(src), -1, dtype=np.int64)
+        n = len(ids)
+        self.out_offsets, self.out_targets, order = _csr(src, dst, n)
+        self.out_labels = labels[order]
+        self.out_xids = xids[order]
+        self.in_offsets, self.in_sources, order = _csr(dst, src, n)
+        self.in_labels = labels[order]
+        self.in_xids = xids[order]
+        self._id_order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._id_order]
+
+    @classmethod
+    def from_file(cls, path):
+        """Builds the graph in one streaming pass; elements are freed as soon as they end."""
+        ids = []
+        tags = []
+        sections = []
+        names = []
+        owners = []  # stack of (node index, depth) for open elements with an id
+        ref_src = []
+        ref_ids = []
+        ref_labels = []
+        ref_xids = []
+        qpid = None
+        external = {}  # ExternalQIFDocument id -> {"QPId": ..., "URI": ...}
+        values = {}
+        statuses = {}
+        tag_codes = {}
+        section_codes = {}
+        label_codes = {}
+        path_tags = []  # local names of the open elements
+        section = -1
+
+        with stage_timer("graph.build"):
+            for event, element in etree.iterparse(
+                path, events=("start", "end"), huge_tree=True, remove_comments=True
+            ):
+                local = _local(element.tag)
+                if local is None:
+                    continue
+                if event == "start":
+                    path_tags.append(local)
+                    depth = len(path_tags)
+                    if depth == 2:
+                        section = section_codes.setdefault(local, len(section_codes))
+                    elem_id = element.get("id")
+                    if elem_id is not None and elem_id.isdigit():
+                        owners.append((len(ids), depth))
+                        ids.append(int(elem_id))
+                        tags.append(tag_codes.setdefault(local, len(tag_codes)))
+                        sections.append(section)
+                        names.append(None)
+                    continue
+
+                depth = len(path_tags)
+                if owners and owners[-1][1] == depth:
+                    owners.pop()
+                elif depth == 2 and local == "QPId" and element.text:
+                    qpid = element.text.strip().lower()
+                elif owners:
+                    owner, owner_depth = owners[-1]
+                    text = element.text
+                    if (
+                        local in EXTERNAL_TAGS
+                        and owner_depth == depth - 1
+                        and path_tags[-2] == "ExternalQIFDocument"
+                        and text
+                    ):
+                        external.setdefault(ids[owner], {})[local] = text.strip()
+                    elif local.endswith("Id") and len(element) == 0 and text:
+                        text = text.strip()
+                        if text.isdigit():
+                            label = path_tags[-2] if local == "Id" else local
+                            xid = element.get("xId")
+                            ref_src.append(owner)
+                            ref_ids.append(int(text))
+                            ref_labels.append(label_codes.setdefault(label, len(label_codes)))
+                            ref_xids.append(int(xid) if xid and xid.isdigit() else -1)
+                    elif local in NAME_TAGS and owner_depth == depth - 1 and text:
+                        names[owner] = text.strip()
+                    elif local == "Value" and owner_depth == depth - 1 and text and text.strip():
+                        values[owner] = text.strip()
+                    elif local.endswith("StatusEnum") and owner not in statuses and text:
+                        statuses[owner] = text.strip()
+                path_tags.pop()
+                if depth > 2:
+                    element.clear()
+                    parent = element.getparent()
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+        ids = np.array(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        ref_ids = np.array(ref_ids, dtype=np.int64)
+        pos = np.searchsorted(sorted_ids, ref_ids)
+        pos_clipped = np.minimum(pos, max(len(sorted_ids) - 1, 0))
+        found = (
+            (pos < len(sorted_ids)) & (sorted_ids[pos_clipped] == ref_ids)
+            if len(sorted_ids)
+            else np.zeros(len(ref_ids), dtype=bool)
+        )
+        label_names = list(label_codes)
+        labels = np.array(ref_labels, dtype=np.int16)
+        xids = np.array(ref_xids, dtype=np.int64)
+        dangling = Counter(label_names[code] for code in labels[~found])
+        return cls(
+            ids=ids,
+            tags=np.array(tags, dtype=np.int16),
+            tag_names=list(tag_codes),
+            sections=np.array(sections, dtype=np.int8),
+            section_names=list(section_codes),
+            names=names,
+            src=np.array(ref_src, dtype=np.int32)[found],
+            dst=order[pos_clipped[found]].astype(np.int32),
+            labels=labels[found],
+            label_names=label_names,
+            dangling=dict(dangling),
+            xids=xids[found],
+            qpid=qpid,
+            external={
+                ext_id: (fields["QPId"].lower(), fields.get("URI"))
+                for ext_id, fields in external.items()
+                if "QPId" in fields
+            },
+            values=values,
+            statuses=statuses,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_targets)
+
+    def index_of(self, element_id):
+        """Node index for a QIF id, or None."""
+        try:
+            element_id = int(element_id)
+        except (TypeError, ValueError):
+            return None
+        pos = np.searchsorted(self._sorted_ids, element_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == element_id:
+            return int(self._id_order[pos])
+        return None
+
+    def node(self, i):
+        return {
+            "id": int(self.ids[i]),
+            "tag": self.tag_names[self.tags[i]],
+            "name": self.names[i],
+            "section": self.section_names[self.sections[i]] if self.sections[i] >= 0 else None,
+        }
+
+    def _adjacency(self, direction):
+        if direction == "depends":
+            return self.out_offsets, self.out_targets
+        return self.in_offsets, self.in_sources
+
+    def reachable(self, start, direction="impact", max_depth=None):
+        """
+        Breadth-first closure from node index `start`. "impact" follows edges
+        backwards (everything that references start, directly or not, i.e.
+        what depends on it); "depends" follows them forwards.
+        Returns (node indices, depths) in BFS order, start excluded.
+        """
+        offsets, neighbours = self._adjacency(direction)
+        seen = np.zeros(len(self.ids), dtype=bool)
+        seen[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        found, depths = [], []
+        depth = 0
+        while frontier.size and (max_depth is None or depth < max_depth):
+            depth += 1
+            starts = offsets[frontier]
+            counts = offsets[frontier + 1] - starts
+            if not counts.sum():
+                break
+            # Gather all neighbours of the frontier at once: for frontier node k,
+            # positions starts[k] .. starts[k] + counts[k] - 1.
+            before = np.cumsum(counts) - counts
+            idx = np.repeat(starts - before, counts) + np.arange(counts.sum())
+            nxt = np.unique(neighbours[idx])
+            nxt = nxt[~seen[nxt]]
+            seen[nxt] = True
+            found.append(nxt)
+            depths.append(np.full(nxt.size, depth, dtype=np.int32))
+            frontier = nxt
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(found), np.concatenate(depths)
+
+    def edges_of(self, i, direction="depends"):
+        """[(label, node index)] of the direct references from (depends) or to (impact) node i."""
+        if direction == "depends":
+            offsets, neighbours, labels = self.out_offsets, self.out_targets, self.out_labels
+        else:
+            offsets, neighbours, labels = self.in_offsets, self.in_sources, self.in_labels
+        lo, hi = offsets[i], offsets[i + 1]
+        return [
+            (self.label_names[label], int(j)) for label, j in zip(labels[lo:hi], neighbours[lo:hi])
+        ]
+
+    def summary(self):
+        """Counts per element tag, section and reference label, plus dangling references."""
+        tag_counts = np.bincount(self.tags, minlength=len(self.tag_names))
+        label_counts = np.bincount(self.out_labels, minlength=len(self.label_names))
+        section_counts = np.bincount(
+            self.sections[self.sections >= 0], minlength=len(self.section_names)
+        )
+        return {
+            "nodes": len(self),
+            "edges": self.edge_count,
+            "sections": {
+                name: count
+                for name, count in zip(self.section_names, section_counts.tolist())
+                if count
+            },
+            "tags": dict(zip(self.tag_names, tag_counts.tolist())),
+            "references": dict(zip(self.label_names, label_counts.tolist())),
+            "dangling": self.dangling,
+            "unreferenced": int(np.count_nonzero(np.diff(self.in_offsets) == 0)),
+        }
+
+    def query(self, element_id, direction="impact", max_depth=None):
+        """Reachability from one element, as JSON-ready dicts grouped by depth."""
+        i = self.index_of(element_id)
+        if i is None:
+            return None
+        nodes, depths = self.reachable(i, direction, max_depth)
+        by_tag = Counter(self.tag_names[t] for t in self.tags[nodes])
+        return {
+            "element": self.node(i),
+            "direction": direction,
+            "count": int(nodes.size),
+            "by_tag": dict(by_tag),
+            "references": [
+                {"label": label, **self.node(j)} for label, j in self.edges_of(i, "depends")
+            ],
+            "referenced_by": [
+                {"label": label, **self.node(j)} for label, j in self.edges_of(i, "impact")
+            ],
+            "nodes": [dict(self.node(j), depth=int(d)) for j, d in zip(nodes, depths)],
+        }
+
+    # -------------------------------------------------------------------------
+    # EXPORT
+    # -------------------------------------------------------------------------
+
+    def _zones(self, sections):
+        present = sorted(set(int(s) for s in sections if s >= 0))
+        zones = [{"name": self.section_names[s]} for s in present]
+        return zones, {s: z + 1 for z, s in enumerate(present)}
+
+    def export_tree(self, element_id=None, depth=2, max_nodes=200):
+        """
+        Data for the digital_pipelines p5 tree view ({zones, nodes, connections},
+        as in pipeline_layout.PIPELINE_NODES). Connections point from the
+        referenced element to the one referencing it, so definitions sit above
+        the items and measurements built on them.
+
+        With element_id: that element plus everything within `depth` steps in
+        either direction, at most max_nodes. Without: one node per element tag
+        and one connection per (tag, referenced tag) pair, annotated with counts.
+        """
+        if element_id is None:
+            return self._export_types()
+        i = self.index_of(element_id)
+        if i is None:
+            return None
+        up, up_depths = self.reachable(i, "depends", depth)
+        down, down_depths = self.reachable(i, "impact", depth)
+        # Nearest first, so a truncated export keeps the closest neighbourhood.
+        candidates = np.concatenate(([i], up, down))
+        order = np.argsort(np.concatenate(([0], up_depths, down_depths)), kind="stable")
+        candidates = candidates[order]
+        _, first = np.unique(candidates, return_index=True)
+        candidates = candidates[np.sort(first)]
+        truncated = candidates.size > max_nodes
+        keep = np.sort(candidates[:max_nodes])
+        in_keep = np.zeros(len(self.ids), dtype=bool)
+        in_keep[keep] = True
+
+        zones, zone_of = self._zones(self.sections[keep])
+        nodes = {}
+        for j in keep:
+            tag = self.tag_names[self.tags[j]]
+            qif_id = int(self.ids[j])
+            nodes[qif_id] = {
+                "id": qif_id,
+                "title": tag,
+                "version": self.names[j] or f"#{qif_id}",
+                "type": "Element",
+                "PMI": "Characteristic" in tag,
+                "proprietary": True,
+                "zone": zone_of.get(int(self.sections[j]), 1),
+                "failure_mode": bool(j == i),
+            }
+        connections = []
+        for j in keep:
+            lo, hi = self.out_offsets[j], self.out_offsets[j + 1]
+            for target, label in zip(self.out_targets[lo:hi], self.out_labels[lo:hi]):
+                if in_keep[target]:
+                    connections.append(
+                        {
+                            "from": int(self.ids[target]),
+                            "to": int(self.ids[j]),
+                            "type": "strong",
+                            "label": self.label_names[label],
+                        }
+                    )
+        return {
+            "zones": zones,
+            "nodes": nodes,
+            "connections": connections,
+            "truncated": bool(truncated),
+        }
+
+    def _export_types(self):
+        n_tags = len(self.tag_names)
+        src_tags = np.repeat(self.tags, np.diff(self.out_offsets)).astype(np.int64)
+        dst_tags = self.tags[self.out_targets].astype(np.int64)
+        pairs = np.bincount(dst_tags * n_tags + src_tags, minlength=n_tags * n_tags)
+        tag_counts = np.bincount(self.tags, minlength=n_tags)
+        # A tag's zone is the section most of its elements are in.
+        tag_sections = np.full(n_tags, -1, dtype=np.int64)
+        for t in range(n_tags):
+            s = self.sections[self.tags == t]
+            s = s[s >= 0]
+            if s.size:
+                tag_sections[t] = np.bincount(s).argmax()
+        zones, zone_of = self._zones(tag_sections)
+        nodes = {
+            t + 1: {
+                "id": t + 1,
+                "title": self.tag_names[t],
+                "version": f"x{int(tag_counts[t])}",
+                "type": "Element",
+                "PMI": "Characteristic" in self.tag_names[t],
+                "proprietary": True,
+                "zone": zone_of.get(int(tag_sections[t]), 1),
+                "failure_mode": False,
+            }
+            for t in range(n_tags)
+        }
+        connections = []
+        for code in np.flatnonzero(pairs):
+            dst, src = divmod(int(code), n_tags)
+            if dst == src:
+                continue
+            connections.append(
+                {
+                    "from": dst + 1,
+                    "to": src + 1,
+                    "type": "strong" if pairs[code] >= tag_counts[src] else "weak",
+                    "count": int(pairs[code]),
+                }
+            )
+        return {
+            "zones": zones,
+            "nodes": nodes,
+            "connections": connections,
+            "truncated": False,
+        }
+
+
+class _GraphCache:
+    """Built graphs keyed by file digest; small, since the arrays are compact."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            graph = self._entries.get(digest)
+            if graph is not None:
+                self._entries.move_to_end(digest)
+            return graph
+
+    def put(self, digest, graph):
+        with self._lock:
+            self._entries[digest] = graph
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+graph_cache = _GraphCache()
+
+
+def reference_graph(path):
+    """The ReferenceGraph of path, built once per file content."""
+    digest = file_digest(path)
+    graph = graph_cache.get(digest)
+    if graph is None:
+        graph = ReferenceGraph.from_file(path)
+        graph_cache.put(digest, graph)
+    return graph
@@ -0,0 +1,549 @@
+"""
+Line-level diff of the raw XML of two files, for /qif/raw-diff.
+
+Both files are mapped read-only and indexed by the byte offset of each line,
+so a line is only read (and decoded) when its row is rendered; nothing holds
+either file as a list of lines. The identical head and tail are found by
+comparing the mappings a megabyte at a time and only the changed middle is
+hashed, one int64 per line. That middle is diffed patience-style: lines
+occurring exactly once in each side anchor the alignment (longest increasing
+subsequence), and the gaps between anchors are diffed with the linear-space
+Myers algorithm (middle snake, divide and conquer). A gap whose edit distance
+exceeds `max_cost` is reported as one replaced block instead.
+
+The result is a list of opcodes grouped into hunks with `context` lines
+around each change; RawDiff.page() lays out one page of side-by-side rows.
+"""
+
+import bisect
+import difflib
+import mmap
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_CHUNK = 1024 * 1024  # bytes compared / scanned per step
+_INTRALINE_MAX = 400  # longer replaced lines are not highlighted within the line
+_SMALL_GAP = 64  # gaps this small go straight to Myers
+
+
+class DiffTooCostly(Exception):
+    pass
+
+
+class LineFile:
+    """
+    A file mapped read-only, with `offsets`: where each line starts, plus the
+    file size at the end. Pass the offsets from an earlier LineFile of the
+    same content to skip scanning for newlines.
+    """
+
+    def __init__(self, path, offsets=None):
+        self.path = path
+        with open(path, "rb") as f:
+            self.size = f.seek(0, 2)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.data = memoryview(self._mm) if self._mm is not None else memoryview(b"")
+        self.offsets = offsets if offsets is not None else self._index()
+
+    def _index(self):
+        # uint32 offsets halve the index for files under 4 GB
+        dtype = np.uint32 if self.size < 2**32 else np.int64
+        buf = np.frombuffer(self.data, dtype=np.uint8)
+        parts = [np.zeros(1, dtype=dtype)]
+        for offset in range(0, self.size, _CHUNK):
+            parts.append((np.flatnonzero(buf[offset : offset + _CHUNK] == 10) + offset + 1).astype(dtype))
+        offsets = np.concatenate(parts)
+        if offsets[-1] != self.size:
+            offsets = np.append(offsets, np.array([self.size], dtype=dtype))  # last line without a newline
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, i):
+        return self.data[int(self.offsets[i]) : int(self.offsets[i + 1])]
+
+    def text(self, i, max_chars=None):
+        """Line i decoded, without its line ending; cut to max_chars (+ "…")."""
+        line = self.line(i)
+        if max_chars is not None and len(line) > 4 * max_chars:
+            line = line[: 4 * max_chars]
+        text = bytes(line).decode("utf-8", "replace").rstrip("\r\n")
+        if max_chars is not None and len(text) > max_chars:
+            text = text[:max_chars] + "\u2026"
+        return text
+
+    def hashes(self, lo, hi):
+        """int64 hash of each line in [lo, hi)."""
+        bounds, data = self.offsets[lo : hi + 1].tolist(), self.data
+        lines = map(data.__getitem__, map(slice, bounds, bounds[1:]))
+        return np.fromiter(map(hash, lines), dtype=np.int64, count=hi - lo)
+
+    def close(self):
+        self.data.release()
+        if self._mm is not None:
+            self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _common_prefix(a, b, limit):
+    """Length of the common leading bytes of memoryviews a and b, at most `limit`."""
+    pos = 0
+    while pos < limit:
+        n = min(_CHUNK, limit - pos)
+        if a[pos : pos + n] != b[pos : pos + n]:
+            x = np.frombuffer(a[pos : pos + n], dtype=np.uint8)
+            y = np.frombuffer(b[pos : pos + n], dtype=np.uint8)
+            return pos + int(np.argmax(x != y))
+        pos += n
+    return limit
+
+
+def _common_suffix(a, b, limit):
+    """Length of the common trailing bytes of memoryviews a and b, at most `limit`."""
+    la, lb = len(a), len(b)
+    pos = 0
+    while pos < limit:
+        n = min(_CHUNK, limit - pos)
+        x, y = a[la - pos - n : la - pos], b[lb - pos - n : lb - pos]
+        if x != y:
+            x = np.frombuffer(x, dtype=np.uint8)[::-1]
+            y = np.frombuffer(y, dtype=np.uint8)[::-1]
+            return pos + int(np.argmax(x != y))
+        pos += n
+    return limit
+
+
+def _unique_anchors(a, b):
+    """
+    Arrays (i, j) of the lines occurring exactly once in both a and b, in
+    the longest order-preserving chain (patience diff).
+    """
+    ua, ia, ca = np.unique(a, return_index=True, return_counts=True)
+    ub, ib, cb = np.unique(b, return_index=True, return_counts=True)
+    ua, ia = ua[ca == 1], ia[ca == 1]
+    ub, ib = ub[cb == 1], ib[cb == 1]
+    _, xa, xb = np.intersect1d(ua, ub, assume_unique=True, return_indices=True)
+    order = np.argsort(ia[xa])
+    pa, pb = ia[xa][order], ib[xb][order]
+    if np.all(pb[1:] > pb[:-1]):
+        return pa, pb  # already in order, as when lines were edited rather than moved
+
+    # longest increasing subsequence of pb
+    tails, tail_at, back = [], [], [-1] * len(pb)
+    for k, j in enumerate(pb.tolist()):
+        pos = bisect.bisect_left(tails, j)
+        back[k] = tail_at[pos - 1] if pos else -1
+        if pos == len(tails):
+            tails.append(j)
+            tail_at.append(k)
+        else:
+            tails[pos] = j
+            tail_at[pos] = k
+    chain = []
+    k = tail_at[-1]
+    while k >= 0:
+        chain.append(k)
+        k = back[k]
+    chain.reverse()
+    return pa[chain], pb[chain]
+
+
+def _anchored_gaps(a, b, pa, pb):
+    """
+    The gaps between anchors that still need diffing, as (i1, i2, j1, j2).
+    Gaps the same length on both sides holding the same lines are matches
+    too, so the runs between the returned gaps all match line for line.
+    """
+    start_a = np.concatenate(([0], pa + 1))
+    end_a = np.concatenate((pa, [len(a)]))
+    start_b = np.concatenate(([0], pb + 1))
+    end_b = np.concatenate((pb, [len(b)]))
+    len_a, len_b = end_a - start_a, end_b - start_b
+
+    equal = len_a == len_b
+    check = np.flatnonzero(equal & (len_a > 0))
+    if len(check):
+        lengths = len_a[check]
+        first = np.cumsum(lengths) - lengths
+        within = np.arange(lengths.sum()) - np.repeat(first, lengths)
+        same = a[np.repeat(start_a[check], lengths) + within] == b[
+            np.repeat(start_b[check], lengths) + within
+        ]
+        equal[check] = np.logical_and.reduceat(same, first)
+    gaps = np.flatnonzero(~equal)
+    return list(zip(start_a[gaps].tolist(), end_a[gaps].tolist(), start_b[gaps].tolist(), end_b[gaps].tolist()))
+
+
+def _middle_snake(a, b, left, top, right, bottom, max_cost):
+    """
+    Myers' middle snake of the box a[left:right] x b[top:bottom]: the
+    ((x1, y1), (x2, y2)) of a step through the middle of a shortest edit path,
+    found by searching from both corners in O(N + M) space.
+    """
+    width, height = right - left, bottom - top
+    size = width + height
+    delta = width - height
+    limit = (size + 1) // 2
+    vf = [0] * (2 * limit + 2)
+    vb = [0] * (2 * limit + 2)
+    vf[1] = left
+    vb[1] = bottom
+    odd = delta % 2 == 1
+
+    for d in range(limit + 1):
+        if 2 * d > max_cost:
+            raise DiffTooCostly(d)
+        for k in range(d, -d - 1, -2):
+            c = k - delta
+            if k == -d or (k != d and vf[k - 1] < vf[k + 1]):
+                px = x = vf[k + 1]
+            else:
+                px = vf[k - 1]
+                x = px + 1
+            y = top + (x - left) - k
+            py = y if d == 0 or x != px else y - 1
+            while x < right and y < bottom and a[x] == b[y]:
+                x += 1
+                y += 1
+            vf[k] = x
+            if odd and -(d - 1) <= c <= d - 1 and y >= vb[c]:
+                return (px, py), (x, y)
+
+        for c in range(d, -d - 1, -2):
+            k = c + delta
+            if c == -d or (c != d and vb[c - 1] > vb[c + 1]):
+                py = y = vb[c + 1]
+            else:
+                py = vb[c - 1]
+                y = py - 1
+            x = left + (y - top) + k
+            px = x if d == 0 or y != py else x + 1
+            while x > left and y > top and a[x - 1] == b[y - 1]:
+                x -= 1
+                y -= 1
+            vb[c] = y
+            if not odd and -d <= k <= d and x <= vf[k]:
+                return (x, y), (px, py)
+    raise AssertionError("no middle snake")
+
+
+def _edit_path(a, b, left, top, right, bottom, max_cost):
+    """Corners of a shortest edit path through the box, split at middle snakes."""
+    if left == right or top == bottom:
+        return [(left, top), (right, bottom)]
+    start, finish = _middle_snake(a, b, left, top, right, bottom, max_cost)
+    return _edit_path(a, b, left, top, *start, max_cost) + _edit_path(
+        a, b, *finish, right, bottom, max_cost
+    )
+
+
+def _myers(a, b, max_cost):
+    """Matching (i, j, n) blocks of lists a and b along a shortest edit path."""
+    blocks = []
+
+    def diagonal(x, y, x_end, y_end):
+        run = 0
+        while x + run < x_end and y + run < y_end and a[x + run] == b[y + run]:
+            run += 1
+        if run:
+            blocks.append((x, y, run))
+        return x + run, y + run
+
+    path = _edit_path(a, b, 0, 0, len(a), len(b), max_cost)
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        # each step is (diagonal) edit (diagonal); the diagonals are matches
+        x1, y1 = diagonal(x1, y1, x2, y2)
+        if x2 - x1 > y2 - y1:
+            x1 += 1
+        elif y2 - y1 > x2 - x1:
+            y1 += 1
+        diagonal(x1, y1, x2, y2)
+    return blocks
+
+
+def _common_run(a, b):
+    """Length of the common leading elements of int64 arrays a and b."""
+    n = min(len(a), len(b))
+    differ = np.flatnonzero(a[:n] != b[:n])
+    return int(differ[0]) if len(differ) else n
+
+
+def _match_blocks(a, b, max_cost):
+    """Matching (i, j, n) blocks of int64 arrays a and b, in order."""
+    blocks = []
+    # gaps ("gap", alo, ahi, blo, bhi) and ("match", i, j, n), popped in order
+    stack = [("gap", 0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if item[0] == "match":
+            blocks.append(item[1:])
+            continue
+        _, alo, ahi, blo, bhi = item
+        if alo == ahi or blo == bhi:
+            continue  # only inserted or only deleted lines
+        if ahi - alo <= _SMALL_GAP and bhi - blo <= _SMALL_GAP:
+            found = _myers(a[alo:ahi].tolist(), b[blo:bhi].tolist(), max_cost)
+            blocks.extend((alo + i, blo + j, n) for i, j, n in found)
+            continue
+
+        head = _common_run(a[alo:ahi], b[blo:bhi])
+        tail = _common_run(a[alo + head : ahi][::-1], b[blo + head : bhi][::-1])
+        todo = []
+        if head:
+            todo.append(("match", alo, blo, head))
+        alo, blo, ahi, bhi = alo + head, blo + head, ahi - tail, bhi - tail
+
+        if alo < ahi and blo < bhi:
+            pa, pb = _unique_anchors(a[alo:ahi], b[blo:bhi])
+            if len(pa):
+                i, j = alo, blo
+                for i1, i2, j1, j2 in _anchored_gaps(a[alo:ahi], b[blo:bhi], pa, pb):
+                    if i1 + alo > i:
+                        todo.append(("match", i, j, i1 + alo - i))
+                    todo.append(("gap", i1 + alo, i2 + alo, j1 + blo, j2 + blo))
+                    i, j = i2 + alo, j2 + blo
+                if ahi > i:
+                    todo.append(("match", i, j, ahi - i))
+            else:
+                try:
+                    found = _myers(a[alo:ahi].tolist(), b[blo:bhi].tolist(), max_cost)
+                except DiffTooCostly:
+                    found = []  # shown as one replaced block
+                todo.extend(("match", alo + i, blo + j, n) for i, j, n in found)
+
+        if tail:
+            todo.append(("match", ahi, bhi, tail))
+        stack.extend(reversed(todo))
+    return blocks
+
+
+def _opcodes(blocks, len_a, len_b):
+    """difflib-style (tag, i1, i2, j1, j2) opcodes from matching blocks."""
+    merged = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        elif n:
+            merged.append((i, j, n))
+
+    opcodes = []
+    i = j = 0
+    for ai, bj, n in merged + [(len_a, len_b, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(("insert", i, ai, j, bj))
+        i, j = ai + n, bj + n
+        if n:
+            opcodes.append(("equal", ai, i, bj, j))
+    return opcodes
+
+
+def _hunks(opcodes, context):
+    """Opcodes grouped into hunks with `context` equal lines around each change (as difflib)."""
+    codes = list(opcodes)
+    if not any(tag != "equal" for tag, *_ in codes):
+        return []
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    hunks, group = [], []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            hunks.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        hunks.append(group)
+    return hunks
+
+
+def _rows(opcode):
+    tag, i1, i2, j1, j2 = opcode
+    return max(i2 - i1, j2 - j1)
+
+
+class RawDiff:
+    """The hunks of a line diff of two files, laid out a page of rows at a time."""
+
+    def __init__(self, path1, path2, offsets1, offsets2, hunks, stats):
+        self.path1, self.path2 = path1, path2
+        self.offsets1, self.offsets2 = offsets1, offsets2
+        self.hunks = hunks
+        self.stats = stats
+        # first row of each hunk; a page is a slice of these rows
+        self.row_starts = np.cumsum(
+            [0] + [sum(_rows(op) for op in hunk) for hunk in hunks], dtype=np.int64
+        )
+
+    @property
+    def total_rows(self):
+        return int(self.row_starts[-1])
+
+    def pages(self, per_page):
+        return max(1, -(-self.total_rows // per_page))
+
+    def page(self, page, per_page, max_line_chars=2000):
+        """
+        Rows [(page - 1) * per_page, page * per_page) as dicts: a "hunk" row
+        with the unified-diff style header where a hunk starts, then one row
+        per line pair: kind ("equal", "replace", "delete", "insert"), left_no /
+        right_no (1-based, None on the empty side) and left / right as
+        [(text, changed)] segments.
+        """
+        first, last = (page - 1) * per_page, min(page * per_page, self.total_rows)
+        rows = []
+        if first >= last:
+            return rows
+        with LineFile(self.path1, self.offsets1) as a, LineFile(self.path2, self.offsets2) as b:
+            h = int(np.searchsorted(self.row_starts, first, side="right")) - 1
+            row = int(self.row_starts[h])
+            while row < last and h < len(self.hunks):
+                hunk = self.hunks[h]
+                if row >= first:
+                    rows.append({"kind": "hunk", "header": _hunk_header(hunk)})
+                for op in hunk:
+                    n = _rows(op)
+                    if row + n <= first:
+                        row += n
+                        continue
+                    tag, i1, i2, j1, j2 = op
+                    for k in range(max(0, first - row), min(n, last - row)):
+                        i = i1 + k if i1 + k < i2 else None
+                        j = j1 + k if j1 + k < j2 else None
+                        rows.append(_row(tag, a, b, i, j, max_line_chars))
+                    row += n
+                    if row >= last:
+                        break
+                h += 1
+        return rows
+
+
+def _hunk_header(hunk):
+    i1, j1 = hunk[0][1], hunk[0][3]
+    i2, j2 = hunk[-1][2], hunk[-1][4]
+    return f"@@ -{i1 + 1},{i2 - i1} +{j1 + 1},{j2 - j1} @@"
+
+
+def _row(tag, a, b, i, j, max_line_chars):
+    left = a.text(i, max_line_chars) if i is not None else None
+    right = b.text(j, max_line_chars) if j is not None else None
+    if tag == "replace" and left is not None and right is not None:
+        left_segments, right_segments = _intraline(left, right)
+    else:
+        left_segments = [(left, False)] if left is not None else []
+        right_segments = [(right, False)] if right is not None else []
+    return {
+        "kind": tag,
+        "left_no": i + 1 if i is not None else None,
+        "right_no": j + 1 if j is not None else None,
+        "left": left_segments,
+        "right": right_segments,
+    }
+
+
+def _intraline(left, right):
+    """Both lines as [(text, changed)] segments, marking the characters that differ."""
+    if len(left) > _INTRALINE_MAX or len(right) > _INTRALINE_MAX:
+        return [(left, True)], [(right, True)]
+    left_segments, right_segments = [], []
+    matcher = difflib.SequenceMatcher(None, left, right, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        changed = tag != "equal"
+        _append_segment(left_segments, left[i1:i2], changed)
+        _append_segment(right_segments, right[j1:j2], changed)
+    return left_segments, right_segments
+
+
+def _append_segment(segments, text, changed):
+    if not text:
+        return
+    if segments and segments[-1][1] == changed:
+        segments[-1] = (segments[-1][0] + text, changed)
+    else:
+        segments.append((text, changed))
+
+
+def diff_files(path1, path2, context=3, max_cost=1000):
+    """
+    RawDiff of two files. The identical leading and trailing lines are
+    skipped byte-wise before anything is hashed; `max_cost` bounds the edit
+    distance Myers searches for in any one gap between anchors.
+    """
+    started = time.perf_counter()
+    with LineFile(path1) as a, LineFile(path2) as b:
+        prefix = _common_prefix(a.data, b.data, min(a.size, b.size))
+        ends_a, ends_b = a.offsets[1:], b.offsets[1:]
+        head = min(
+            int(np.searchsorted(ends_a, prefix, side="right")),
+            int(np.searchsorted(ends_b, prefix, side="right")),
+        )
+        head_bytes = int(a.offsets[head])
+        suffix = _common_suffix(a.data, b.data, min(a.size, b.size) - head_bytes)
+        starts_a, starts_b = a.offsets[:-1], b.offsets[:-1]
+        tail = min(
+            len(a) - int(np.searchsorted(starts_a, a.size - suffix, side="left")),
+            len(b) - int(np.searchsorted(starts_b, b.size - suffix, side="left")),
+        )
+
+        ahi, bhi = len(a) - tail, len(b) - tail
+        blocks = [(0, 0, head)]
+        if head < ahi and head < bhi:
+            middle = _match_blocks(a.hashes(head, ahi), b.hashes(head, bhi), max_cost)
+            blocks.extend((head + i, head + j, n) for i, j, n in middle)
+        blocks.append((ahi, bhi, tail))
+        opcodes = _opcodes(blocks, len(a), len(b))
+
+        stats = {
+            "lines1": len(a),
+            "lines2": len(b),
+            "bytes1": a.size,
+            "bytes2": b.size,
+            "identical_head": head,
+            "identical_tail": tail,
+            "changed": sum(_rows(op) for op in opcodes if op[0] != "equal"),
+        }
+        offsets1, offsets2 = a.offsets, b.offsets
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return RawDiff(path1, path2, offsets1, offsets2, _hunks(opcodes, context), stats)
+
+
+class _DiffCache:
+    """RawDiffs keyed by the digests of the two files (and the diff options)."""
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+raw_diff_cache = _DiffCache()
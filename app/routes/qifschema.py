@@ -0,0 +1,132 @@
+import os
+from functools import lru_cache
+from lxml import etree
+
+QIF_NS = "{http://qifstandards.org/xsd/qif3}"
+XS = {"xs": "http://www.w3.org/2001/XMLSchema"}
+
+# Schema-only namespace some files declare, and the URI parse_qif() swaps in for
+# it so lxml accepts the document.
+OTHER_NAMESPACE = b"##other"
+OTHER_NAMESPACE_PATCH = b"http://example.com/other"
+
+library_dir = os.path.join(os.getcwd(), "QIF3.0-2018-ANSI", "xsd", "QIFLibrary")
+applications_dir = os.path.join(os.getcwd(), "QIF3.0-2018-ANSI", "xsd", "QIFApplications")
+check_dir = os.path.join(os.getcwd(), "QIF3.0-2018-ANSI", "xsd", "Check")
+
+# Heads of the characteristic substitution groups in Characteristics.xsd. Every
+# concrete characteristic type (Diameter, Circularity, Runout...) declares one
+# element in each group, e.g. <CircularityCharacteristicNominal
+# substitutionGroup="CharacteristicNominal">.
+DEFINITION = "CharacteristicDefinition"
+NOMINAL = "CharacteristicNominal"
+ITEM = "CharacteristicItem"
+MEASUREMENT = "CharacteristicMeasurement"
+CHARACTERISTIC_KINDS = (DEFINITION, NOMINAL, ITEM, MEASUREMENT)
+
+
+@lru_cache(maxsize=None)
+def schema_elements(xsd_name):
+    """(name, substitution group head or None, abstract) of each global element in QIFLibrary/<xsd_name>."""
+    schema = etree.parse(os.path.join(library_dir, xsd_name))
+    elements = []
+    for element in schema.xpath("/xs:schema/xs:element", namespaces=XS):
+        head = element.get("substitutionGroup")
+        elements.append(
+            (
+                element.get("name"),
+                head.rsplit(":", 1)[-1] if head else None,
+                element.get("abstract") == "true",
+            )
+        )
+    return tuple(elements)
+
+
+def schema_element_names(xsd_name):
+    """Names of the global elements declared in QIFLibrary/<xsd_name>."""
+    return tuple(name for name, _, _ in schema_elements(xsd_name))
+
+
+@lru_cache(maxsize=None)
+def substitution_group(xsd_name, head):
+    """
+    Local names of the concrete elements that may stand in for `head`,
+    following nested groups, in schema order.
+    """
+    elements = schema_elements(xsd_name)
+    members = {head}
+    changed = True
+    while changed:
+        changed = False
+        for name, group, _ in elements:
+            if group in members and name not in members:
+                members.add(name)
+                changed = True
+    return tuple(
+        name for name, _, abstract in elements if name in members and not abstract
+    )
+
+
+@lru_cache(maxsize=None)
+def characteristic_tags(kind):
+    """Qualified tags of every concrete element in the `kind` characteristic group, e.g. NOMINAL."""
+    if kind not in CHARACTERISTIC_KINDS:
+        raise ValueError(f"Unknown characteristic kind: {kind}")
+    return tuple(QIF_NS + name for name in substitution_group("Characteristics.xsd", kind))
+
+
+@lru_cache(maxsize=None)
+def document_sections():
+    """Local names of the top-level sections of a QIFDocument (QPId, Header, ... Results), in schema order."""
+    schema = etree.parse(os.path.join(applications_dir, "QIFDocument.xsd"))
+    return tuple(
+        (element.get("name") or element.get("ref")).rsplit(":", 1)[-1]
+        for element in schema.xpath(
+            "/xs:schema/xs:complexType[@name='QIFDocumentType']//xs:element", namespaces=XS
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def schema_complex_types():
+    """
+    {name: (base type or None, {child element name: type})} for every global
+    complexType in QIFLibrary; child elements are the type's own, not inherited.
+    """
+    types = {}
+    for xsd_name in sorted(os.listdir(library_dir)):
+        if not xsd_name.endswith(".xsd"):
+            continue
+        schema = etree.parse(os.path.join(library_dir, xsd_name))
+        for complex_type in schema.xpath("/xs:schema/xs:complexType", namespaces=XS):
+            extension = complex_type.find(".//xs:extension", XS)
+            children = {
+                element.get("name"): element.get("type")
+                for element in complex_type.xpath(".//xs:element[@name]", namespaces=XS)
+            }
+            types[complex_type.get("name")] = (
+                extension.get("base") if extension is not None else None,
+                children,
+            )
+    return types
+
+
+def element_type(complex_type, element_name):
+    """Type of child element_name in complex_type or the nearest base type declaring it, else None."""
+    types = schema_complex_types()
+    while complex_type:
+        base, children = types.get(complex_type, (None, {}))
+        if element_name in children:
+            return children[element_name]
+        complex_type = base
+    return None
+
+
+@lru_cache(maxsize=None)
+def check_transform():
+    """
+    The standard's XSLT checks, compiled: xsd/Check/Check.xsl, which imports the
+    format, quality, semantic and linked document checks. Applied to a
+    QIFDocument it yields a CheckReport.
+    """
+    return etree.XSLT(etree.parse(os.path.join(check_dir, "Check.xsl")))
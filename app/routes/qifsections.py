@@ -0,0 +1,244 @@
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from lxml import etree
+from .qifschema import QIF_NS, OTHER_NAMESPACE, OTHER_NAMESPACE_PATCH, document_sections
+
+logger = logging.getLogger(__name__)
+
+# Pseudo-section for the QIFDocument element's own attributes and namespaces.
+ROOT = "@root"
+
+# Top-level sections each derived result reads; None means the whole document.
+# A result is only recomputed for a new revision of a file when one of its
+# sections changed. These follow where QIF puts things: characteristic
+# definitions, nominals and items in Characteristics, actuals in Results,
+# PMIDisplay in Product.
+SECTION_DEPENDENCIES = {
+    "summary.units": ("FileUnits",),
+    "summary.features": ("Features",),
+    "validation": None,
+    "audit": ("Product", "Features", "Characteristics"),
+    "characteristics": (
+        "DatumDefinitions",
+        "DatumReferenceFrames",
+        "Characteristics",
+        "Results",
+    ),
+    "characteristics.si": (
+        "FileUnits",
+        "Characteristics",
+        "Results",
+    ),
+    "search.characteristic": ("Characteristics",),
+    "search.feature": ("Features",),
+    "search.pmi": ("Product",),
+    "search.id": ("Features", "Characteristics"),
+}
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _root_hash(root):
+    attributes = sorted(root.attrib.items()) + sorted(
+        (prefix or "", uri) for prefix, uri in root.nsmap.items()
+    )
+    return _hash(repr(attributes).encode())
+
+
+def _section_hash(element):
+    return _hash(etree.tostring(element, with_tail=False))
+
+
+class _PatchedReader:
+    """
+    Binary file wrapper applying parse_qif()'s "##other" patch while lxml reads,
+    so the streamed parse sees the same document as parse_qif()'s tree (and
+    accepts it at all: lxml rejects "##other" as a namespace).
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._pending = b""  # tail that may be the start of a split match
+
+    def read(self, size=-1):
+        keep = len(OTHER_NAMESPACE) - 1
+        while True:
+            chunk = self._f.read(size)
+            data = (self._pending + chunk).replace(OTHER_NAMESPACE, OTHER_NAMESPACE_PATCH)
+            if not chunk:
+                self._pending = b""
+                return data
+            data, self._pending = data[:-keep], data[-keep:]
+            if data:
+                return data
+
+
+def _section_key(element, seen):
+    """Local name of a top-level element, suffixed [2], [3]... when the name repeats."""
+    name = etree.QName(element).localname
+    seen[name] = seen.get(name, 0) + 1
+    return name if seen[name] == 1 else f"{name}[{seen[name]}]"
+
+
+def tree_section_hashes(root):
+    """{section: sha256 of its serialised subtree} for an already parsed document, plus ROOT."""
+    hashes = {ROOT: _root_hash(root)}
+    seen = {}
+    for child in root:
+        if not isinstance(child.tag, str):
+            continue  # comments and processing instructions
+        hashes[_section_key(child, seen)] = _section_hash(child)
+    return hashes
+
+
+def section_hashes(path):
+    """
+    tree_section_hashes() for a file, streamed: only the known QIFDocument
+    sections are reported by iterparse, and each top-level subtree is hashed
+    and freed as soon as it ends, so at most one section is held in memory.
+    """
+    tags = [QIF_NS + name for name in document_sections()]
+    hashes = {}
+    seen = {}
+    root = None
+    last = None  # the most recently hashed section, already cleared
+
+    def hash_children(upto=None):
+        # Children after `last` up to `upto` are complete, not yet hashed
+        # sections. Later ones may already exist but still be half parsed.
+        for child in root:
+            if child is last:
+                continue
+            if isinstance(child.tag, str):
+                hashes[_section_key(child, seen)] = _section_hash(child)
+            if child is upto:
+                break
+
+    with open(path, "rb") as f:
+        # Read as parse_qif() does, comments included, so the hashes match
+        # tree_section_hashes() of its tree.
+        source = _PatchedReader(f)
+        for _, element in etree.iterparse(source, events=("end",), tag=tags, huge_tree=True):
+            parent = element.getparent()
+            if parent is None or parent.getparent() is not None:
+                continue  # a nested element that happens to share a section name
+            if root is None:
+                root = parent
+                hashes[ROOT] = _root_hash(root)
+            hash_children(element)
+            element.clear()
+            while element.getprevious() is not None:
+                del root[0]
+            last = element
+        if root is None:
+            # No known section at all: hash whatever the document holds.
+            f.seek(0)
+            return tree_section_hashes(
+                etree.parse(_PatchedReader(f), etree.XMLParser(huge_tree=True)).getroot()
+            )
+    hash_children()
+    return hashes
+
+
+def changed_sections(old, new):
+    """Sections whose hash differs between two section_hashes() results, including added and removed ones."""
+    old = old or {}
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def _base_name(key):
+    return key.split("[", 1)[0]
+
+
+def is_affected(result, changed):
+    """
+    True when `result` (a SECTION_DEPENDENCIES key) has to be recomputed given
+    the changed sections; changed None means nothing is known (a new file).
+    """
+    if changed is None:
+        return True
+    sections = SECTION_DEPENDENCIES[result]
+    if sections is None:
+        return bool(changed)
+    return any(_base_name(key) in sections for key in changed)
+
+
+def dependency_key(result, hashes):
+    """Key identifying the content `result` depends on: the hashes of its sections only."""
+    sections = SECTION_DEPENDENCIES[result]
+    return (
+        result,
+        tuple(
+            (key, digest)
+            for key, digest in sorted(hashes.items())
+            if sections is None or _base_name(key) in sections
+        ),
+    )
+
+
+def canonical_key(result, canonical):
+    """
+    Key for `result` shared by every document with the same canonical
+    fingerprint (canonical is (fingerprint, strip), see qifcanonical), or
+    None when the result can differ between them: it reads the whole
+    document (schema validation reports line numbers) or a section with
+    stripped fields.
+    """
+    sections = SECTION_DEPENDENCIES[result]
+    if canonical is None or sections is None:
+        return None
+    fingerprint, strip = canonical
+    if any(path.split("/", 1)[0] in sections for path in strip):
+        return None
+    return (result, "c14n", fingerprint)
+
+
+class SectionResultCache:
+    """
+    Derived results keyed by the hashes of the sections they read. A new
+    revision of a file that only touched Results still finds its feature
+    summary, unit tables and audit here, and so does a reformatted copy
+    (same canonical fingerprint) of a file seen before.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, result, hashes, compute, canonical=None):
+        keys = [dependency_key(result, hashes)]
+        shared = canonical_key(result, canonical)
+        if shared is not None:
+            keys.append(shared)
+        with self._lock:
+            found = [key for key in keys if key in self._entries]
+            if found:
+                self._entries.move_to_end(found[0])
+                self.hits += 1
+                value = self._entries[found[0]]
+            else:
+                self.misses += 1
+        if len(found) == len(keys):
+            return value
+        if not found:
+            value = compute()
+        with self._lock:
+            for key in keys:
+                self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+section_cache = SectionResultCache()
@@ -0,0 +1,377 @@
+"""
+The uploaded QIF documents as one linked set. QIF splits a part's data
+across documents - QIFProduct (features, characteristic definitions and
+nominals), QIFPlan (characteristic items), QIFResults (measurements) - that
+reference each other by QPId: each document declares the documents it points
+into under ExternalQIFReferences, and a reference such as
+<CharacteristicItemId xId="5">1</CharacteristicItemId> means "id 5 in the
+document declared as ExternalQIFDocument 1".
+
+Ingest catalogues every file's QPId and external documents (document_links,
+stored as QIFFile.qpid and DocumentLink), so the resolver finds the files on
+either side of a link with two indexed queries and only loads the reference
+graphs (see qifgraph) of the files a chain actually passes through.
+"""
+
+import os
+import logging
+from functools import lru_cache
+import numpy as np
+import sqlalchemy as sa
+from lxml import etree
+from werkzeug.security import safe_join
+from app import db
+from app.models import QIFFile, DocumentLink, SearchTerm
+from .qifschema import (
+    QIF_NS,
+    CHARACTERISTIC_KINDS,
+    DEFINITION,
+    NOMINAL,
+    ITEM,
+    MEASUREMENT,
+    characteristic_tags,
+    document_sections,
+    substitution_group,
+)
+from .qifstats import _child_text
+from .qifgraph import reference_graph
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+FEATURE_NOMINAL = "FeatureNominal"
+
+# Reference labels (see ReferenceGraph) of each link in a chain.
+DEFINITION_LINKS = ("CharacteristicDefinitionId",)
+NOMINAL_LINKS = ("CharacteristicNominalId",)
+ITEM_LINKS = ("CharacteristicItemId",)
+FEATURE_LINKS = ("FeatureNominalIds", "FeatureNominalId")
+FEATURE_DEFINITION_LINKS = ("FeatureDefinitionId",)
+ENTITY_LINKS = ("EntityInternalIds",)
+
+
+@lru_cache(maxsize=None)
+def _header_sections():
+    """The top-level sections that may come before ExternalQIFReferences, itself included."""
+    sections = document_sections()
+    return frozenset(sections[: sections.index("ExternalQIFReferences") + 1])
+
+
+def document_links(path):
+    """
+    (qpid, links) of the QIF file at path: its QPId, lower case (None without
+    one), and a dict (ref_id, qpid, uri) per ExternalQIFDocument. Only the
+    header is read; the parse stops at the first section after
+    ExternalQIFReferences.
+    """
+    header = _header_sections()
+    qpid = None
+    links = []
+    depth = 0
+    with open(path, "rb") as f:
+        for event, element in etree.iterparse(
+            f, events=("start", "end"), huge_tree=True, remove_comments=True
+        ):
+            if event == "start":
+                depth += 1
+                if depth == 2 and etree.QName(element).localname not in header:
+                    break
+                continue
+            depth -= 1
+            local = etree.QName(element).localname
+            if depth == 1 and local == "QPId" and element.text:
+                qpid = element.text.strip().lower()
+            elif local == "ExternalQIFDocument":
+                ref_id = element.get("id")
+                link_qpid = _child_text(element, "QPId")
+                if ref_id and ref_id.isdigit() and link_qpid:
+                    links.append(
+                        {
+                            "ref_id": int(ref_id),
+                            "qpid": link_qpid.lower(),
+                            "uri": _child_text(element, "URI"),
+                        }
+                    )
+    return qpid, links
+
+
+def characteristic_starts(name, filename=None, limit=20):
+    """
+    (filename, element id) of the characteristic nominals and items whose
+    Name or CharacteristicDesignator is `name`, from the search index.
+    """
+    query = (
+        sa.select(QIFFile.filename, SearchTerm.element_id)
+        .join(QIFFile)
+        .where(
+            SearchTerm.kind == "characteristic",
+            SearchTerm.term_key == SearchTerm.key(" ".join(name.split())),
+        )
+        .order_by(QIFFile.filename, SearchTerm.id)
+        .limit(limit)
+    )
+    if filename is not None:
+        query = query.where(QIFFile.filename == filename)
+    return [
+        (match, int(element_id))
+        for match, element_id in db.session.execute(query)
+        if element_id and element_id.isdigit()
+    ]
+
+
+def linked_filenames(filenames):
+    """
+    filenames plus the catalogued files one link away (referenced by them or
+    referencing them): the files a resolution from them is likely to load.
+    """
+    files = set(filenames)
+    qif_files = db.session.scalars(sa.select(QIFFile).where(QIFFile.filename.in_(files))).all()
+    qpids = {f.qpid for f in qif_files if f.qpid}
+    referenced = sa.select(DocumentLink.qpid).where(
+        DocumentLink.file_id.in_([f.id for f in qif_files])
+    )
+    files.update(
+        db.session.scalars(sa.select(QIFFile.filename).where(QIFFile.qpid.in_(referenced)))
+    )
+    if qpids:
+        files.update(
+            db.session.scalars(
+                sa.select(QIFFile.filename).join(DocumentLink).where(DocumentLink.qpid.in_(qpids))
+            )
+        )
+    return sorted(files)
+
+
+@lru_cache(maxsize=None)
+def _kinds():
+    """{local name: kind} of every characteristic and feature nominal element."""
+    kinds = {
+        tag[len(QIF_NS) :]: kind for kind in CHARACTERISTIC_KINDS for tag in characteristic_tags(kind)
+    }
+    kinds.update(
+        (name, FEATURE_NOMINAL) for name in substitution_group("Features.xsd", FEATURE_NOMINAL)
+    )
+    return kinds
+
+
+def _codes(graph, labels):
+    return [code for code, name in enumerate(graph.label_names) if name in labels]
+
+
+def _unique(keys):
+    return list(dict.fromkeys(keys))
+
+
+def _uri_name(uri):
+    """Lower-case file name at the end of an ExternalQIFDocument URI (./plan.qif, .\\plan.qif...)."""
+    if not uri:
+        return None
+    return uri.strip().replace("\\", "/").rsplit("/", 1)[-1].lower() or None
+
+
+class QIFSet:
+    """
+    Resolution state over the uploads: elements are (filename, node index)
+    keys into the files' reference graphs, which are loaded on first use.
+    Catalogue lookups are memoised for the lifetime of the set, so build one
+    per request.
+    """
+
+    def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
+        self._graphs = {}
+        self._documents = {}
+        self._referencing = {}
+        self._unresolved = {}
+
+    def graph(self, filename):
+        """The ReferenceGraph of an upload; None when it is missing or does not parse."""
+        if filename not in self._graphs:
+            path = safe_join(self.upload_folder, filename)
+            graph = None
+            if path is not None and os.path.isfile(path):
+                try:
+                    graph = reference_graph(path)
+                except etree.XMLSyntaxError as e:
+                    logger.warning("%s left out of the QIF set: %s", filename, e)
+            self._graphs[filename] = graph
+        return self._graphs[filename]
+
+    @property
+    def filenames(self):
+        """The files loaded so far."""
+        return sorted(f for f, graph in self._graphs.items() if graph is not None)
+
+    @property
+    def unresolved(self):
+        """External references whose document is not catalogued or lacks the id."""
+        return list(self._unresolved.values())
+
+    def documents(self, qpid, uri=None):
+        """Catalogued files with this QPId; only the one the URI names when several share it."""
+        key = (qpid, uri)
+        if key not in self._documents:
+            filenames = QIFFile.filenames_with_qpid(qpid)
+            name = _uri_name(uri)
+            if len(filenames) > 1 and name:
+                named = [f for f in filenames if os.path.basename(f).lower() == name]
+                filenames = named or filenames
+            self._documents[key] = filenames
+        return self._documents[key]
+
+    def referencing(self, qpid):
+        """(filename, ref_id, uri) of the catalogued files that declare the document qpid."""
+        if qpid not in self._referencing:
+            self._referencing[qpid] = DocumentLink.referencing(qpid)
+        return self._referencing[qpid]
+
+    def kind(self, key):
+        filename, i = key
+        graph = self.graph(filename)
+        return _kinds().get(graph.tag_names[graph.tags[i]])
+
+    def node(self, key):
+        filename, i = key
+        graph = self.graph(filename)
+        node = dict(graph.node(i), file=filename)
+        if i in graph.values:
+            node["value"] = graph.values[i]
+        if i in graph.statuses:
+            node["status"] = graph.statuses[i]
+        return node
+
+    def targets(self, key, labels):
+        """Elements `key` references under one of `labels`, following xIds into other files."""
+        filename, i = key
+        graph = self.graph(filename)
+        lo, hi = graph.out_offsets[i], graph.out_offsets[i + 1]
+        keep = np.isin(graph.out_labels[lo:hi], _codes(graph, labels))
+        found = []
+        for j, xid in zip(
+            graph.out_targets[lo:hi][keep].tolist(), graph.out_xids[lo:hi][keep].tolist()
+        ):
+            if xid < 0:
+                found.append((filename, j))
+                continue
+            ext_id = int(graph.ids[j])
+            qpid, uri = graph.external.get(ext_id, (None, None))
+            external = []
+            for other in self.documents(qpid, uri) if qpid is not None else ():
+                other_graph = self.graph(other)
+                k = other_graph.index_of(xid) if other_graph is not None else None
+                if k is not None:
+                    external.append((other, k))
+            if not external:
+                self._unresolved[(filename, ext_id, xid)] = {
+                    "file": filename,
+                    "qpid": qpid,
+                    "uri": uri,
+                    "id": xid,
+                }
+            found.extend(external)
+        return _unique(found)
+
+    def sources(self, key, labels):
+        """
+        Elements referencing `key` under one of `labels`: in its own file, and
+        with xIds in the catalogued files that declare its document.
+        """
+        filename, i = key
+        graph = self.graph(filename)
+        lo, hi = graph.in_offsets[i], graph.in_offsets[i + 1]
+        keep = np.isin(graph.in_labels[lo:hi], _codes(graph, labels)) & (graph.in_xids[lo:hi] < 0)
+        found = [(filename, j) for j in graph.in_sources[lo:hi][keep].tolist()]
+        if graph.qpid is None:
+            return found
+        element_id = int(graph.ids[i])
+        for other, ref_id, uri in self.referencing(graph.qpid):
+            if other == filename or filename not in self.documents(graph.qpid, uri):
+                continue
+            other_graph = self.graph(other)
+            r = other_graph.index_of(ref_id) if other_graph is not None else None
+            if r is None:
+                continue
+            lo, hi = other_graph.in_offsets[r], other_graph.in_offsets[r + 1]
+            keep = np.isin(other_graph.in_labels[lo:hi], _codes(other_graph, labels)) & (
+                other_graph.in_xids[lo:hi] == element_id
+            )
+            found.extend((other, j) for j in other_graph.in_sources[lo:hi][keep].tolist())
+        return _unique(found)
+
+    def nominals(self, key):
+        """The characteristic nominals an element belongs to (none for other elements)."""
+        kind = self.kind(key)
+        if kind == NOMINAL:
+            return [key]
+        if kind == ITEM:
+            return self.targets(key, NOMINAL_LINKS)
+        if kind == MEASUREMENT:
+            return _unique(
+                nominal
+                for item in self.targets(key, ITEM_LINKS)
+                for nominal in self.targets(item, NOMINAL_LINKS)
+            )
+        if kind == DEFINITION:
+            return self.sources(key, DEFINITION_LINKS)
+        if kind == FEATURE_NOMINAL:
+            return self.sources(key, FEATURE_LINKS)
+        return []
+
+    def chain(self, nominal):
+        """
+        One characteristic nominal joined with its definitions and features
+        (with their definitions and product entities) and its items (with
+        their measurements), wherever in the set they are.
+        """
+        features = [
+            dict(
+                self.node(feature),
+                definitions=[self.node(k) for k in self.targets(feature, FEATURE_DEFINITION_LINKS)],
+                entities=[self.node(k) for k in self.targets(feature, ENTITY_LINKS)],
+            )
+            for feature in self.targets(nominal, FEATURE_LINKS)
+        ]
+        items = [
+            dict(
+                self.node(item),
+                measurements=[self.node(k) for k in self.sources(item, ITEM_LINKS)],
+            )
+            for item in self.sources(nominal, NOMINAL_LINKS)
+        ]
+        return {
+            "nominal": self.node(nominal),
+            "definitions": [self.node(k) for k in self.targets(nominal, DEFINITION_LINKS)],
+            "features": features,
+            "items": items,
+        }
+
+
+def resolve_characteristic(upload_folder, starts):
+    """
+    Follows characteristics across the uploaded QIF set. starts are (filename,
+    element id) pairs of characteristic nominals, items, measurements or
+    definitions, or feature nominals; each is traced to the characteristic
+    nominals it belongs to, and one chain (see QIFSet.chain) is returned per
+    nominal, along with the files loaded and the external references that
+    could not be followed. None when none of the start elements exists.
+    """
+    qif_set = QIFSet(upload_folder)
+    with stage_timer("set.resolve"):
+        start_nodes = []
+        nominals = []
+        for filename, element_id in starts:
+            graph = qif_set.graph(filename)
+            i = graph.index_of(element_id) if graph is not None else None
+            if i is None:
+                continue
+            start_nodes.append(qif_set.node((filename, i)))
+            nominals.extend(qif_set.nominals((filename, i)))
+        if not start_nodes:
+            return None
+        chains = [qif_set.chain(nominal) for nominal in _unique(nominals)]
+    return {
+        "start": start_nodes,
+        "chains": chains,
+        "files": qif_set.filenames,
+        "unresolved": qif_set.unresolved,
+    }
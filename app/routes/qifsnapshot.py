@@ -0,0 +1,565 @@
+import os
+import re
+import sys
+import json
+import mmap
+import bisect
+import struct
+import threading
+import logging
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+from lxml import etree
+from .metrics import stage_timer
+from .qifsections import tree_section_hashes
+from .qifschema import OTHER_NAMESPACE, OTHER_NAMESPACE_PATCH
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, u32 format version, u32 length of the JSON directory,
+# the directory, then the blocks it lists, each 8-byte aligned:
+#
+#   strings       utf-8 bytes of every interned string (tags, attribute names
+#                 and values, texts), one after another
+#   str_offsets   u32[strings + 1]; string s is strings[str_offsets[s]:str_offsets[s + 1]]
+#   tag           u32[n]  string id of the Clark-notation tag of element i
+#   parent        i32[n]  index of the parent element, -1 for the root
+#   end           i32[n]  one past the last descendant of i (so i's next sibling)
+#   text          i32[n]  string id of i's text, -1 for none
+#   attr_offsets  u32[n + 1]; attributes of i are attr_*[attr_offsets[i]:attr_offsets[i + 1]]
+#   attr_name     u32[a]  string ids
+#   attr_value    u32[a]  string ids
+#   id_keys       i64[k]  numeric @id values, sorted
+#   id_elements   i32[k]  element carrying id_keys[j]
+#   edge_src      i32[e]  element owning a reference (sorted)
+#   edge_dst      i32[e]  element referenced, -1 when the id is not in the document
+#   edge_label    u32[e]  string id of the reference's label
+#
+# Elements are in document order, so the subtree of i is i..end[i] - 1.
+# Comments, processing instructions and tails are not kept; QIF has no mixed
+# content. References follow qifgraph: a leaf element named Id or *Id whose
+# text is an id, owned by the nearest enclosing element with an id.
+MAGIC = b"QIFSNAP\0"
+FORMAT_VERSION = 1
+SUFFIX = ".qsnap"
+_HEADER = struct.Struct("<8sII")
+
+# struct/memoryview format -> numpy dtype
+_DTYPES = {"B": "u1", "I": "<u4", "i": "<i4", "q": "<i8"}
+
+
+class SnapshotError(Exception):
+    """A snapshot file that is missing, truncated or of another format."""
+
+
+def parse_qif(path):
+    """
+    (root element, xml errors) of a QIF file parsed with lxml. Files declaring
+    the schema-only namespace "##other" are patched before parsing, as the
+    inspection software does, and that is reported as an xml error.
+    """
+    xml_errors = []
+    with stage_timer("read"):
+        with open(path, "rb") as f:
+            xml_content = f.read()
+    with stage_timer("other_rewrite"):
+        if OTHER_NAMESPACE in xml_content:
+            xml_content = xml_content.replace(OTHER_NAMESPACE, OTHER_NAMESPACE_PATCH)
+            xml_errors.append(f"Replaced {OTHER_NAMESPACE!r} with a valid URI.")
+    with stage_timer("parse"):
+        # base_url: relative URIs in the document (linked QIF files) resolve
+        # against the file, not the working directory.
+        root = etree.fromstring(xml_content, parser=etree.XMLParser(), base_url=path)
+    return root, xml_errors
+
+
+# -----------------------------------------------------------------------------
+# WRITING
+# -----------------------------------------------------------------------------
+
+
+def _local(tag):
+    return tag[tag.rfind("}") + 1 :]
+
+
+def build_snapshot(root, xml_errors=(), sections=None):
+    """The snapshot of a parsed document, as bytes."""
+    strings = {}
+
+    def intern(value):
+        sid = strings.get(value)
+        if sid is None:
+            sid = strings[value] = len(strings)
+        return sid
+
+    tags, parents, ends, texts = [], [], [], []
+    attr_offsets, attr_names, attr_values = [0], [], []
+    id_keys, id_elements = [], []
+    edge_src, edge_ids, edge_labels = [], [], []
+    stack = []  # indices of the open elements
+    owners = []  # indices of the open elements with a numeric id
+
+    with stage_timer("snapshot.build"):
+        for event, element in etree.iterwalk(root, events=("start", "end")):
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            if event == "start":
+                index = len(tags)
+                tags.append(intern(tag))
+                parents.append(stack[-1] if stack else -1)
+                ends.append(0)
+                texts.append(-1 if element.text is None else intern(element.text))
+                for name, value in element.attrib.items():
+                    attr_names.append(intern(name))
+                    attr_values.append(intern(value))
+                attr_offsets.append(len(attr_names))
+                elem_id = element.get("id")
+                if elem_id is not None and elem_id.isdigit():
+                    id_keys.append(int(elem_id))
+                    id_elements.append(index)
+                    owners.append(index)
+                stack.append(index)
+                continue
+
+            index = stack.pop()
+            ends[index] = len(tags)
+            if owners and owners[-1] == index:
+                owners.pop()
+                continue
+            local = _local(tag)
+            text = element.text
+            if owners and local.endswith("Id") and ends[index] == index + 1 and text:
+                text = text.strip()
+                if text.isdigit():
+                    label = _local(element.getparent().tag) if local == "Id" else local
+                    edge_src.append(owners[-1])
+                    edge_ids.append(int(text))
+                    edge_labels.append(intern(label))
+
+        id_keys = np.array(id_keys, dtype=np.int64)
+        id_elements = np.array(id_elements, dtype=np.int32)
+        order = np.argsort(id_keys, kind="stable")
+        id_keys, id_elements = id_keys[order], id_elements[order]
+
+        edge_ids = np.array(edge_ids, dtype=np.int64)
+        pos = np.searchsorted(id_keys, edge_ids)
+        clipped = np.minimum(pos, max(len(id_keys) - 1, 0))
+        found = (pos < len(id_keys)) & (id_keys[clipped] == edge_ids) if len(id_keys) else pos < 0
+        edge_dst = np.where(found, id_elements[clipped] if len(id_keys) else -1, -1)
+        edge_src = np.array(edge_src, dtype=np.int32)
+        order = np.argsort(edge_src, kind="stable")
+
+        encoded = [value.encode("utf-8") for value in strings]
+        str_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=str_offsets[1:])
+
+        blocks = [
+            ("strings", "B", b"".join(encoded)),
+            ("str_offsets", "I", str_offsets),
+            ("tag", "I", tags),
+            ("parent", "i", parents),
+            ("end", "i", ends),
+            ("text", "i", texts),
+            ("attr_offsets", "I", attr_offsets),
+            ("attr_name", "I", attr_names),
+            ("attr_value", "I", attr_values),
+            ("id_keys", "q", id_keys),
+            ("id_elements", "i", id_elements),
+            ("edge_src", "i", edge_src[order]),
+            ("edge_dst", "i", edge_dst[order]),
+            ("edge_label", "I", np.array(edge_labels, dtype=np.uint32)[order]),
+        ]
+        directory = {
+            "byteorder": sys.byteorder,
+            "elements": len(tags),
+            "nsmap": {prefix or "": uri for prefix, uri in root.nsmap.items()},
+            "xml_errors": list(xml_errors),
+            "sections": sections if sections is not None else tree_section_hashes(root),
+            "blocks": {},
+        }
+        data = bytearray()
+        for name, fmt, values in blocks:
+            raw = values if fmt == "B" else np.asarray(values, dtype=_DTYPES[fmt]).tobytes()
+            directory["blocks"][name] = [len(data), fmt, len(raw) // struct.calcsize(fmt)]
+            data += raw
+            data += b"\0" * (-len(data) % 8)
+
+        meta = json.dumps(directory).encode("utf-8")
+        meta += b" " * (-(_HEADER.size + len(meta)) % 8)
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, len(meta)) + meta + bytes(data)
+
+
+def snapshot_path(folder, digest):
+    return os.path.join(folder, digest + SUFFIX)
+
+
+def write_snapshot(path, folder, digest, root=None, xml_errors=(), sections=None):
+    """
+    Writes the snapshot of the QIF file at path (parsing it unless its root is
+    given) to folder/<digest>.qsnap, atomically, so readers in other processes
+    never map a partial file. Returns the snapshot path.
+    """
+    if root is None:
+        root, xml_errors = parse_qif(path)
+    data = build_snapshot(root, xml_errors, sections)
+    os.makedirs(folder, exist_ok=True)
+    target = snapshot_path(folder, digest)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with stage_timer("snapshot.write"):
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    snapshot_cache.discard(digest)
+    return target
+
+
+def remove_snapshot(folder, digest):
+    snapshot_cache.discard(digest)
+    try:
+        os.remove(snapshot_path(folder, digest))
+    except FileNotFoundError:
+        pass
+
+
+# -----------------------------------------------------------------------------
+# READING
+# -----------------------------------------------------------------------------
+
+
+class Snapshot:
+    """
+    A snapshot file mapped read-only. Every block is a memoryview (or NumPy
+    array, for bulk scans) over the mapping itself, so nothing is copied or
+    parsed at open: the pages are read on first use and shared, through the
+    page cache, by every process that maps the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # empty file
+                raise SnapshotError(f"{path}: {e}") from e
+        if len(self._mm) < _HEADER.size:
+            raise SnapshotError(f"{path}: truncated")
+        magic, version, meta_len = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(f"{path}: not a version {FORMAT_VERSION} QIF snapshot")
+        meta = json.loads(self._mm[_HEADER.size : _HEADER.size + meta_len])
+        if meta["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{path}: written on a {meta['byteorder']}-endian machine")
+        self.nsmap = meta["nsmap"]
+        self.xml_errors = meta["xml_errors"]
+        self.sections = meta["sections"]
+        self._data_start = _HEADER.size + meta_len
+        self._directory = meta["blocks"]
+        view = memoryview(self._mm)
+        for name, (offset, fmt, count) in self._directory.items():
+            start = self._data_start + offset
+            end = start + count * struct.calcsize(fmt)
+            if end > len(self._mm):
+                raise SnapshotError(f"{path}: truncated")
+            setattr(self, "_" + name, view[start:end].cast(fmt))
+        self._string_cache = {}
+        self._tag_ids = None
+
+    def __len__(self):
+        return len(self._tag)
+
+    def array(self, name):
+        """Block `name` as a read-only NumPy array over the mapping."""
+        offset, fmt, count = self._directory[name]
+        return np.frombuffer(self._mm, dtype=_DTYPES[fmt], count=count, offset=self._data_start + offset)
+
+    def string(self, sid):
+        return str(self._strings[self._str_offsets[sid] : self._str_offsets[sid + 1]], "utf-8")
+
+    def _cached_string(self, sid):
+        # Tags and attribute names: few distinct values, looked up constantly
+        value = self._string_cache.get(sid)
+        if value is None:
+            value = self._string_cache[sid] = self.string(sid)
+        return value
+
+    def tag(self, i):
+        return self._cached_string(self._tag[i])
+
+    def text(self, i):
+        sid = self._text[i]
+        return None if sid < 0 else self.string(sid)
+
+    def attrib(self, i):
+        return {
+            self._cached_string(self._attr_name[a]): self.string(self._attr_value[a])
+            for a in range(self._attr_offsets[i], self._attr_offsets[i + 1])
+        }
+
+    def get(self, i, name, default=None):
+        for a in range(self._attr_offsets[i], self._attr_offsets[i + 1]):
+            if self._cached_string(self._attr_name[a]) == name:
+                return self.string(self._attr_value[a])
+        return default
+
+    def parent(self, i):
+        return self._parent[i]
+
+    def end(self, i):
+        return self._end[i]
+
+    def tag_ids(self, names):
+        """String ids of those of the Clark-notation tags that occur in the document."""
+        if self._tag_ids is None:
+            self._tag_ids = {self.string(int(sid)): int(sid) for sid in np.unique(self.array("tag"))}
+        return [self._tag_ids[name] for name in names if name in self._tag_ids]
+
+    def children(self, i, tag=None):
+        """Indices of i's children, only those with Clark tag `tag` if given."""
+        tag_id = None
+        if tag is not None and tag != "*":
+            ids = self.tag_ids([tag])
+            if not ids:
+                return
+            tag_id = ids[0]
+        end = self._end
+        j, stop = i + 1, end[i]
+        while j < stop:
+            if tag_id is None or self._tag[j] == tag_id:
+                yield j
+            j = end[j]
+
+    def descendants(self, i, tags=(), include_self=True):
+        """Indices of the subtree of i in document order, only those with one of `tags` if given."""
+        start = i if include_self else i + 1
+        stop = self._end[i]
+        if not tags or "*" in tags:
+            return range(start, stop)
+        ids = self.tag_ids(tags)
+        if not ids:
+            return range(0)
+        hits = np.isin(self.array("tag")[start:stop], ids)
+        return (np.flatnonzero(hits) + start).tolist()
+
+    def element_by_id(self, element_id):
+        """Index of the element with @id element_id, or None."""
+        try:
+            key = int(element_id)
+        except (TypeError, ValueError):
+            return None
+        j = bisect.bisect_left(self._id_keys, key)
+        if j < len(self._id_keys) and self._id_keys[j] == key:
+            return self._id_elements[j]
+        return None
+
+    def references(self, i):
+        """(label, target index or -1) of the references owned by element i."""
+        lo = bisect.bisect_left(self._edge_src, i)
+        hi = bisect.bisect_right(self._edge_src, i)
+        return [
+            (self._cached_string(self._edge_label[e]), self._edge_dst[e]) for e in range(lo, hi)
+        ]
+
+    def element(self, i):
+        return SnapshotElement(self, i)
+
+    def getroot(self):
+        return SnapshotElement(self, 0)
+
+    def _qname(self, clark, prefixes):
+        if not clark.startswith("{"):
+            return clark
+        uri, local = clark[1:].split("}", 1)
+        prefix = prefixes.get(uri)
+        return local if not prefix else f"{prefix}:{local}"
+
+    def tostring(self, i, pretty_print=False):
+        """Serialises the subtree of i, declaring the document's namespaces on its top element."""
+        prefixes = {uri: prefix for prefix, uri in self.nsmap.items()}
+        out = []
+
+        def open_tag(j, declare):
+            parts = [self._qname(self.tag(j), prefixes)]
+            if declare:
+                parts.extend(
+                    f"xmlns{':' + prefix if prefix else ''}={quoteattr(uri)}"
+                    for prefix, uri in self.nsmap.items()
+                )
+            parts.extend(
+                f"{self._qname(name, prefixes)}={quoteattr(value)}"
+                for name, value in self.attrib(j).items()
+            )
+            return "<" + " ".join(parts)
+
+        def write(j, depth):
+            indent = "  " * depth if pretty_print else ""
+            newline = "\n" if pretty_print else ""
+            head = open_tag(j, j == i)
+            name = self._qname(self.tag(j), prefixes)
+            text = self.text(j)
+            children = list(self.children(j))
+            if not children:
+                if text:
+                    out.append(f"{indent}{head}>{escape(text)}</{name}>{newline}")
+                else:
+                    out.append(f"{indent}{head}/>{newline}")
+                return
+            out.append(f"{indent}{head}>")
+            if text and text.strip():
+                out.append(escape(text))
+            out.append(newline)
+            for child in children:
+                write(child, depth + 1)
+            out.append(f"{indent}</{name}>{newline}")
+
+        write(i, 0)
+        return "".join(out)
+
+
+# One step of an ElementPath: a Clark name (whose URI has slashes) or a plain name
+_STEP = re.compile(r"\{[^}]*\}[^/]*|[^/]+")
+
+
+class SnapshotElement:
+    """
+    The read-only subset of the lxml element API the QIF analyses use (tag,
+    text, get/attrib, iteration, find/findall with child and .// paths,
+    iter(*tags), getparent), over one element of a Snapshot.
+    """
+
+    __slots__ = ("snapshot", "index")
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    def __repr__(self):
+        return f"<SnapshotElement {self.tag} #{self.index}>"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, SnapshotElement)
+            and other.snapshot is self.snapshot
+            and other.index == self.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.snapshot), self.index))
+
+    @property
+    def tag(self):
+        return self.snapshot.tag(self.index)
+
+    @property
+    def text(self):
+        return self.snapshot.text(self.index)
+
+    @property
+    def attrib(self):
+        return self.snapshot.attrib(self.index)
+
+    @property
+    def nsmap(self):
+        return {prefix or None: uri for prefix, uri in self.snapshot.nsmap.items()}
+
+    def get(self, name, default=None):
+        return self.snapshot.get(self.index, name, default)
+
+    def keys(self):
+        return list(self.attrib)
+
+    def items(self):
+        return list(self.attrib.items())
+
+    def __iter__(self):
+        snapshot = self.snapshot
+        return (SnapshotElement(snapshot, j) for j in snapshot.children(self.index))
+
+    def __len__(self):
+        return sum(1 for _ in self.snapshot.children(self.index))
+
+    def __getitem__(self, k):
+        return list(self)[k]
+
+    def getparent(self):
+        parent = self.snapshot.parent(self.index)
+        return None if parent < 0 else SnapshotElement(self.snapshot, parent)
+
+    def iter(self, *tags):
+        snapshot = self.snapshot
+        return (SnapshotElement(snapshot, j) for j in snapshot.descendants(self.index, tags))
+
+    def _select(self, path):
+        snapshot = self.snapshot
+        descendant = path.startswith(".//")
+        steps = _STEP.findall(path[3:] if descendant else path)
+        if descendant:
+            nodes = snapshot.descendants(self.index, (steps[0],), include_self=False)
+        else:
+            nodes = snapshot.children(self.index, steps[0])
+        for step in steps[1:]:
+            nodes = (j for i in nodes for j in snapshot.children(i, step))
+        return nodes
+
+    def find(self, path):
+        for j in self._select(path):
+            return SnapshotElement(self.snapshot, j)
+        return None
+
+    def findall(self, path):
+        return [SnapshotElement(self.snapshot, j) for j in self._select(path)]
+
+    def findtext(self, path, default=None):
+        element = self.find(path)
+        return default if element is None else element.text or ""
+
+    def tostring(self, pretty_print=False):
+        return self.snapshot.tostring(self.index, pretty_print)
+
+
+class _SnapshotCache:
+    """Mapped snapshots keyed by content digest; mappings are cheap, this only saves the open()."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            snapshot = self._entries.get(digest)
+            if snapshot is not None:
+                self._entries.move_to_end(digest)
+            return snapshot
+
+    def put(self, digest, snapshot):
+        with self._lock:
+            self._entries[digest] = snapshot
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+
+snapshot_cache = _SnapshotCache()
+
+
+def open_snapshot(folder, digest):
+    """The Snapshot for content digest, or None when there is none (or it is unreadable)."""
+    snapshot = snapshot_cache.get(digest)
+    if snapshot is not None:
+        return snapshot
+    path = snapshot_path(folder, digest)
+    if not os.path.exists(path):
+        return None
+    try:
+        with stage_timer("snapshot.open"):
+            snapshot = Snapshot(path)
+    except (OSError, ValueError, SnapshotError) as e:
+        logger.warning("Ignoring snapshot %s: %s", path, e)
+        return None
+    snapshot_cache.put(digest, snapshot)
+    return snapshot
@@ -0,0 +1,659 @@
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from lxml import etree
+from .metrics import stage_timer
+from .response_cache import file_digest
+from .qifunits import SI_UNITS, UnitTable, characteristic_quantity, value_unit
+from .qifschema import (
+    QIF_NS,
+    DEFINITION,
+    NOMINAL,
+    ITEM,
+    MEASUREMENT,
+    CHARACTERISTIC_KINDS,
+    characteristic_tags,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = {"PASS": 1, "FAIL": 0}  # anything else (REWORK, SYSDEV...) is -1
+
+# Bulky elements with nothing we need; cleared as soon as they have been parsed
+# so a streamed file never holds its point clouds or geometry in memory.
+DISCARD_TAGS = (
+    "Product",
+    "Features",
+    "MeasurementResources",
+    "MeasurementPlan",
+    "Statistics",
+    "Traceability",
+    "DatumDefinitions",
+    "DatumReferenceFrames",
+    "MeasuredPointSet",
+    "MeasuredFeatures",
+)
+
+def _qualified(path):
+    """"Status/CharacteristicStatusEnum" -> the same path in the QIF namespace."""
+    return QIF_NS + path.replace("/", "/" + QIF_NS)
+
+
+def _child_text(element, path):
+    child = element.find(_qualified(path))
+    return child.text.strip() if child is not None and child.text else None
+
+
+def _child_float(element, path):
+    text = _child_text(element, path)
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _definition_limits(element):
+    """
+    (lower, upper, relative) tolerance limits of a characteristic definition.
+    relative is True when the limits are deviations from the nominal TargetValue
+    (Tolerance with DefinedAsLimit false) rather than absolute values. Geometric
+    tolerances (ToleranceValue) are one-sided: [None, tol].
+    """
+    tolerance = element.find(QIF_NS + "Tolerance")
+    if tolerance is not None:
+        upper = _child_float(tolerance, "MaxValue")
+        lower = _child_float(tolerance, "MinValue")
+        relative = (_child_text(tolerance, "DefinedAsLimit") or "false") != "true"
+        return lower, upper, relative
+    value = _child_float(element, "ToleranceValue")
+    if value is not None:
+        return None, value, False
+    return None, None, False
+
+
+def _definition_unit(element):
+    """Unit attribute of a definition's tolerance values (linearUnit="inch"), None for the primary unit."""
+    for path in ("ToleranceValue", "Tolerance/MaxValue", "Tolerance/MinValue"):
+        unit = value_unit(element.find(_qualified(path)))
+        if unit:
+            return unit
+    return None
+
+
+@lru_cache(maxsize=None)
+def record_tags():
+    """
+    {qualified tag: (record kind, characteristic type)} for every concrete
+    member of the four characteristic substitution groups. Handing these to
+    iterparse(tag=...) lets libxml2 skip everything else without calling back
+    into Python.
+    """
+    tags = {}
+    for kind in CHARACTERISTIC_KINDS:
+        for tag in characteristic_tags(kind):
+            local_name = tag[len(QIF_NS):]
+            char_type = local_name[: -len(kind)] if local_name.endswith(kind) else local_name
+            tags[tag] = (kind, char_type)
+    return tags
+
+
+def iter_records(path, extra_tags=()):
+    """
+    Streams a QIF file, yielding (kind, characteristic type, element) for each
+    characteristic record, and (local name, None, element) for each element
+    named in extra_tags. Only those and DISCARD_TAGS are reported by iterparse;
+    every reported element is cleared once the caller has looked at it, so
+    discarded sections never accumulate in memory.
+    """
+    records = record_tags()
+    extra = {QIF_NS + t: (t, None) for t in extra_tags}
+    watched = list(records) + list(extra) + [QIF_NS + t for t in DISCARD_TAGS]
+    for _, element in etree.iterparse(
+        path, events=("end",), tag=watched, huge_tree=True, remove_comments=True
+    ):
+        kind, char_type = records.get(element.tag) or extra.get(element.tag, (None, None))
+        if kind is not None:
+            yield kind, char_type, element
+        # Free the element and the (already handled) siblings before it.
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _nominal_record(element, char_type):
+    return {
+        "name": _child_text(element, "Name"),
+        "type": char_type,
+        "definition_id": _child_text(element, "CharacteristicDefinitionId"),
+        "target": _child_float(element, "TargetValue"),
+        "target_unit": value_unit(element.find(QIF_NS + "TargetValue")),
+    }
+
+
+def _measurement_record(element):
+    item = element.find(QIF_NS + "CharacteristicItemId")
+    return {
+        "id": element.get("id"),
+        # With xId the item is in another document (a separate plan) and the
+        # text is that document's ExternalQIFDocument id, not a local item id.
+        "item_id": (
+            item.text.strip()
+            if item is not None and item.text and item.get("xId") is None
+            else None
+        ),
+        "value": _child_float(element, "Value"),
+        "unit": value_unit(element.find(QIF_NS + "Value")),
+        "status": _child_text(element, "Status/CharacteristicStatusEnum"),
+    }
+
+
+def _absolute_limits(limits, target):
+    lower, upper, relative = limits
+    if relative and target is not None:
+        lower = target + lower if lower is not None else None
+        upper = target + upper if upper is not None else None
+    return lower, upper
+
+
+def _si_limits(table, quantities, limits, units, targets, target_units):
+    """
+    _absolute_limits() in SI for whole columns at once: parallel lists of
+    quantities, definition limits (lower, upper, relative), their unit
+    attributes, nominal targets and target unit attributes. Returns lower,
+    upper and target as float64 arrays, NaN where absent. Relative limits
+    are deviations, converted without the unit offset.
+    """
+    lower = np.array([_nan(limit[0]) for limit in limits], dtype=np.float64)
+    upper = np.array([_nan(limit[1]) for limit in limits], dtype=np.float64)
+    relative = np.array([limit[2] for limit in limits], dtype=bool)
+    target = table.to_si_mixed(
+        np.array([_nan(t) for t in targets], dtype=np.float64), quantities, target_units, pmi=True
+    )
+
+    def convert(values):
+        absolute = table.to_si_mixed(values, quantities, units, pmi=True)
+        deviation = table.to_si_mixed(values, quantities, units, pmi=True, delta=True)
+        return np.where(
+            relative, np.where(np.isnan(target), deviation, target + deviation), absolute
+        )
+
+    return convert(lower), convert(upper), target
+
+
+def _optional(value):
+    """NaN -> None, for values leaving NumPy."""
+    return None if np.isnan(value) else float(value)
+
+
+def extract_results(path):
+    """
+    Streams one QIF file and returns its characteristic actuals as a dict of
+    columns (NumPy arrays) plus per-nominal limits:
+
+        {"key": <U..., "value": float64, "status": int8, "limits": {key: {...}}}
+
+    Measurements are keyed by the nominal's Name, or else the measured item's
+    Name or designator, so files produced from the same plan line up across a
+    lot. Values and limits are converted to SI
+    (meter, radian...) using the file's FileUnits, so inch and mm files can
+    share a lot; each key's limits name its SI unit.
+
+    Measurements that can't be keyed are counted instead: "unnamed" ones with
+    neither (ids mean nothing in other files) and
+    "unjoined" ones whose item or nominal is not in this file, e.g. a results
+    file referencing a separate plan by xId.
+    """
+    definitions = {}  # def id -> ((lower, upper, relative), unit)
+    nominals = {}  # nominal id -> nominal record
+    items = {}  # item id -> (nominal id, item name or designator)
+    measurements = []
+    table = UnitTable()
+
+    for kind, char_type, element in iter_records(path, extra_tags=("FileUnits",)):
+        elem_id = element.get("id")
+        if kind == "FileUnits":
+            table = UnitTable.from_element(element)
+        elif kind == DEFINITION:
+            definitions[elem_id] = (_definition_limits(element), _definition_unit(element))
+        elif kind == NOMINAL:
+            nominals[elem_id] = _nominal_record(element, char_type)
+        elif kind == ITEM:
+            items[elem_id] = (
+                _child_text(element, "CharacteristicNominalId"),
+                _child_text(element, "Name")
+                or _child_text(element, "CharacteristicDesignator/Designator"),
+            )
+        elif kind == MEASUREMENT:
+            measurements.append(_measurement_record(element))
+
+    keys, values, statuses, quantities, units = [], [], [], [], []
+    limit_nominals = {}  # key -> the nominal whose limits apply
+    unnamed = unjoined = 0
+    for m in measurements:
+        if m["value"] is None:
+            continue
+        nominal_id, item_name = items.get(m["item_id"], (None, None))
+        nominal = nominals.get(nominal_id)
+        if nominal is None:
+            unjoined += 1
+            continue
+        key = nominal["name"] or item_name
+        if not key:
+            unnamed += 1
+            continue
+        keys.append(key)
+        values.append(m["value"])
+        statuses.append(STATUS_CODES.get(m["status"], -1))
+        quantities.append(characteristic_quantity(nominal["type"]))
+        units.append(m["unit"])
+        limit_nominals.setdefault(key, nominal)
+
+    limit_quantities = [characteristic_quantity(n["type"]) for n in limit_nominals.values()]
+    limit_definitions = [
+        definitions.get(n["definition_id"], ((None, None, False), None))
+        for n in limit_nominals.values()
+    ]
+    lower, upper, target = _si_limits(
+        table,
+        limit_quantities,
+        [d[0] for d in limit_definitions],
+        [d[1] for d in limit_definitions],
+        [n["target"] for n in limit_nominals.values()],
+        [n["target_unit"] for n in limit_nominals.values()],
+    )
+    limits = {
+        key: {
+            "type": nominal["type"],
+            "unit": SI_UNITS.get(limit_quantities[i]),
+            "lsl": _optional(lower[i]),
+            "usl": _optional(upper[i]),
+            "target": _optional(target[i]),
+        }
+        for i, (key, nominal) in enumerate(limit_nominals.items())
+    }
+
+    return {
+        "key": np.array(keys, dtype=str),
+        "value": table.to_si_mixed(values, quantities, units, pmi=True),
+        "status": np.array(statuses, dtype=np.int8),
+        "limits": limits,
+        "unnamed": unnamed,
+        "unjoined": unjoined,
+    }
+
+
+# Elements besides the characteristic records that the rows are built from
+ROW_EXTRA_TAGS = ("DatumDefinition", "DatumReferenceFrame", "FileUnits")
+
+
+def iter_tree_records(root, extra_tags=()):
+    """
+    iter_records() over a document that is already loaded (an lxml root or a
+    snapshot root), in document order.
+    """
+    records = record_tags()
+    extra = {QIF_NS + t: (t, None) for t in extra_tags}
+    for element in root.iter(*records, *extra):
+        kind, char_type = records.get(element.tag) or extra[element.tag]
+        yield kind, char_type, element
+
+
+def extract_characteristic_rows(path, si=False):
+    """
+    Streams one QIF file into flat rows, one per characteristic measurement
+    (or one per nominal when the file has no results for it):
+
+        nominal_id, item_id, measurement_id, name, char_type, tolerance,
+        lower_limit, upper_limit, target, datums ("A|B|C"), value, status
+
+    tolerance is the ToleranceValue of geometric characteristics, or the width
+    of the Tolerance zone (upper - lower) of dimensional ones. Values are in
+    the file's units unless si, which converts tolerance, limits, target and
+    value to SI.
+    """
+    return characteristic_rows(iter_records(path, extra_tags=ROW_EXTRA_TAGS), si)
+
+
+def tree_characteristic_rows(root, si=False):
+    """extract_characteristic_rows() of a document that is already loaded."""
+    return characteristic_rows(iter_tree_records(root, ROW_EXTRA_TAGS), si)
+
+
+def characteristic_rows(records, si=False):
+    """The rows of extract_characteristic_rows() from (kind, char_type, element) records."""
+    definitions = {}  # def id -> (limits, tolerance value, drf id, unit)
+    nominals = {}
+    items = {}
+    measurements = []
+    datum_labels = {}  # DatumDefinition id -> label
+    frames = {}  # DatumReferenceFrame id -> [DatumDefinition ids]
+
+    table = UnitTable()
+
+    for kind, char_type, element in records:
+        elem_id = element.get("id")
+        if kind == DEFINITION:
+            definitions[elem_id] = (
+                _definition_limits(element),
+                _child_float(element, "ToleranceValue"),
+                _child_text(element, "DatumReferenceFrameId"),
+                _definition_unit(element),
+            )
+        elif kind == NOMINAL:
+            nominals[elem_id] = _nominal_record(element, char_type)
+        elif kind == ITEM:
+            items[elem_id] = _child_text(element, "CharacteristicNominalId")
+        elif kind == MEASUREMENT:
+            measurements.append(_measurement_record(element))
+        elif kind == "DatumDefinition":
+            datum_labels[elem_id] = _child_text(element, "DatumLabel")
+        elif kind == "DatumReferenceFrame":
+            frames[elem_id] = [
+                d.text.strip() for d in element.iter(QIF_NS + "DatumDefinitionId") if d.text
+            ]
+        elif kind == "FileUnits":
+            table = UnitTable.from_element(element)
+
+    by_nominal = {}
+    for m in measurements:
+        by_nominal.setdefault(items.get(m["item_id"]), []).append(m)
+    first_item = {}
+    for item_id, nominal_id in items.items():
+        first_item.setdefault(nominal_id, item_id)
+
+    rows = []
+    sources = []  # per row: (nominal, definition), for the SI conversion
+    for nominal_id, nominal in nominals.items():
+        definition = definitions.get(
+            nominal["definition_id"], ((None, None, False), None, None, None)
+        )
+        limits, tolerance_value, drf_id, _ = definition
+        lower, upper = _absolute_limits(limits, nominal["target"])
+        if tolerance_value is None and limits[0] is not None and limits[1] is not None:
+            tolerance_value = limits[1] - limits[0]
+        datums = "|".join(
+            datum_labels.get(d) or f"#{d}" for d in frames.get(drf_id, [])
+        )
+        base = {
+            "nominal_id": nominal_id,
+            "name": nominal["name"],
+            "char_type": nominal["type"],
+            "tolerance": tolerance_value,
+            "lower_limit": lower,
+            "upper_limit": upper,
+            "target": nominal["target"],
+            "datums": datums or None,
+        }
+        nominal_measurements = by_nominal.get(nominal_id) or [None]
+        for m in nominal_measurements:
+            row = dict(base)
+            row["item_id"] = m["item_id"] if m else first_item.get(nominal_id)
+            row["measurement_id"] = m["id"] if m else None
+            row["value"] = m["value"] if m else None
+            row["status"] = m["status"] if m else None
+            row["value_unit"] = m["unit"] if m else None
+            rows.append(row)
+            sources.append((nominal, definition))
+    if si and rows:
+        _rows_to_si(table, rows, sources)
+    for row in rows:
+        del row["value_unit"]
+    return rows
+
+
+def _rows_to_si(table, rows, sources):
+    """Converts the numeric columns of extract_characteristic_rows() rows to SI in place, column by column."""
+    quantities = [characteristic_quantity(row["char_type"]) for row in rows]
+    definitions = [definition for _, definition in sources]
+    lower, upper, target = _si_limits(
+        table,
+        quantities,
+        [d[0] for d in definitions],
+        [d[3] for d in definitions],
+        [nominal["target"] for nominal, _ in sources],
+        [nominal["target_unit"] for nominal, _ in sources],
+    )
+    tolerance = table.to_si_mixed(
+        [_nan(row["tolerance"]) for row in rows],
+        quantities,
+        [d[3] for d in definitions],
+        pmi=True,
+        delta=True,
+    )
+    value = table.to_si_mixed(
+        [_nan(row["value"]) for row in rows],
+        quantities,
+        [row["value_unit"] for row in rows],
+        pmi=True,
+    )
+    for i, row in enumerate(rows):
+        row["lower_limit"] = _optional(lower[i])
+        row["upper_limit"] = _optional(upper[i])
+        row["target"] = _optional(target[i])
+        row["tolerance"] = _optional(tolerance[i])
+        row["value"] = _optional(value[i])
+
+
+class _ExtractCache:
+    """Per-file extracts keyed by content digest, so re-running a lot only parses new files."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            extract = self._entries.get(digest)
+            if extract is not None:
+                self._entries.move_to_end(digest)
+            return extract
+
+    def put(self, digest, extract):
+        with self._lock:
+            self._entries[digest] = extract
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+extract_cache = _ExtractCache()
+
+
+def capability_table(extracts):
+    """
+    Concatenates per-file extracts into columns and computes, per characteristic
+    key: n, mean, sigma (sample), min, max, Cp, Cpk, the out-of-tolerance rate
+    against the definition limits and the FAIL rate reported by the files.
+
+    Cp needs both limits; for one-sided (geometric) tolerances only Cpk is given.
+    Returns a pandas DataFrame sorted by Cpk (worst first).
+    """
+    extracts = list(extracts)
+    with stage_timer("capability.columns"):
+        keys = np.concatenate([e["key"] for e in extracts]) if extracts else np.array([], str)
+        values = np.concatenate([e["value"] for e in extracts]) if extracts else np.array([])
+        statuses = (
+            np.concatenate([e["status"] for e in extracts]) if extracts else np.array([], np.int8)
+        )
+        file_index = np.repeat(np.arange(len(extracts)), [len(e["key"]) for e in extracts])
+        limits = {}
+        for e in extracts:
+            for key, lim in e["limits"].items():
+                limits.setdefault(key, lim)
+
+    with stage_timer("capability.stats"):
+        codes, uniques = pd.factorize(keys, sort=True)
+        lsl = np.array([_nan(limits[k]["lsl"]) for k in uniques], dtype=np.float64)
+        usl = np.array([_nan(limits[k]["usl"]) for k in uniques], dtype=np.float64)
+
+        row_lsl, row_usl = lsl[codes], usl[codes]
+        out_of_tol = (values < np.where(np.isnan(row_lsl), -np.inf, row_lsl)) | (
+            values > np.where(np.isnan(row_usl), np.inf, row_usl)
+        )
+        frame = pd.DataFrame(
+            {
+                "code": codes,
+                "value": values,
+                "oot": out_of_tol,
+                "fail": statuses == 0,
+                "file": file_index,
+            }
+        )
+        grouped = frame.groupby("code", sort=True)
+        stats = grouped["value"].agg(["count", "mean", "std", "min", "max"])
+        stats["oot_rate"] = grouped["oot"].mean()
+        stats["fail_rate"] = grouped["fail"].mean()
+        stats["files"] = grouped["file"].nunique()
+        stats = stats.reindex(np.arange(len(uniques)))
+
+        sigma = stats["std"].to_numpy()
+        mean = stats["mean"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cp = (usl - lsl) / (6 * sigma)
+            cpu = (usl - mean) / (3 * sigma)
+            cpl = (mean - lsl) / (3 * sigma)
+            cpk = np.fmin(cpu, cpl)  # fmin ignores the NaN side of one-sided limits
+        sigma_ok = sigma > 0
+        stats["cp"] = np.where(sigma_ok, cp, np.nan)
+        stats["cpk"] = np.where(sigma_ok, cpk, np.nan)
+        stats.insert(0, "key", uniques)
+        stats.insert(1, "type", [limits[k]["type"] for k in uniques])
+        stats.insert(2, "unit", [limits[k].get("unit") for k in uniques])
+        stats["lsl"] = lsl
+        stats["usl"] = usl
+        stats = stats.rename(columns={"count": "n", "std": "sigma"})
+        stats = stats.sort_values("cpk", na_position="last", kind="stable")
+    return stats.reset_index(drop=True)
+
+
+def _nan(value):
+    return np.nan if value is None else value
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """
+    Process pool for cold extraction, created on first use. forkserver (or
+    spawn) rather than fork: this runs inside a threaded web server.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _executor
+
+
+def _extract_all(paths, progress, workers, parallel_min):
+    """(path, extract) for paths (cached ones first), in order; unreadable files become errors."""
+    extracts = [None] * len(paths)
+    errors = []
+    missing = []
+    for i, path in enumerate(paths):
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            errors.append({"file": path, "error": str(e)})
+            continue
+        extract = extract_cache.get(digest)
+        if extract is None:
+            missing.append((i, path, digest))
+        else:
+            extracts[i] = extract
+
+    total = len(paths)
+    done = total - len(missing)
+    if progress is not None:
+        progress("extract", done, total)
+
+    def finish(i, path, digest, future_or_call):
+        try:
+            extract = future_or_call()
+        except (OSError, etree.XMLSyntaxError) as e:
+            logger.error("Skipping %s: %s", path, e)
+            errors.append({"file": path, "error": str(e)})
+            return
+        extract_cache.put(digest, extract)
+        extracts[i] = extract
+
+    if workers > 1 and len(missing) >= parallel_min:
+        executor = _get_executor(workers)
+        futures = {
+            executor.submit(extract_results, path): (i, path, digest)
+            for i, path, digest in missing
+        }
+        for future in as_completed(futures):
+            i, path, digest = futures[future]
+            finish(i, path, digest, future.result)
+            done += 1
+            if progress is not None:
+                progress("extract", done, total)
+    else:
+        for i, path, digest in missing:
+            finish(i, path, digest, lambda: extract_results(path))
+            done += 1
+            if progress is not None:
+                progress("extract", done, total)
+
+    return [(p, e) for p, e in zip(paths, extracts) if e is not None], errors
+
+
+def _skipped_measurements(path, extract):
+    """Why some of a file's measurements are not in the table, or None if all are."""
+    reasons = []
+    if extract["unjoined"]:
+        reasons.append(
+            f"{extract['unjoined']} measurement(s) reference characteristics not defined in "
+            "this file (e.g. a separate plan by xId)"
+        )
+    if extract["unnamed"]:
+        reasons.append(
+            f"{extract['unnamed']} measurement(s) of unnamed characteristics, which can't "
+            "be matched across files"
+        )
+    if not reasons:
+        return None
+    return {"file": path, "skipped": "; ".join(reasons)}
+
+
+def lot_capability(paths, progress=None, workers=1, parallel_min=64):
+    """
+    Capability table for a lot of QIF result files, as a JSON-ready dict.
+
+    Args:
+        paths (list): file paths.
+        progress (callable, optional): progress(stage, done, total), as for QIFSummary.
+        workers (int): processes for extracting uncached files; used once at
+            least parallel_min files need parsing.
+    """
+    with stage_timer("capability.extract"):
+        extracted, errors = _extract_all(paths, progress, workers, parallel_min)
+
+    extracts = [extract for _, extract in extracted]
+    skipped = [_skipped_measurements(path, extract) for path, extract in extracted]
+    table = capability_table(extracts)
+    # NaN/inf are not valid JSON
+    rows = table.replace([np.inf, -np.inf], np.nan).astype(object)
+    rows = rows.where(pd.notna(rows), None).to_dict(orient="records")
+    return {
+        "files": len(extracts),
+        "measurements": int(table["n"].sum()) if len(table) else 0,
+        "characteristics": rows,
+        "errors": errors,
+        "skipped": [entry for entry in skipped if entry is not None],
+    }
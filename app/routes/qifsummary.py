@@ -3,8 +3,13 @@ import re
 from lxml import etree
 from xmldiff import main
 import logging
-import difflib
 import json
+from .metrics import stage_timer
+from .qifschema import CHARACTERISTIC_KINDS, NOMINAL, ITEM, characteristic_tags, check_transform
+from .qifsections import tree_section_hashes, section_cache
+from .qifstats import tree_characteristic_rows
+from .qifunits import UnitTable
+from .qifsnapshot import SnapshotElement, parse_qif
 
 logger = logging.getLogger(__name__)
 
@@ -95,35 +100,112 @@ def recursive_diff(d1, d2, base_path=""):
 
 
 class QIFSummary:
-    def __init__(self, filepath, schema_obj):
+    # How many elements traverse_xml visits between progress reports.
+    PROGRESS_EVERY = 2000
+
+    def __init__(
+        self,
+        filepath,
+        schema_obj,
+        progress=None,
+        snapshot=None,
+        canonical=None,
+        section_hashes=None,
+    ):
         """
         Initialize by parsing the QIF XML file using lxml and storing a preloaded XMLSchema object.
 
         Args:
             filepath (str): Path to the QIF XML file.
             schema_obj (xmlschema.XMLSchema): A preloaded XMLSchema object for validation.
-        """
+            progress (callable, optional): Called as progress(stage, done, total) from the
+                long-running loops (parse, validate, traverse, diff). It may raise to abort
+                the operation, which is how background jobs are cancelled.
+            snapshot (qifsnapshot.Snapshot, optional): The file's binary snapshot. When
+                given, `root` is read from it and the XML is only parsed if something
+                needs the lxml `tree` (schema validation, array decoding).
+            canonical (tuple, optional): (fingerprint, strip) of the file's canonical
+                form (see qifcanonical). Section results are then shared with
+                reformatted copies of the file.
+            section_hashes (dict, optional): The file's section hashes as stored at
+                ingest (QIFFile.section_hashes). Without them (and without a
+                snapshot) they are computed by serialising every section of the tree.
+        """
+        self.progress = progress
+        self._traversed = 0
+        self._element_count = None
+        self._traverse_stage = "traverse"
+        self._characteristic_index = None
+        self._section_hashes = section_hashes
+        self.canonical = canonical
         self.filepath = filepath
         self.name = os.path.basename(filepath)
         self.ns = {"qif": "http://qifstandards.org/xsd/qif3"}
         logger.debug("Initializing QIFSummary for file: %s", filepath)
-        self.basic_xml_errors = []
-        try:
-            with open(self.filepath, "rb") as f:
-                xml_content = f.read()
-
-            if b"##other" in xml_content:
-                xml_content = xml_content.replace(
-                    b"##other", b"http://example.com/other"
-                )
-                self.basic_xml_errors.append("Replaced b'##other' with a valid URI.")
-            self.tree = etree.fromstring(xml_content, parser=etree.XMLParser())
-            self.root = self.tree
-            logger.debug("Parsed XML tree successfully using lxml.")
-        except Exception as e:
-            logger.error("Failed to parse XML tree using lxml: %s", e)
-            raise
+        self.snapshot = snapshot
+        self._tree = None
         self.schema = schema_obj
+        if snapshot is not None:
+            self.root = snapshot.getroot()
+            self.basic_xml_errors = list(snapshot.xml_errors)
+            self._section_hashes = section_hashes or snapshot.sections
+            logger.debug("Opened snapshot %s.", snapshot.path)
+        else:
+            self.root = self.tree
+
+    @property
+    def tree(self):
+        """The lxml element tree of the file, parsed on first use."""
+        if self._tree is None:
+            self._report("parse")
+            try:
+                self._tree, self.basic_xml_errors = parse_qif(self.filepath)
+                logger.debug("Parsed XML tree successfully using lxml.")
+            except Exception as e:
+                logger.error("Failed to parse XML tree using lxml: %s", e)
+                raise
+        return self._tree
+
+    def _report(self, stage, done=None, total=None):
+        """Forwards a progress event to the optional progress callback."""
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    def _count_elements(self):
+        if self._element_count is None:
+            if self.snapshot is not None:
+                self._element_count = len(self.snapshot)
+            else:
+                self._element_count = sum(1 for _ in self.root.iter())
+        return self._element_count
+
+    def _traverse_root(self, stage="traverse"):
+        """traverse_xml(self.root) with progress accounting reset for this pass."""
+        self._traversed = 0
+        self._traverse_stage = stage
+        if self.progress is not None:
+            self._report(stage, 0, self._count_elements())
+        with stage_timer("traverse"):
+            result = self.traverse_xml(self.root)
+        self._report(stage, self._traversed, self._element_count)
+        return result
+
+    def section_hashes(self):
+        """{top-level section: sha256} of this document (see qifsections)."""
+        if self._section_hashes is None:
+            with stage_timer("section_hashes"):
+                self._section_hashes = tree_section_hashes(self.root)
+        return self._section_hashes
+
+    def _by_sections(self, result, compute):
+        """
+        compute(), or the value it returned for an earlier document whose
+        sections read by `result` (a SECTION_DEPENDENCIES key) are identical,
+        or which is a reformatted copy of this one.
+        """
+        return section_cache.get_or_compute(
+            result, self.section_hashes(), compute, self.canonical
+        )
 
     def remove_namespace(self, tag):
         """Remove any XML namespace from the tag name."""
@@ -139,12 +221,14 @@ class QIFSummary:
             dict: Contains keys "schema_valid" (bool) and "errors" (None or error details).
         """
         logger.debug("Performing schema validation using lxml XMLSchema.")
+        self._report("validate", 0, 1)
         try:
-            valid = self.schema.validate(self.tree)
+            with stage_timer("validate"):
+                valid = self.schema.validate(self.tree)
+            self._report("validate", 1, 1)
             if not valid:
                 # lxml error log is available as self.schema.error_log
                 errors = [e.message for e in self.schema.error_log]
-                print(errors)
                 logger.debug("Schema validation failed with errors: %s", errors)
                 return {"schema_valid": valid, "errors": errors}
             logger.debug("Schema validation successful.")
@@ -153,6 +237,36 @@ class QIFSummary:
             logger.error("Exception in get_schema_validation: %s", e)
             return {"schema_valid": False, "errors": str(e)}
 
+    def get_check_report(self):
+        """
+        Runs the standard's XSLT checks (xsd/Check/Check.xsl) over the QIF file,
+        linked documents included.
+
+        Returns:
+            dict: Contains keys "checks_passed" (bool) and "errors" (list of
+            {"check", "document", "report", "node"}, or a message if the checks
+            could not run, e.g. for a linked document that does not exist).
+        """
+        logger.debug("Running XSLT checks.")
+        try:
+            with stage_timer("xslt_checks"):
+                report = check_transform()(self.tree)
+        except Exception as e:
+            logger.error("Exception in get_check_report: %s", e)
+            return {"checks_passed": False, "errors": str(e)}
+        errors = []
+        for error in report.getroot().iter("Error"):
+            linked = next(error.iterancestors("CheckLinkedDocument"), None)
+            errors.append(
+                {
+                    "check": error.getparent().tag,
+                    "document": linked.get("uri") if linked is not None else None,
+                    "report": " ".join(error.findtext("Report", "").split()),
+                    "node": error.findtext("Node"),
+                }
+            )
+        return {"checks_passed": not errors, "errors": errors}
+
     def get_top_section_summary(self):
         """Returns a dictionary with counts for each top-level element."""
         logger.debug("Calculating top section summary.")
@@ -297,6 +411,24 @@ class QIFSummary:
         logger.debug("Normalized units rows: %s", rows)
         return rows, sorted(all_columns)
 
+    def _summarise_units(self):
+        """(normalized rows, columns, {SI unit: {unit: factor}}, FileUnits repetition)."""
+        normalized_units, unit_columns = self.normalize_units(self.get_file_units_dict())
+        organised_units = {}
+        for item in normalized_units:
+            if "UnitConversion Factor" in item.keys():
+                if item["SIUnitName"] not in organised_units:
+                    organised_units[item["SIUnitName"]] = {}
+                organised_units[item["SIUnitName"]][item["UnitName"]] = item[
+                    "UnitConversion Factor"
+                ]
+        return (
+            normalized_units,
+            unit_columns,
+            organised_units,
+            self.get_repeated_section_summary(),
+        )
+
     def get_summary(self):
         """
         Returns a high-level summary dictionary containing:
@@ -306,27 +438,30 @@ class QIFSummary:
           - normalized units table (rows and column headers).
         """
         logger.debug("Generating complete summary for file: %s", self.filepath)
-        normalized_units, unit_columns = self.normalize_units(
-            self.get_file_units_dict()
-        )
-        organised_units = {}
-        for item in normalized_units:
-            if "UnitConversion Factor" in item.keys():
-                if item["SIUnitName"] not in organised_units:
-                    organised_units[item["SIUnitName"]] = {}
-                organised_units[item["SIUnitName"]][item["UnitName"]] = item[
-                    "UnitConversion Factor"
-                ]
+        # Sections unchanged since an earlier revision (or shared with another
+        # file) are not summarised again.
+        with stage_timer("summary.units"):
+            (
+                normalized_units,
+                unit_columns,
+                organised_units,
+                fileunits_repetition,
+            ) = self._by_sections("summary.units", self._summarise_units)
+
+        with stage_timer("summary.top_sections"):
+            top_sections = self.get_top_section_summary()
+        with stage_timer("summary.features"):
+            feature_summary = self._by_sections("summary.features", self.get_feature_summary)
 
         summary = {
             "filename": os.path.basename(self.filepath),
             "file_size": round(os.path.getsize(self.filepath) / 1024, 2),
             "qif_version": self.root.attrib.get("versionQIF")
             or self.root.attrib.get("version", "Unknown"),
-            "top_sections": self.get_top_section_summary(),
-            "feature_summary": self.get_feature_summary(),
-            "fileunits_repetition": self.get_repeated_section_summary(),
-            "validation": self.get_schema_validation(),
+            "top_sections": top_sections,
+            "feature_summary": feature_summary,
+            "fileunits_repetition": fileunits_repetition,
+            "validation": self._by_sections("validation", self.get_schema_validation),
             "xml_errors": self.basic_xml_errors,
             "normalized_units": normalized_units,
             "organised_units": organised_units,
@@ -335,6 +470,43 @@ class QIFSummary:
         logger.debug("Final summary: %s", summary)
         return summary
 
+    def get_primary_units(self):
+        """Primary (and PMI primary) unit per quantity, with its SI conversion (see qifunits)."""
+        file_units = self.root.find("{http://qifstandards.org/xsd/qif3}FileUnits")
+        return UnitTable.from_element(file_units).describe()
+
+    def get_si_characteristics(self):
+        """
+        {nominal name: {type, target, lower, upper, values}} with every number
+        converted to SI and rounded to 9 significant digits, so that the same
+        part measured in inch and in mm compares equal. Unnamed nominals are
+        left out: their ids mean nothing in another file.
+        """
+        return self._by_sections("characteristics.si", self._si_characteristics)
+
+    def _si_characteristics(self):
+        def rounded(value):
+            return None if value is None else float(f"{value:.9g}")
+
+        characteristics = {}
+        # Built from the loaded tree (or snapshot) rather than streaming the file again
+        for row in tree_characteristic_rows(self.root, si=True):
+            if not row["name"]:
+                continue
+            entry = characteristics.setdefault(
+                row["name"],
+                {
+                    "type": row["char_type"],
+                    "target": rounded(row["target"]),
+                    "lower": rounded(row["lower_limit"]),
+                    "upper": rounded(row["upper_limit"]),
+                    "values": [],
+                },
+            )
+            if row["value"] is not None:
+                entry["values"].append(rounded(row["value"]))
+        return characteristics
+
     def traverse_xml(self, element, current_path=""):
         """
         Recursively converts an XML element into a dictionary, storing a '_path'
@@ -400,6 +572,13 @@ class QIFSummary:
         node_dict = {"_path": new_path}  # store the path for reference
         text = (element.text or "").strip() or None
 
+        if self.progress is not None:
+            self._traversed += 1
+            if self._traversed % self.PROGRESS_EVERY == 0:
+                self._report(
+                    self._traverse_stage, self._traversed, self._count_elements()
+                )
+
         children = list(element)  # get all immediate children
         if children:
             grouped_children = {}
@@ -453,6 +632,13 @@ class QIFSummary:
         def dict_from_fileunits_summary(obj):
             return {"fileunits_repetition": obj.get_repeated_section_summary()}
 
+        def dict_from_si_summary(obj):
+            # Values in SI, so an inch file and its mm twin only differ in "units"
+            return {
+                "units": obj.get_primary_units(),
+                "characteristics_si": obj.get_si_characteristics(),
+            }
+
         # We'll gather dictionaries from each side
         d1 = {}
         d2 = {}
@@ -467,6 +653,9 @@ class QIFSummary:
         d1.update(dict_from_fileunits_summary(self))
         d2.update(dict_from_fileunits_summary(other))
 
+        d1.update(dict_from_si_summary(self))
+        d2.update(dict_from_si_summary(other))
+
         # Compare QIF version as well
         v1 = self.root.attrib.get("versionQIF") or self.root.attrib.get(
             "version", "Unknown"
@@ -477,7 +666,10 @@ class QIFSummary:
         d1["qif_version"] = v1
         d2["qif_version"] = v2
 
-        all_diffs = recursive_diff(d1, d2)
+        self._report("diff", 0, 1)
+        with stage_timer("diff"):
+            all_diffs = recursive_diff(d1, d2)
+        self._report("diff", 1, 1)
 
         return {"differences": all_diffs, "name1": self.name, "name2": other.name}
 
@@ -494,11 +686,15 @@ class QIFSummary:
             - "name2": filename for other
         """
         # 1) Build dictionary from entire XML tree
-        d1 = self.traverse_xml(self.root)
-        d2 = other.traverse_xml(other.root)
+        other.progress = other.progress or self.progress
+        d1 = self._traverse_root("traverse file1")
+        d2 = other._traverse_root("traverse file2")
 
         # 2) Compare those dictionaries
-        differences = recursive_diff(d1, d2)
+        self._report("diff", 0, 1)
+        with stage_timer("diff"):
+            differences = recursive_diff(d1, d2)
+        self._report("diff", 1, 1)
 
         return {"differences": differences, "name1": self.name, "name2": other.name}
 
@@ -508,6 +704,10 @@ class QIFSummary:
         and gathers downward references (FeatureNominalIds) plus upward references
         (CharacteristicItems referencing the nominal, PMIDisplay referencing ID).
         """
+        with stage_timer("chase"):
+            return self._chase_feature(feature_name)
+
+    def _chase_feature(self, feature_name):
         result = {
             "feature_name": feature_name,
             "nominal_id": None,
@@ -542,54 +742,74 @@ class QIFSummary:
     # HELPER METHODS
     # -------------------------------------------------------------------------
 
+    def _characteristics(self, kind):
+        """
+        All elements of one characteristic kind (NOMINAL, ITEM...) in document
+        order. The first call collects every member of the four substitution
+        groups in Characteristics.xsd (Circularity, Runout, Length... not just
+        the common types) in a single pass over the tree.
+        """
+        if self._characteristic_index is None:
+            kind_of = {
+                tag: k for k in CHARACTERISTIC_KINDS for tag in characteristic_tags(k)
+            }
+            index = {k: [] for k in CHARACTERISTIC_KINDS}
+            with stage_timer("characteristics"):
+                for elem in self.root.iter(*kind_of):
+                    index[kind_of[elem.tag]].append(elem)
+            self._characteristic_index = index
+        return self._characteristic_index[kind]
+
     def _find_characteristic_nominal_by_name(self, feature_name):
         """
         Finds <CharacteristicNominal> with <Name>==feature_name. Returns the element or None.
         """
-        nominal_tags = [
-            "DiameterCharacteristicNominal",
-            "FlatnessCharacteristicNominal",
-            "PositionCharacteristicNominal",
-            "ProfileCharacteristicNominal",
-            "SurfaceProfileCharacteristicNominal",
-            "AngularityCharacteristicNominal",
-            "ParallelismCharacteristicNominal",
-            "PerpendicularityCharacteristicNominal",
-        ]
-        for tag in nominal_tags:
-            nominals = self.root.findall(".//{http://qifstandards.org/xsd/qif3}" + tag)
-
-            for nom in nominals:
-                name_elem = nom.find("{http://qifstandards.org/xsd/qif3}Name")
-                if name_elem is not None and name_elem.text == feature_name:
-                    return nom
+        for nom in self._characteristics(NOMINAL):
+            name_elem = nom.find("{http://qifstandards.org/xsd/qif3}Name")
+            if name_elem is not None and name_elem.text == feature_name:
+                return nom
         return None
-    
+
     def _find_characteristic_all_names(self):
         """
-        Finds <CharacteristicNominal> with <Name>==feature_name. Returns the element or None.
+        Finds every <CharacteristicNominal> that has a <Name>. Returns a list of elements.
         """
-        nominal_tags = [
-            "DiameterCharacteristicNominal",
-            "FlatnessCharacteristicNominal",
-            "PositionCharacteristicNominal",
-            "ProfileCharacteristicNominal",
-            "SurfaceProfileCharacteristicNominal",
-            "AngularityCharacteristicNominal",
-            "ParallelismCharacteristicNominal",
-            "PerpendicularityCharacteristicNominal",
+        return [
+            nom
+            for nom in self._characteristics(NOMINAL)
+            if nom.find("{http://qifstandards.org/xsd/qif3}Name") is not None
         ]
-        noms_with_names = []
-        for tag in nominal_tags:
-            nominals = self.root.findall(".//{http://qifstandards.org/xsd/qif3}" + tag)
-
-            for nom in nominals:
-                name_elem = nom.find("{http://qifstandards.org/xsd/qif3}Name")
-                if name_elem is not None:
-                    noms_with_names.append(nom)
-        return noms_with_names
     
     def assert_symmetry(self):
+        return self._by_sections("audit", self._assert_symmetry)
+
+    def audit_summary(self):
+        """
+        Condensed assert_symmetry(): which characteristic nominals are missing
+        feature nominals, characteristic items or PMI displays.
+        """
+        nominals = []
+        for chain in self.assert_symmetry():
+            down = chain["down_chain"]
+            up = chain["up_chain"]
+            entry = {
+                "name": chain["name"],
+                "nominal_id": chain["nominal_id"],
+                "feature_nominals": len(down.get("feature_nominals", [])),
+                "characteristic_items": len(up.get("characteristic_items", [])),
+                "pmi_displays": len(up.get("pmi_displays", [])),
+            }
+            entry["complete"] = all(
+                entry[k] for k in ("feature_nominals", "characteristic_items", "pmi_displays")
+            )
+            nominals.append(entry)
+        return {
+            "nominals": len(nominals),
+            "incomplete": sum(1 for n in nominals if not n["complete"]),
+            "details": nominals,
+        }
+
+    def _assert_symmetry(self):
         all_noms = self._find_characteristic_all_names()
         all_results = []
         for nom in all_noms:
@@ -603,9 +823,13 @@ class QIFSummary:
             all_results.append(my_dict)
         
         for r in all_results:
-            print(r['name'])
-            print (r['summary'] is not None, r['down_chain'] is not None, r['up_chain'] is not None)
-            print()
+            logger.debug(
+                "%s: summary=%s down_chain=%s up_chain=%s",
+                r["name"],
+                r["summary"] is not None,
+                r["down_chain"] is not None,
+                r["up_chain"] is not None,
+            )
         return all_results
 
 
@@ -645,11 +869,8 @@ class QIFSummary:
         up_data = {}
 
         # 1) Find all CharacteristicItems referencing nominal_id
-        char_items = self.root.findall(
-            ".//{http://qifstandards.org/xsd/qif3}CharacteristicItem"
-        )
         referencing_items = []
-        for item in char_items:
+        for item in self._characteristics(ITEM):
             cnom_id_elem = item.find(
                 "{http://qifstandards.org/xsd/qif3}CharacteristicNominalId"
             )
@@ -682,6 +903,11 @@ class QIFSummary:
         Example: <FeatureNominal id="32243">...
         """
         path = f".//{{http://qifstandards.org/xsd/qif3}}{tag_name}"
+        if self.snapshot is not None:
+            index = self.snapshot.element_by_id(elem_id)
+            if index is None or self.snapshot.tag(index) != path[3:]:
+                return None
+            return self.snapshot.element(index)
         candidates = self.root.findall(path)
         for c in candidates:
             if c.get("id") == elem_id:
@@ -707,7 +933,10 @@ class QIFSummary:
         # Make sure pretty_print=True for readable indentation, 
         # and decode from bytes to get a Python string.
         try:
-            info["xml_snippet"] = etree.tostring(elem, pretty_print=True).decode("utf-8")
+            if isinstance(elem, SnapshotElement):
+                info["xml_snippet"] = elem.tostring(pretty_print=True)
+            else:
+                info["xml_snippet"] = etree.tostring(elem, pretty_print=True).decode("utf-8")
         except Exception as e:
             # If there's some reason serialization fails, store an error message 
             # (should be unlikely unless there's invalid data).
@@ -732,4 +961,4 @@ class QIFSummary:
         streaming approaches for extremely large files.
         """
         # Leverage the self.traverse_xml(...) method defined in QIFSummary
-        return self.traverse_xml(self.root, current_path="")
\ No newline at end of file
+        return self._traverse_root()
\ No newline at end of file
@@ -0,0 +1,269 @@
+import math
+import threading
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from lxml import etree
+from .qifschema import QIF_NS, element_type
+from .response_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# Quantities with a primary unit in FileUnits (<Name>Unit, e.g. LinearUnit) and
+# a unit attribute on values (<name>Unit, e.g. linearUnit="mm"), with the SI
+# unit assumed when a file declares none.
+SI_UNITS = {
+    "area": "square meter",
+    "angular": "radian",
+    "force": "newton",
+    "linear": "meter",
+    "mass": "kilogram",
+    "pressure": "pascal",
+    "speed": "meter per second",
+    "temperature": "kelvin",
+    "time": "second",
+}
+QUANTITIES = tuple(SI_UNITS)
+
+# Numeric array tags holding lengths. Normals and directions are unit
+# vectors; colours, indices and flags have no unit.
+LINEAR_ARRAY_TAGS = frozenset(("Points", "CPs", "BinaryPoints", "Deviations", "ProbeRadii"))
+# Curves on surfaces: their (u, v) points are surface parameters, not lengths.
+PARAMETER_SPACE_PARENTS = frozenset(("Nurbs12Core", "Polyline12Core"))
+
+# Where PMI<Name>Unit overrides <Name>Unit (Units.xsd, PrimaryUnitsType).
+PMI_SCOPES = (QIF_NS + "Characteristics", QIF_NS + "CharacteristicMeasurements")
+
+
+def _local(tag):
+    return tag[tag.index("}") + 1 :] if tag.startswith("{") else tag
+
+
+def _text(element, tag):
+    child = element.find(QIF_NS + tag)
+    return child.text.strip() if child is not None and child.text else None
+
+
+def _number(element, path, default):
+    child = element.find(QIF_NS + path.replace("/", "/" + QIF_NS))
+    try:
+        return float(child.text)
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+class UnitTable:
+    """
+    The FileUnits section of one document compiled into lookups: every
+    declared unit's (SI name, factor, offset) per quantity, and the primary
+    (and PMI primary) unit of each quantity. Conversions follow UnitConversion:
+    SI = (value + Offset) * Factor.
+    """
+
+    def __init__(self):
+        self.units = {}  # (quantity, unit name) -> (SI name, factor, offset)
+        self.primary = {}  # quantity -> unit name
+        self.pmi = {}  # quantity -> unit name, overriding primary in PMI_SCOPES
+
+    @classmethod
+    def from_element(cls, file_units):
+        table = cls()
+        if file_units is None:
+            return table
+        for group in file_units:
+            if not isinstance(group.tag, str):
+                continue
+            is_primary = _local(group.tag) == "PrimaryUnits"
+            for unit in group:
+                if not isinstance(unit.tag, str):
+                    continue
+                tag = _local(unit.tag)
+                is_pmi = tag.startswith("PMI")
+                base = tag[3:] if is_pmi else tag
+                quantity = base[:1].lower() + base[1:-4] if base.endswith("Unit") else None
+                name = _text(unit, "UnitName")
+                if quantity not in SI_UNITS or name is None:
+                    continue
+                table.units[(quantity, name)] = (
+                    _text(unit, "SIUnitName") or SI_UNITS[quantity],
+                    _number(unit, "UnitConversion/Factor", 1.0),
+                    _number(unit, "UnitConversion/Offset", 0.0),
+                )
+                if is_primary:
+                    (table.pmi if is_pmi else table.primary)[quantity] = name
+        return table
+
+    @classmethod
+    def from_file(cls, path):
+        """Compiles the FileUnits of path; parsing stops as soon as that section ends."""
+        for _, element in etree.iterparse(
+            path, events=("end",), tag=QIF_NS + "FileUnits", huge_tree=True
+        ):
+            return cls.from_element(element)
+        return cls()
+
+    def unit(self, quantity, unit=None, pmi=False):
+        """
+        (name, SI name, factor, offset) of `unit`, or of the primary unit of
+        quantity (its PMI primary unit when pmi) when unit is None. A quantity
+        without a declared primary unit is taken to be in SI already; a unit
+        name the file does not declare converts to NaN.
+        """
+        if not unit:
+            unit = (pmi and self.pmi.get(quantity)) or self.primary.get(quantity)
+            if unit is None:
+                return SI_UNITS.get(quantity), SI_UNITS.get(quantity), 1.0, 0.0
+        entry = self.units.get((quantity, unit))
+        if entry is None:
+            return unit, SI_UNITS.get(quantity), math.nan, math.nan
+        return (unit,) + entry
+
+    def to_si(self, values, quantity, unit=None, pmi=False, delta=False):
+        """
+        values (a scalar or anything np.asarray takes) in SI, as float64.
+        delta: the values are differences (tolerance widths, deviations), to
+        which Offset does not apply. A None quantity leaves values as they are.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if quantity is None:
+            return values
+        _, _, factor, offset = self.unit(quantity, unit, pmi)
+        return values * factor if delta else (values + offset) * factor
+
+    def to_si_mixed(self, values, quantities, units=None, pmi=False, delta=False):
+        """
+        to_si() for values of different quantities and units: quantities and
+        units are a value or a sequence as long as values (a None unit means
+        the primary one). Each distinct (quantity, unit) pair is looked up once
+        and the conversion is applied to the whole array in one step.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return values
+        quantity_codes, quantity_names = _codes(quantities, values.shape)
+        unit_codes, unit_names = _codes(units, values.shape)
+        pairs, inverse = np.unique(
+            quantity_codes * len(unit_names) + unit_codes, return_inverse=True
+        )
+        factors = np.ones(len(pairs))
+        offsets = np.zeros(len(pairs))
+        for i, pair in enumerate(pairs):
+            quantity, unit = divmod(int(pair), len(unit_names))
+            if quantity_names[quantity]:
+                _, _, factors[i], offsets[i] = self.unit(
+                    quantity_names[quantity], unit_names[unit] or None, pmi
+                )
+        inverse = inverse.reshape(values.shape)
+        if delta:
+            return values * factors[inverse]
+        return (values + offsets[inverse]) * factors[inverse]
+
+    def describe(self):
+        """Primary units per quantity (PMI overrides under "pmi"), with their SI conversion."""
+
+        def entry(quantity, name):
+            unit, si_name, factor, offset = self.unit(quantity, name)
+            return {"unit": unit, "si_unit": si_name, "factor": factor, "offset": offset}
+
+        return {
+            "primary": {q: entry(q, name) for q, name in sorted(self.primary.items())},
+            "pmi": {q: entry(q, name) for q, name in sorted(self.pmi.items())},
+        }
+
+
+def _codes(labels, shape):
+    """(integer code per value, distinct labels) for a label or sequence of labels; None becomes ""."""
+    if labels is None or isinstance(labels, str):
+        return np.zeros(shape, dtype=np.intp), [labels or ""]
+    codes, names = pd.factorize(np.asarray(labels, dtype=object).ravel())
+    names = list(names) + [""]
+    # factorize codes None as -1, which wraps around to the "" appended last.
+    return (codes % len(names)).reshape(shape), names
+
+
+class _UnitTableCache:
+    """Compiled unit tables keyed by file digest."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            table = self._entries.get(digest)
+            if table is not None:
+                self._entries.move_to_end(digest)
+            return table
+
+    def put(self, digest, table):
+        with self._lock:
+            self._entries[digest] = table
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+unit_cache = _UnitTableCache()
+
+
+def unit_table(path):
+    """The UnitTable of path, compiled once per file content."""
+    digest = file_digest(path)
+    table = unit_cache.get(digest)
+    if table is None:
+        table = UnitTable.from_file(path)
+        unit_cache.put(digest, table)
+    return table
+
+
+@lru_cache(maxsize=None)
+def characteristic_quantity(char_type):
+    """
+    Quantity of a characteristic type's values ("linear" for Diameter and
+    Position, "angular" for Angle...), read off the schema type of its
+    measured Value or nominal TargetValue. None for types without a numeric
+    value in a known quantity (threads, welds, user-defined units).
+    """
+    value_type = element_type(
+        f"{char_type}CharacteristicMeasurementType", "Value"
+    ) or element_type(f"{char_type}CharacteristicNominalType", "TargetValue")
+    if not value_type or not value_type.endswith("ValueType"):
+        return None
+    name = value_type[: -len("ValueType")]
+    if name.startswith("Measured"):
+        name = name[len("Measured") :]
+    quantity = name[:1].lower() + name[1:]
+    return quantity if quantity in SI_UNITS else None
+
+
+def value_unit(element):
+    """The unit named by a unit attribute of element (linearUnit="mm" -> "mm"), else None."""
+    if element is None:
+        return None
+    for quantity in QUANTITIES:
+        unit = element.get(quantity + "Unit")
+        if unit:
+            return unit
+    return None
+
+
+def in_pmi_scope(element):
+    """True for elements inside Characteristics or CharacteristicMeasurements."""
+    return next(element.iterancestors(*PMI_SCOPES), None) is not None
+
+
+def array_to_si(table, element, data):
+    """
+    (data in SI, SI unit name) for an array decoded from element, or (data,
+    None) when the array does not hold lengths.
+    """
+    parent = element.getparent()
+    if _local(element.tag) not in LINEAR_ARRAY_TAGS or (
+        parent is not None and _local(parent.tag) in PARAMETER_SPACE_PARENTS
+    ):
+        return data, None
+    pmi = in_pmi_scope(element)
+    _, si_name, _, _ = table.unit("linear", value_unit(element), pmi)
+    return table.to_si(data, "linear", value_unit(element), pmi), si_name
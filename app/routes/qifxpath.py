@@ -0,0 +1,235 @@
+import os
+import time
+import zlib
+import threading
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from lxml import etree
+from .qifarrays import element_path
+from .response_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# Prefixes available in every expression, e.g. //qif:PositionCharacteristicNominal
+NAMESPACES = {
+    "qif": "http://qifstandards.org/xsd/qif3",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+}
+
+# Characters of element text returned with each element result.
+TEXT_PREVIEW_CHARS = 200
+
+
+class _CompiledXPathCache:
+    """
+    LRU of compiled etree.XPath objects per expression. lxml serialises calls
+    on one XPath object, so each thread compiles and keeps its own.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def get(self, expression):
+        entries = getattr(self._local, "entries", None)
+        if entries is None:
+            entries = self._local.entries = OrderedDict()
+        compiled = entries.get(expression)
+        if compiled is None:
+            compiled = etree.XPath(expression, namespaces=NAMESPACES, smart_strings=False)
+            entries[expression] = compiled
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(expression)
+        return compiled
+
+
+compiled_cache = _CompiledXPathCache()
+
+
+def compile_xpath(expression):
+    """Compiled (cached) XPath for expression; raises etree.XPathSyntaxError if it is invalid."""
+    return compiled_cache.get(expression)
+
+
+class _TreeCache:
+    """
+    Parsed documents keyed by content digest, bounded by the total size of the
+    source files (a parsed tree takes several times its file size). Each
+    process has its own.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest -> (tree, file size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def put(self, digest, tree, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[digest] = (tree, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+
+tree_cache = _TreeCache()
+
+
+def load_tree(path, cache=True):
+    """(tree, cached) for path, parsing it unless an identical file is in tree_cache."""
+    if not cache:
+        return etree.parse(path, etree.XMLParser(huge_tree=True)), False
+    digest = file_digest(path)
+    tree = tree_cache.get(digest)
+    if tree is not None:
+        return tree, True
+    tree = etree.parse(path, etree.XMLParser(huge_tree=True))
+    tree_cache.put(digest, tree, os.path.getsize(path))
+    return tree, False
+
+
+def _serialize(item, xml=False):
+    if isinstance(item, etree._Element):
+        if not isinstance(item.tag, str):
+            # comment or processing instruction
+            return {"tag": None, "text": item.text}
+        result = {
+            "tag": etree.QName(item).localname,
+            "id": item.get("id"),
+            "line": item.sourceline,
+            "path": element_path(item),
+            "text": (item.text or "").strip()[:TEXT_PREVIEW_CHARS] or None,
+        }
+        if xml:
+            result["xml"] = etree.tostring(item, encoding="unicode", with_tail=False)
+        return result
+    if isinstance(item, bytes):
+        return item.decode("utf-8", "replace")
+    return item
+
+
+def query_file(
+    path, expression, offset=0, limit=None, xml=False, cache=True, raise_errors=False
+):
+    """
+    Evaluates expression against one file. Returns a record with the total
+    result count, results[offset:offset + limit] and the time spent parsing
+    (zero on a cache hit) and evaluating. Node-set results are returned as
+    element summaries (tag, id, line, path, text, optionally xml); scalar
+    results (count(), string(), booleans) as a single value. Unless
+    raise_errors, failures are reported in record["error"] instead of raised.
+    """
+    record = {"path": path}
+    start = time.perf_counter()
+    try:
+        tree, cached = load_tree(path, cache)
+        parsed = time.perf_counter()
+        value = compile_xpath(expression)(tree)
+        queried = time.perf_counter()
+    except (OSError, etree.XMLSyntaxError, etree.XPathError) as e:
+        if raise_errors:
+            raise
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["timing"] = {"total_s": round(time.perf_counter() - start, 6)}
+        return record
+
+    if isinstance(value, list):
+        end = None if limit is None else offset + limit
+        record["count"] = len(value)
+        record["results"] = [_serialize(item, xml) for item in value[offset:end]]
+    else:
+        record["count"] = 1
+        record["scalar"] = True
+        record["results"] = [_serialize(value)]
+    record["offset"] = offset
+    record["timing"] = {
+        "cached": cached,
+        "parse_s": round(parsed - start, 6),
+        "query_s": round(queried - parsed, 6),
+        "total_s": round(time.perf_counter() - start, 6),
+    }
+    return record
+
+
+def _query_task(task):
+    """Worker side of query_files(); configures this process's tree cache from the task."""
+    path, expression, offset, limit, xml, cache_bytes = task
+    tree_cache.max_bytes = cache_bytes
+    return query_file(path, expression, offset, limit, xml)
+
+
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _get_shards(workers):
+    """
+    One single-process executor per worker. A file always goes to the same
+    shard (by content digest), so repeated queries over the same uploads hit
+    that worker's parsed tree instead of re-parsing it elsewhere. forkserver
+    (or spawn) rather than fork: this runs inside a threaded web server.
+    """
+    with _shards_lock:
+        if not _shards:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            for _ in range(max(1, workers)):
+                _shards.append(ProcessPoolExecutor(max_workers=1, mp_context=context))
+        return _shards
+
+
+def query_files(
+    paths,
+    expression,
+    offset=0,
+    limit=None,
+    xml=False,
+    workers=1,
+    parallel_min=4,
+    cache_bytes=256 * 1024 * 1024,
+):
+    """
+    Yields query_file() records for paths as they finish. Fewer than
+    parallel_min files (or workers <= 1) run in this process against its own
+    tree cache; more are spread over the worker shards.
+    """
+    compile_xpath(expression)  # fail fast on a syntax error
+    if workers <= 1 or len(paths) < parallel_min:
+        tree_cache.max_bytes = cache_bytes
+        for path in paths:
+            yield query_file(path, expression, offset, limit, xml)
+        return
+
+    shards = _get_shards(workers)
+    futures = []
+    for path in paths:
+        try:
+            key = int(file_digest(path)[:8], 16)
+        except OSError:
+            key = zlib.crc32(path.encode())
+        shard = shards[key % len(shards)]
+        futures.append(
+            shard.submit(_query_task, (path, expression, offset, limit, xml, cache_bytes))
+        )
+    for future in as_completed(futures):
+        yield future.result()
@@ -0,0 +1,247 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .metrics import Counter, Histogram, register, register_collector
+
+remote_requests = register(
+    Counter(
+        "remote_requests_total",
+        "Calls to remote services by outcome (ok, error, timeout, cached, open).",
+        ("service", "result"),
+    )
+)
+remote_duration = register(
+    Histogram(
+        "remote_request_duration_seconds",
+        "Latency of calls that reached the remote service, retries included.",
+        ("service",),
+    )
+)
+
+
+class RemoteError(Exception):
+    """A remote call that failed, timed out or was refused by the circuit breaker."""
+
+
+class CircuitOpen(RemoteError):
+    """Raised without calling out while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service: after failure_threshold consecutive
+    failures calls are refused for reset_timeout seconds, then one trial call
+    is let through (half-open); its success closes the breaker again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """True if a call may go out now; in half-open state only one at a time."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # Trial calls that fail re-open the breaker for another period.
+                self.opened_at = time.monotonic()
+
+
+class _ResponseCache:
+    """JSON responses of successful calls, keyed by URL and canonical request body."""
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, data)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RemoteClient:
+    """
+    A shared, pooled requests.Session for one remote service. Every call has
+    connect and read timeouts; connection errors and 502/503/504 answers are
+    retried a bounded number of times with exponential backoff; repeated
+    failures open a circuit breaker so callers fail fast instead of waiting
+    out the timeouts; and identical requests are answered from an LRU cache.
+    Only use it for requests that are safe to repeat and to cache.
+    """
+
+    def __init__(
+        self,
+        service,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        retries=2,
+        backoff=0.25,
+        pool_size=10,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        cache_entries=256,
+        cache_ttl=300.0,
+    ):
+        self.service = service
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.cache = _ResponseCache(cache_entries, cache_ttl)
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=False,  # a read timeout already cost read_timeout seconds; don't repeat it
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,  # POSTs included: callers only send repeatable requests
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, service, config, prefix):
+        """A client configured from <prefix>_CONNECT_TIMEOUT, <prefix>_READ_TIMEOUT... in config."""
+        names = {
+            "connect_timeout": "CONNECT_TIMEOUT",
+            "read_timeout": "READ_TIMEOUT",
+            "retries": "RETRIES",
+            "backoff": "BACKOFF",
+            "pool_size": "POOL_SIZE",
+            "failure_threshold": "FAILURE_THRESHOLD",
+            "reset_timeout": "RESET_TIMEOUT",
+            "cache_entries": "CACHE_ENTRIES",
+            "cache_ttl": "CACHE_TTL",
+        }
+        return cls(
+            service,
+            **{arg: config[f"{prefix}_{name}"] for arg, name in names.items() if f"{prefix}_{name}" in config},
+        )
+
+    def post_json(self, url, payload, headers=None):
+        """
+        POSTs payload as JSON and returns the decoded JSON answer. Raises
+        RemoteError (CircuitOpen while the breaker is open) on timeouts,
+        connection errors and non-200 answers.
+        """
+        key = (url, json.dumps(payload, sort_keys=True))
+        data = self.cache.get(key)
+        if data is not None:
+            remote_requests.inc(service=self.service, result="cached")
+            return data
+        if not self.breaker.allow():
+            remote_requests.inc(service=self.service, result="open")
+            raise CircuitOpen(f"{self.service} is unavailable, not retrying for now")
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            if response.status_code != 200:
+                raise RemoteError(f"{self.service} error: {response.status_code} - {response.text[:200]}")
+            data = response.json()
+        except requests.Timeout as e:
+            self.breaker.record_failure()
+            remote_requests.inc(service=self.service, result="timeout")
+            raise RemoteError(f"{self.service} timed out") from e
+        except (requests.RequestException, ValueError, RemoteError) as e:
+            self.breaker.record_failure()
+            remote_requests.inc(service=self.service, result="error")
+            if isinstance(e, RemoteError):
+                raise
+            raise RemoteError(f"{self.service} request failed: {type(e).__name__}") from e
+        finally:
+            remote_duration.observe(time.perf_counter() - start, service=self.service)
+        self.breaker.record_success()
+        remote_requests.inc(service=self.service, result="ok")
+        self.cache.put(key, data)
+        return data
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service, config, prefix):
+    """The process-wide RemoteClient for service, created on first use."""
+    with _clients_lock:
+        client = _clients.get(service)
+        if client is None:
+            client = _clients[service] = RemoteClient.from_config(service, config, prefix)
+        return client
+
+
+@register_collector
+def _remote_client_metrics():
+    with _clients_lock:
+        clients = dict(_clients)
+    states = {"closed": 0, "half-open": 1, "open": 2}
+    yield (
+        "remote_circuit_state",
+        "gauge",
+        "Circuit breaker state per remote service (0 closed, 1 half-open, 2 open).",
+        [({"service": name}, states[c.breaker.state]) for name, c in clients.items()],
+    )
+    yield (
+        "remote_cache_entries",
+        "gauge",
+        "Cached remote responses per service.",
+        [({"service": name}, len(c.cache)) for name, c in clients.items()],
+    )
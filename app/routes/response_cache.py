@@ -0,0 +1,206 @@
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, make_response, g
+from .metrics import cache_requests, register_collector
+
+logger = logging.getLogger(__name__)
+
+# filepath -> (mtime_ns, size, hexdigest). Re-hashing a 100 MB upload on every
+# poll would cost more than the summary itself, so digests are only recomputed
+# when the file's stat signature changes (e.g. a re-upload under the same name).
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    """
+    Returns the sha256 hex digest of the file's content, cached per
+    (mtime, size) so repeated requests for an unchanged file only cost a stat().
+    """
+    st = os.stat(filepath)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        cached = _digest_cache.get(filepath)
+    if cached is not None and cached[:2] == signature:
+        return cached[2]
+
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_cache[filepath] = (signature[0], signature[1], digest)
+    return digest
+
+
+class RenderedResponseCache:
+    """
+    A small thread-safe LRU of rendered response bodies, bounded both by
+    number of entries and by total bytes. Keys already include the request
+    path, file digest and app version, so stale entries are never served; they simply
+    age out.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        size = len(body)
+        if size > self.max_bytes:
+            # Never let one giant dictxml flush everything else out.
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (body, mimetype)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (evicted_body, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted_body)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+rendered_cache = RenderedResponseCache()
+
+
+@register_collector
+def _rendered_cache_metrics():
+    stats = rendered_cache.stats()
+    yield (
+        "qif_rendered_cache_entries",
+        "gauge",
+        "Entries in the rendered-response cache.",
+        [({}, stats["entries"])],
+    )
+    yield (
+        "qif_rendered_cache_bytes",
+        "gauge",
+        "Bytes held by the rendered-response cache.",
+        [({}, stats["bytes"])],
+    )
+    yield (
+        "qif_rendered_cache_evictions_total",
+        "counter",
+        "Entries evicted from the rendered-response cache.",
+        [({}, stats["evictions"])],
+    )
+
+
+def _configure_cache():
+    cfg = current_app.config
+    rendered_cache.max_entries = cfg.get("RESPONSE_CACHE_MAX_ENTRIES", 256)
+    rendered_cache.max_bytes = cfg.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+
+def _apply_cache_headers(response, etag, max_age):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        # Always revalidate; with a strong ETag that is a cheap 304.
+        response.cache_control.no_cache = True
+    return response
+
+
+def cached_file_view(max_age=None):
+    """
+    Decorator for views whose output depends only on the request path, the
+    content of UPLOAD_FOLDER/<filename> and the app version.
+
+    - Emits a strong ETag of the form "<sha256>-<path hash>-<APP_VERSION>".
+      The path is part of it because views echo the filename, so two uploads
+      with the same bytes must not share a representation.
+    - Answers If-None-Match with 304 without loading the QIF at all.
+    - Optionally serves the rendered body from the in-process LRU
+      (RESPONSE_CACHE_ENABLED) keyed by endpoint, path, digest and version.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            filename = kwargs.get("filename")
+            filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename or "")
+            if not filename or not os.path.isfile(filepath) or "profile_modes" in g:
+                # Let the view produce its usual 404, and make profiled
+                # requests do the real work instead of hitting the cache.
+                return view(*args, **kwargs)
+
+            version = current_app.config.get("APP_VERSION", "0")
+            age = (
+                max_age
+                if max_age is not None
+                else current_app.config.get("RESPONSE_CACHE_MAX_AGE", 0)
+            )
+            digest = file_digest(filepath)
+            path_tag = hashlib.sha256(request.path.encode("utf-8")).hexdigest()[:16]
+            etag = f"{digest}-{path_tag}-{version}"
+
+            if request.if_none_match.contains(etag):
+                logger.debug("ETag match for %s (%s)", filename, request.endpoint)
+                cache_requests.inc(endpoint=request.endpoint, result="etag_304")
+                return _apply_cache_headers(make_response("", 304), etag, age)
+
+            use_server_cache = current_app.config.get("RESPONSE_CACHE_ENABLED", False)
+            cache_key = (request.endpoint, request.path, digest, version)
+            if use_server_cache:
+                _configure_cache()
+                entry = rendered_cache.get(cache_key)
+                if entry is not None:
+                    cache_requests.inc(endpoint=request.endpoint, result="hit")
+                    body, mimetype = entry
+                    response = make_response(body)
+                    response.mimetype = mimetype
+                    return _apply_cache_headers(response, etag, age)
+
+            cache_requests.inc(endpoint=request.endpoint, result="miss")
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if use_server_cache:
+                rendered_cache.put(cache_key, response.get_data(), response.mimetype)
+            return _apply_cache_headers(response, etag, age)
+
+        return wrapper
+
+    return decorator
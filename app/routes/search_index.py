@@ -0,0 +1,169 @@
+import re
+import logging
+from functools import lru_cache
+import sqlalchemy as sa
+from app import db
+from app.models import QIFFile, SearchTerm
+from .qifschema import QIF_NS, NOMINAL, ITEM, substitution_group
+from .qifstats import iter_records, _child_text
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "search_terms_fts"
+KINDS = ("characteristic", "feature", "pmi", "id")
+
+_token = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=None)
+def feature_tags():
+    """Local names of every concrete feature nominal and feature item element in Features.xsd."""
+    return substitution_group("Features.xsd", "FeatureNominal") + substitution_group(
+        "Features.xsd", "FeatureItem"
+    )
+
+
+def extract_search_terms(path, kinds=KINDS):
+    """
+    Streams one QIF file into search terms (dicts with kind, term, element_id, tag):
+
+        characteristic  Name / CharacteristicDesignator of characteristic nominals and items
+        feature         Name of feature nominals, FeatureName of feature items
+        pmi             PMIDisplay text; element_id is the id the display references
+        id              ids of all of the above
+
+    Only terms of the given kinds are extracted. Duplicate (kind, term,
+    element_id) entries are dropped.
+    """
+    terms = []
+    seen = set()
+
+    def add(kind, term, element_id, tag):
+        if not term or kind not in kinds:
+            return
+        term = " ".join(term.split())
+        key = (kind, term, element_id)
+        if term and key not in seen:
+            seen.add(key)
+            terms.append({"kind": kind, "term": term, "element_id": element_id, "tag": tag})
+
+    extra_tags = ()
+    if "feature" in kinds or "id" in kinds:
+        extra_tags += feature_tags()
+    if "pmi" in kinds:
+        extra_tags += ("PMIDisplay",)
+    features = set(feature_tags())
+    for kind, _, element in iter_records(path, extra_tags=extra_tags):
+        elem_id = element.get("id")
+        tag = element.tag[len(QIF_NS):]
+        if kind in (NOMINAL, ITEM):
+            add("characteristic", _child_text(element, "Name"), elem_id, tag)
+            add(
+                "characteristic",
+                _child_text(element, "CharacteristicDesignator/Designator"),
+                elem_id,
+                tag,
+            )
+            add("id", elem_id, elem_id, tag)
+        elif kind in features:
+            add("feature", _child_text(element, "Name"), elem_id, tag)
+            add("feature", _child_text(element, "FeatureName"), elem_id, tag)
+            add("id", elem_id, elem_id, tag)
+        elif kind == "PMIDisplay":
+            reference = _child_text(element, "Reference/Id")
+            for text in element.iter(QIF_NS + "Text"):
+                add("pmi", _child_text(text, "Data"), reference, tag)
+    return terms
+
+
+def store_terms(qif_file, terms, kinds=None):
+    """Replaces the indexed terms of qif_file (of the given kinds only, if set); the caller commits."""
+    with stage_timer("search.store"):
+        SearchTerm.replace_for_file(qif_file, terms, kinds)
+
+
+# -----------------------------------------------------------------------------
+# QUERIES
+# -----------------------------------------------------------------------------
+
+_fts_enabled = {}
+
+
+def fts_enabled():
+    """True when the FTS5 mirror of search_terms exists (SQLite databases migrated with it)."""
+    url = str(db.engine.url)
+    if url not in _fts_enabled:
+        _fts_enabled[url] = db.engine.dialect.name == "sqlite" and sa.inspect(
+            db.engine
+        ).has_table(FTS_TABLE)
+    return _fts_enabled[url]
+
+
+def fts_query(text):
+    """
+    FTS5 MATCH expression where every word of text is a quoted prefix,
+    e.g. 'hole 1' -> '"hole"* "1"*'. None if text has no words.
+    """
+    tokens = _token.findall(text)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search(text, kind=None, filename=None, limit=10):
+    """
+    Autocomplete over the corpus: distinct (term, kind) pairs matching text,
+    shortest first, with the number of files containing each and, for a
+    single-file search, the id of one matching element.
+
+    Every word in text must prefix a word of the term with FTS5 ("1 hole"
+    finds "Hole 1 dia"); without it, the term itself must start with text.
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    conditions = []
+    if kind:
+        conditions.append(SearchTerm.kind == kind)
+    if filename:
+        conditions.append(QIFFile.filename == filename)
+
+    with stage_timer("search.query"):
+        if fts_enabled():
+            match = fts_query(text)
+            if match is None:
+                return []
+            fts = sa.table(FTS_TABLE, sa.column("rowid"))
+            conditions.append(sa.text(f"{FTS_TABLE} MATCH :match").bindparams(match=match))
+            source = sa.join(SearchTerm, fts, fts.c.rowid == SearchTerm.id)
+        else:
+            key = SearchTerm.key(text)
+            # A range rather than LIKE so the term_key index is used on any backend.
+            conditions.append(SearchTerm.term_key >= key)
+            conditions.append(SearchTerm.term_key < key + "\U0010ffff")
+            source = SearchTerm.__table__
+        query = (
+            sa.select(
+                SearchTerm.term,
+                SearchTerm.kind,
+                sa.func.count(sa.distinct(SearchTerm.file_id)).label("files"),
+                sa.func.min(SearchTerm.element_id).label("element_id"),
+            )
+            .select_from(source)
+            .join(QIFFile, QIFFile.id == SearchTerm.file_id)
+            .where(*conditions)
+            .group_by(SearchTerm.term, SearchTerm.kind)
+            .order_by(sa.func.length(SearchTerm.term), SearchTerm.term)
+            .limit(limit)
+        )
+        rows = db.session.execute(query).all()
+    return [
+        {
+            "term": row.term,
+            "kind": row.kind,
+            "files": row.files,
+            "element_id": row.element_id if filename else None,
+        }
+        for row in rows
+    ]
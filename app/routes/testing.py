@@ -1,51 +1,96 @@
-import requests
+import time
+import hmac
 import datetime
 from flask import (
     Blueprint,
     render_template,
     jsonify,
     request,
-    abort
+    abort,
+    current_app,
 )
-from app.models import GameScore 
+from app.models import GameScore
+from .remote_client import RemoteError, get_client
+from .leaderboard import leaderboard
 
 testing_bp = Blueprint("testing", __name__)
 
+def _top_scores(limit=10):
+    config = current_app.config
+    return leaderboard.top(limit, config["LEADERBOARD_SIZE"], config["LEADERBOARD_MAX_AGE"])
+
+def _score_error(data):
+    """Why data isn't a valid {"name", "score"} entry, or None."""
+    if not isinstance(data, dict) or "name" not in data or "score" not in data:
+        return "Invalid data. 'name' and 'score' are required."
+    if not isinstance(data["score"], int):
+        return "'score' must be an integer."
+    return None
+
 @testing_bp.route("/")
 def test():
-    return render_template("testing/game.html", scores=GameScore.get_high_scores())
+    return render_template("testing/game.html", scores=_top_scores())
 
 @testing_bp.route("/add-score", methods=["POST"])
 def add_score():
     """Adds a new game score to the database."""
     data = request.get_json()
-    if not data or "name" not in data or "score" not in data:
-        return jsonify({"error": "Invalid data. 'name' and 'score' are required."}), 400
+    error = _score_error(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    name = data["name"]
-    score = data["score"]
+    try:
+        added = GameScore.add_game_score(name=data["name"], score=data["score"])
+        leaderboard.add([added])
+        return jsonify({"message": "Score added successfully."}), 201
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-    if not isinstance(score, int):
-        return jsonify({"error": "'score' must be an integer."}), 400
+@testing_bp.route("/add-scores", methods=["POST"])
+def add_scores():
+    """
+    Adds a batch of game scores in one transaction. Takes a list of
+    {"name", "score"} objects (or {"scores": [...]}); nothing is written if
+    any entry is invalid.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("scores")
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Invalid data. A non-empty list of scores is required."}), 400
+    max_batch = current_app.config["LEADERBOARD_MAX_BATCH"]
+    if len(data) > max_batch:
+        return jsonify({"error": f"At most {max_batch} scores per batch."}), 413
+    for index, entry in enumerate(data):
+        error = _score_error(entry)
+        if error:
+            return jsonify({"error": f"Score {index}: {error}"}), 400
 
     try:
-        GameScore.add_game_score(name=name, score=score)
-        return jsonify({"message": "Score added successfully."}), 201
+        added = GameScore.add_game_scores((entry["name"], entry["score"]) for entry in data)
+        leaderboard.add(added)
+        return jsonify({"message": f"{len(added)} scores added successfully.", "added": len(added)}), 201
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 @testing_bp.route("/get-scores", methods=["GET"])
 def get_scores():
-    """Fetches the top high scores from the database."""
+    """Fetches the top high scores from the leaderboard."""
     try:
-        high_scores = GameScore.get_high_scores(limit=10)
-        scores = [{"name": score.name, "score": score.score} for score in high_scores]
-        return jsonify(scores), 200
+        return jsonify(_top_scores(limit=10)), 200
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-SHARED_SECRET = "rsigmarsigmarsigmarsigmarsigmarsigmarsigmarsigmarsigma"
-EB_URL = "https://www.rsigma.io/arduino"
+CALCULATOR_OPERATIONS = {
+    "add": lambda a, b: a + b,
+    "subtract": lambda a, b: a - b,
+    "multiply": lambda a, b: a * b,
+    "divide": lambda a, b: a / b,
+}
+
+
+def _calculator_client():
+    return get_client("calculator", current_app.config, "CALCULATOR")
 
 @testing_bp.route("/calculator", methods=["GET"])
 def calculator_form():
@@ -58,7 +103,15 @@ def calculator_form():
 def calculate():
     """
     Process the form data, call the EB server's calculator, and show the result.
+    The call goes through the shared calculator client, so it is bounded by
+    CALCULATOR_CONNECT_TIMEOUT/CALCULATOR_READ_TIMEOUT, fails fast while the
+    server keeps failing, and repeated operations are answered from cache.
     """
+    secret = current_app.config["CALCULATOR_SHARED_SECRET"]
+    if not secret:
+        return render_template(
+            "testing/calculator.html", result="Error: CALCULATOR_SHARED_SECRET is not set."
+        ), 503
     try:
         # Extract form fields
         number1 = float(request.form.get("number1", 0))
@@ -77,22 +130,52 @@ def calculate():
 
         # Add the shared secret to headers
         headers = {
-            "X-Shared-Secret": SHARED_SECRET,
+            "X-Shared-Secret": secret,
             "Content-Type": "application/json"
         }
 
         # POST to the EB server
-        response = requests.post(EB_URL, headers=headers, json=data_to_send)
-
-        # Handle the EB response
-        if response.status_code == 200:
-            eb_data = response.json()
-            # The EB server returns: {"device":..., "operation":..., "result":...}
-            result = eb_data.get("result")
-            return render_template("testing/calculator.html", result=result)
-        else:
-            # Show an error if EB didn't return 200
-            error_msg = f"EB error: {response.status_code} - {response.text}"
-            return render_template("testing/calculator.html", result=error_msg)
+        # The EB server returns: {"device":..., "operation":..., "result":...}
+        eb_data = _calculator_client().post_json(
+            current_app.config["CALCULATOR_URL"], data_to_send, headers=headers
+        )
+        return render_template("testing/calculator.html", result=eb_data.get("result"))
+    except RemoteError as e:
+        # Timeouts, EB errors and an open circuit breaker
+        return render_template("testing/calculator.html", result=f"EB {e}"), 502
     except Exception as e:
-        return render_template("testing/calculator.html", result=f"Error: {str(e)}")
\ No newline at end of file
+        return render_template("testing/calculator.html", result=f"Error: {str(e)}")
+
+# Registered by create_app only when the app runs in testing or debug mode.
+calculator_stand_in_bp = Blueprint("calculator_stand_in", __name__)
+
+@calculator_stand_in_bp.route("/calculator/stand-in", methods=["POST"])
+def calculator_stand_in():
+    """
+    Local stand-in for the EB /arduino endpoint: same request, same answer.
+    Waits CALCULATOR_STAND_IN_DELAY seconds (or ?delay=, at most
+    CALCULATOR_STAND_IN_MAX_DELAY) first, to exercise the client's timeouts,
+    and answers ?status= instead when given.
+    """
+    secret = current_app.config["CALCULATOR_SHARED_SECRET"]
+    supplied = request.headers.get("X-Shared-Secret")
+    if not secret or not supplied or not hmac.compare_digest(supplied, secret):
+        return jsonify({"error": "Invalid shared secret."}), 403
+    delay = request.args.get("delay", current_app.config["CALCULATOR_STAND_IN_DELAY"], type=float)
+    time.sleep(min(max(delay, 0.0), current_app.config["CALCULATOR_STAND_IN_MAX_DELAY"]))
+    status = request.args.get("status", 200, type=int)
+    if status != 200:
+        return jsonify({"error": "Stand-in failure."}), status
+
+    data = request.get_json(silent=True) or {}
+    operation = data.get("operation") or {}
+    func = CALCULATOR_OPERATIONS.get(operation.get("type"))
+    if func is None:
+        return jsonify({"error": "Unknown operation."}), 400
+    try:
+        result = func(float(operation.get("number1", 0)), float(operation.get("number2", 0)))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid operands: {e}"}), 400
+    except ZeroDivisionError:
+        return jsonify({"error": "Division by zero."}), 400
+    return jsonify({"device": data.get("device"), "operation": operation, "result": result}), 200
@@ -0,0 +1,410 @@
+import os
+import logging
+import sqlalchemy as sa
+from flask import (
+    Blueprint,
+    render_template,
+    jsonify,
+    request,
+    current_app,
+    abort,
+)
+from werkzeug.security import safe_join
+from werkzeug.exceptions import HTTPException
+from lxml import etree
+from app import db
+from app.models import QIFFile, Characteristic, DocumentLink
+from .qifstats import extract_characteristic_rows
+from .qifsections import section_hashes, changed_sections, is_affected
+from .search_index import KINDS, extract_search_terms, store_terms, search
+from .response_cache import file_digest
+from .qifsnapshot import snapshot_path, write_snapshot, remove_snapshot
+from .qifcanonical import canonical_fingerprint
+from .qifset import document_links
+from .job_runner import job_kind, submit_job
+from .pipeline_status import record_stage
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+warehouse_bp = Blueprint("warehouse", __name__)
+
+INGEST_EXTENSIONS = (".qif", ".xml")
+
+# Sections document_links() reads; a file with neither has no links to catalogue.
+LINK_SECTIONS = {"QPId", "ExternalQIFReferences"}
+
+
+def upload_path(filename):
+    path = safe_join(current_app.config["UPLOAD_FOLDER"], filename)
+    if path is None:
+        abort(400, f"Invalid filename: {filename}")
+    return path
+
+
+def store_rows(
+    filename, path, digest, rows, terms=None, sections=None, kinds=None, fingerprint=None
+):
+    """
+    Creates or refreshes the QIFFile entry for filename and replaces its
+    characteristic rows, its document links (see qifset) and, when given, its
+    search terms (only those of `kinds`, if set). rows None keeps the stored
+    rows, re-pointed at digest.
+    """
+    qif_file = QIFFile.get_by_filename(filename)
+    if qif_file is None:
+        qif_file = QIFFile(filename=filename)
+        db.session.add(qif_file)
+    qif_file.sha256 = digest
+    qif_file.size = os.path.getsize(path)
+    if rows is not None:
+        qif_file.characteristic_count = len(rows)
+    if sections is not None:
+        qif_file.section_hashes = sections
+    if fingerprint is not None:
+        qif_file.fingerprint = fingerprint
+    db.session.flush()
+    with stage_timer("warehouse.store"):
+        if rows is None:
+            Characteristic.rehash_for_file(qif_file)
+        else:
+            Characteristic.replace_for_file(qif_file, rows)
+    if terms is not None:
+        store_terms(qif_file, terms, kinds)
+    store_links(qif_file, path)
+    db.session.commit()
+    record_stage(filename, "ingest", "done", f"{qif_file.characteristic_count} characteristics")
+    return qif_file
+
+
+def store_links(qif_file, path):
+    """Catalogues the QPId and external documents of path for qif_file; only its header is read."""
+    with stage_timer("warehouse.links"):
+        qif_file.qpid, links = document_links(path)
+        DocumentLink.replace_for_file(qif_file, links)
+
+
+def store_failure(filename, path, digest, error):
+    """
+    Records a failed ingest. A file seen for the first time is catalogued
+    without rows so the failure shows in the pipeline status; re-uploading
+    the same content is then skipped like any unchanged file.
+    """
+    if QIFFile.get_by_filename(filename) is None:
+        db.session.add(
+            QIFFile(
+                filename=filename,
+                sha256=digest,
+                size=os.path.getsize(path),
+                characteristic_count=0,
+            )
+        )
+        db.session.commit()
+    record_stage(filename, "ingest", "failed", str(error))
+
+
+def extract_changes(path, previous=None, previous_fingerprint=None, strip=()):
+    """
+    Hashes the top-level sections of path and extracts only what the sections
+    changed since `previous` (the section hashes of the last ingested
+    revision; None extracts everything). Returns (sections, rows, terms,
+    kinds, fingerprint): rows is None when no section they are read from
+    changed, and terms holds the refreshed search-term kinds only. A revision
+    whose canonical fingerprint (see qifcanonical, without the `strip` paths)
+    equals `previous_fingerprint` was only reformatted: nothing is extracted.
+    """
+    with stage_timer("warehouse.fingerprint"):
+        fingerprint = canonical_fingerprint(path, strip)
+    with stage_timer("warehouse.sections"):
+        sections = section_hashes(path)
+    if previous_fingerprint is not None and fingerprint == previous_fingerprint:
+        logger.debug("%s: reformatted only, nothing to extract", path)
+        return sections, None, [], (), fingerprint
+    changed = changed_sections(previous, sections) if previous else None
+    with stage_timer("warehouse.extract"):
+        rows = None
+        if is_affected("characteristics", changed):
+            rows = extract_characteristic_rows(path)
+        kinds = tuple(kind for kind in KINDS if is_affected("search." + kind, changed))
+        terms = extract_search_terms(path, kinds) if kinds else []
+    if changed is not None:
+        logger.debug(
+            "%s: sections %s changed, rows %s, terms %s",
+            path,
+            sorted(changed),
+            "refreshed" if rows is not None else "kept",
+            kinds,
+        )
+    return sections, rows, terms, kinds, fingerprint
+
+
+def ingest_file(filename, force=False):
+    """
+    Extracts characteristic rows and search terms from UPLOAD_FOLDER/filename
+    into the warehouse.
+    Skipped when the catalogued hash already matches the file's content; for a
+    new revision only what its changed sections feed is re-extracted (all of
+    it with force).
+    Returns the QIFFile entry.
+    """
+    path = upload_path(filename)
+    digest = file_digest(path)
+    strip = current_app.config.get("CANONICAL_STRIP", ())
+    qif_file = QIFFile.get_by_filename(filename)
+    if qif_file is not None and qif_file.sha256 == digest and not force:
+        logger.debug("%s unchanged since last ingest", filename)
+        store_snapshot(path, digest, qif_file.section_hashes)  # for files ingested before snapshots
+        if qif_file.fingerprint is None and qif_file.section_hashes is not None:
+            # ingested before fingerprints (a failed ingest has no sections)
+            qif_file.fingerprint = canonical_fingerprint(path, strip)
+            db.session.commit()
+        if qif_file.qpid is None and LINK_SECTIONS & set(qif_file.section_hashes or ()):
+            # ingested before document links
+            store_links(qif_file, path)
+            db.session.commit()
+        return qif_file
+    previous = qif_file.section_hashes if qif_file is not None and not force else None
+    previous_fingerprint = qif_file.fingerprint if qif_file is not None and not force else None
+    previous_digest = qif_file.sha256 if qif_file is not None else None
+    try:
+        sections, rows, terms, kinds, fingerprint = extract_changes(
+            path, previous, previous_fingerprint, strip
+        )
+    except etree.XMLSyntaxError as e:
+        store_failure(filename, path, digest, e)
+        raise
+    qif_file = store_rows(filename, path, digest, rows, terms, sections, kinds, fingerprint)
+    store_snapshot(path, digest, sections, previous_digest)
+    return qif_file
+
+
+def catalogued_file(path):
+    """The catalogue entry for the file's current content (matched by sha256), or None."""
+    return QIFFile.get_by_sha256(file_digest(path))
+
+
+def catalogued_fingerprint(path):
+    """The canonical fingerprint the catalogue holds for the file's current content, or None."""
+    qif_file = catalogued_file(path)
+    return qif_file.fingerprint if qif_file is not None else None
+
+
+def store_snapshot(path, digest, sections=None, previous_digest=None):
+    """
+    Writes the binary snapshot QIFSummary opens instead of parsing the XML
+    (see qifsnapshot), unless one exists for this content already, and drops
+    the snapshot of the replaced revision when no other file has its content.
+    A snapshot that cannot be written is logged; the file is then parsed
+    on demand as before.
+    """
+    config = current_app.config
+    if not config.get("SNAPSHOT_ENABLED"):
+        return None
+    folder = config["SNAPSHOT_FOLDER"]
+    target = snapshot_path(folder, digest)
+    if not os.path.exists(target):
+        try:
+            write_snapshot(path, folder, digest, sections=sections)
+        except (OSError, etree.XMLSyntaxError) as e:
+            logger.error("Snapshot of %s not written: %s", path, e)
+            target = None
+    if (
+        previous_digest
+        and previous_digest != digest
+        and QIFFile.get_by_sha256(previous_digest) is None
+    ):
+        remove_snapshot(folder, previous_digest)
+    return target
+
+
+@job_kind("ingest")
+def ingest_job(params, progress):
+    qif_file = ingest_file(params["filename"], force=params.get("force", False))
+    if current_app.config.get("PIPELINE_VALIDATE_ON_UPLOAD"):
+        # Validation and audit feed the pipeline status; they need a full
+        # parse, so they get a job of their own.
+        try:
+            submit_job("validate", {"filename": params["filename"]})
+        except HTTPException as e:
+            logger.warning("Validation of %s not queued: %s", params["filename"], e.description)
+    return qif_file.to_dict()
+
+
+def ingest_upload(filename):
+    """
+    Called after an upload is saved. QIF/XML files are ingested in the
+    background when jobs are enabled, inline otherwise; a file that cannot be
+    parsed is logged and left out of the warehouse, it never fails the upload.
+    """
+    if not filename.lower().endswith(INGEST_EXTENSIONS):
+        return None
+    if current_app.config.get("ASYNC_JOBS_ENABLED"):
+        return submit_job("ingest", {"filename": filename})
+    try:
+        return ingest_file(filename)
+    except (OSError, etree.XMLSyntaxError) as e:
+        db.session.rollback()
+        logger.error("Ingest of %s failed: %s", filename, e)
+        return None
+
+
+# -----------------------------------------------------------------------------
+# QUERIES
+# -----------------------------------------------------------------------------
+
+# query arg -> (column, operator)
+FILTERS = {
+    "type": (Characteristic.char_type, "eq"),
+    "status": (Characteristic.status, "eq"),
+    "nominal_id": (Characteristic.nominal_id, "eq"),
+    "file_hash": (Characteristic.file_hash, "eq"),
+    "name": (Characteristic.name, "prefix"),
+    "datum": (Characteristic.datums, "contains"),
+    "min_tolerance": (Characteristic.tolerance, "ge"),
+    "max_tolerance": (Characteristic.tolerance, "lt"),
+    "min_value": (Characteristic.value, "ge"),
+    "max_value": (Characteristic.value, "le"),
+}
+FLOAT_FILTERS = ("min_tolerance", "max_tolerance", "min_value", "max_value")
+SORTS = {
+    "name": Characteristic.name,
+    "type": Characteristic.char_type,
+    "tolerance": Characteristic.tolerance,
+    "value": Characteristic.value,
+    "status": Characteristic.status,
+    "file": QIFFile.filename,
+}
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_query(args):
+    """
+    Select over Characteristic joined to QIFFile from request-style args
+    (see FILTERS, plus "file" for a filename and "sort" / "desc").
+    """
+    query = sa.select(Characteristic).join(QIFFile)
+    for arg, (column, op) in FILTERS.items():
+        value = args.get(arg)
+        if value in (None, ""):
+            continue
+        if arg in FLOAT_FILTERS:
+            try:
+                value = float(value)
+            except ValueError:
+                abort(400, f"{arg} must be a number")
+        if op == "eq":
+            query = query.where(column == value)
+        elif op == "prefix":
+            query = query.where(column.like(_escape_like(value) + "%", escape="\\"))
+        elif op == "contains":
+            query = query.where(column.like("%" + _escape_like(value) + "%", escape="\\"))
+        elif op == "ge":
+            query = query.where(column >= value)
+        elif op == "lt":
+            query = query.where(column < value)
+        elif op == "le":
+            query = query.where(column <= value)
+    if args.get("file"):
+        query = query.where(QIFFile.filename == args["file"])
+
+    sort = SORTS.get(args.get("sort"), Characteristic.id)
+    query = query.order_by(sort.desc() if args.get("desc") else sort, Characteristic.id)
+    return query
+
+
+def run_query(args):
+    page = max(1, args.get("page", 1, type=int))
+    per_page = min(
+        max(1, args.get("per_page", 50, type=int)),
+        current_app.config.get("WAREHOUSE_MAX_PER_PAGE", 500),
+    )
+    with stage_timer("warehouse.query"):
+        pagination = db.paginate(
+            build_query(args).options(sa.orm.joinedload(Characteristic.file)),
+            page=page,
+            per_page=per_page,
+            error_out=False,
+        )
+    return pagination
+
+
+@warehouse_bp.route("/")
+def warehouse():
+    """Filter UI over the characteristic warehouse."""
+    pagination = run_query(request.args)
+    types = db.session.scalars(
+        sa.select(Characteristic.char_type).distinct().order_by(Characteristic.char_type)
+    ).all()
+    args = {k: v for k, v in request.args.items() if k != "page"}
+    return render_template(
+        "qif_tools/warehouse.html",
+        pagination=pagination,
+        rows=[row.to_dict() for row in pagination.items],
+        types=types,
+        args=args,
+        files=QIFFile.get_all(),
+    )
+
+
+@warehouse_bp.route("/characteristics")
+def characteristics():
+    """
+    JSON query API, e.g.
+      GET /qif/warehouse/characteristics?type=Position&max_tolerance=0.05
+      GET /qif/warehouse/characteristics?name=CH12&status=FAIL
+    Filters: type, status, nominal_id, file_hash, file, name (prefix), datum
+    (label contained in the DRF), min_/max_tolerance, min_/max_value.
+    Paging: page, per_page. Sorting: sort=name|type|tolerance|value|status|file, desc=1.
+    """
+    pagination = run_query(request.args)
+    return jsonify(
+        {
+            "total": pagination.total,
+            "page": pagination.page,
+            "per_page": pagination.per_page,
+            "rows": [row.to_dict() for row in pagination.items],
+        }
+    )
+
+
+@warehouse_bp.route("/files")
+def files():
+    """Catalogued files with their content hash and characteristic counts."""
+    return jsonify([f.to_dict() for f in QIFFile.get_all()])
+
+
+@warehouse_bp.route("/search")
+def search_terms():
+    """
+    Autocomplete over names, ids and PMI text of every ingested file, e.g.
+      GET /qif/warehouse/search?q=hole&kind=feature
+      GET /qif/warehouse/search?q=CH1&file=part.qif&limit=20
+    kind is one of characteristic, feature, pmi, id.
+    """
+    kind = request.args.get("kind") or None
+    if kind is not None and kind not in KINDS:
+        abort(400, f"kind must be one of {', '.join(KINDS)}")
+    limit = min(max(1, request.args.get("limit", 10, type=int)), 100)
+    return jsonify(
+        search(
+            request.args.get("q", ""),
+            kind=kind,
+            filename=request.args.get("file") or None,
+            limit=limit,
+        )
+    )
+
+
+@warehouse_bp.route("/ingest/<path:filename>", methods=["POST"])
+def ingest(filename):
+    """(Re-)ingests one upload; ?force=1 re-extracts even if the content is unchanged."""
+    if not os.path.isfile(upload_path(filename)):
+        abort(404, f"File not found: {filename}")
+    force = bool(request.args.get("force"))
+    if current_app.config.get("ASYNC_JOBS_ENABLED"):
+        job = submit_job("ingest", {"filename": filename, "force": force})
+        return jsonify({"job_id": job.id}), 202
+    return jsonify(ingest_file(filename, force=force).to_dict())
@@ -0,0 +1,40 @@
+// Suggestions from /qif/warehouse/search for inputs marked data-autocomplete.
+//   data-autocomplete="<search url>"  required
+//   data-kind="characteristic"        optional, restricts the term kind
+//   data-file="part.qif"              optional, restricts to one upload
+document.querySelectorAll("input[data-autocomplete]").forEach((input, i) => {
+    const list = document.createElement("datalist");
+    list.id = `autocomplete-${i}`;
+    input.setAttribute("list", list.id);
+    input.setAttribute("autocomplete", "off");
+    input.after(list);
+
+    let timer = null;
+    let last = "";
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q || q === last) return;
+        timer = setTimeout(async () => {
+            last = q;
+            const params = new URLSearchParams({ q });
+            if (input.dataset.kind) params.set("kind", input.dataset.kind);
+            if (input.dataset.file) params.set("file", input.dataset.file);
+            try {
+                const response = await fetch(`${input.dataset.autocomplete}?${params}`);
+                if (!response.ok) return;
+                const terms = await response.json();
+                list.replaceChildren(
+                    ...terms.map((t) => {
+                        const option = document.createElement("option");
+                        option.value = t.term;
+                        option.label = t.files > 1 ? `${t.kind}, ${t.files} files` : t.kind;
+                        return option;
+                    })
+                );
+            } catch (e) {
+                console.warn("Autocomplete failed", e);
+            }
+        }, 150);
+    });
+});
@@ -7,19 +7,10 @@ var currentStatus = null;
 function setupButtons() {
     const buttonContainer = document.getElementById("buttonContainer");
 
-    Object.keys(statuses).forEach((statusKey) => {
-        const button = document.createElement("button");
-        button.textContent = statusKey;
-        button.className =
-            "block w-full text-left px-4 py-2 mb-2 bg-blue-100 hover:bg-blue-200 rounded-md text-sm font-medium";
-        button.style.border = "1px solid black";
-        button.style.background = "white";
-        button.onclick = () => {
-            console.log("Clicked:", statusKey);
-            handleStatusClick(statusKey);
-        };
-        buttonContainer.appendChild(button);
-    });
+    const statusButtons = document.createElement("div");
+    statusButtons.id = "statusButtons";
+    buttonContainer.appendChild(statusButtons);
+    renderStatusButtons();
 
     const clearButton = document.createElement("button");
     clearButton.textContent = "clear";
@@ -46,6 +37,48 @@ function setupButtons() {
     buttonContainer.appendChild(screenshotButton);
 }
 
+function renderStatusButtons() {
+    const statusButtons = document.getElementById("statusButtons");
+    if (!statusButtons) {
+        return; // setupButtons() has not run yet; it renders them
+    }
+    statusButtons.replaceChildren();
+    Object.keys(statuses).sort().forEach((statusKey) => {
+        const status = statuses[statusKey];
+        const button = document.createElement("button");
+        button.textContent = statusKey;
+        button.className =
+            "block w-full text-left px-4 py-2 mb-2 bg-blue-100 hover:bg-blue-200 rounded-md text-sm font-medium";
+        button.style.border = "1px solid black";
+        button.style.background = "white";
+        if (status.failure_journey && status.failure_journey.length) {
+            button.style.background = "rgb(255, 200, 200)";
+        } else if (status.in_progress && status.in_progress.length) {
+            button.style.background = "rgb(255, 255, 200)";
+        }
+        if (status.stages) {
+            button.title = Object.entries(status.stages)
+                .map(([stage, s]) => `${stage}: ${s.status}${s.detail ? " (" + s.detail + ")" : ""}`)
+                .join("\n");
+        }
+        button.onclick = () => {
+            console.log("Clicked:", statusKey);
+            handleStatusClick(statusKey);
+        };
+        statusButtons.appendChild(button);
+    });
+}
+
+// Merges { filename: journey } from the status feed and redraws the list;
+// the selected journey follows its file's updates.
+function applyStatusUpdate(update) {
+    Object.assign(statuses, update);
+    if (currentStatus && statuses[currentStatus.name]) {
+        currentStatus = statuses[currentStatus.name];
+    }
+    renderStatusButtons();
+}
+
 function handleStatusClick(statusKey) {
     if (statusKey === "clear") {
         currentStatus = null;
@@ -2,9 +2,56 @@
 // fileStatuses.js
 // =============================
 
-const statuses = {
+// Journeys of the uploaded files, keyed by filename:
+// { name, success_journey: [node ids], failure_journey: [...], in_progress: [...], stages }
+// Filled from the backend's status feed: a "snapshot" event with every file,
+// then "status" events with the files whose stages changed.
+const statuses = {};
 
-    "08018-103 SCHEMA": { name: "08018-103 SCHEMA", success_journey: [1, 2, 3, 5, 8, 10, 13], failure_journey: [12, 14], in_progress: [] },
-    "08018-103": { name: "08018-103", success_journey: [1, 2, 3, 5], failure_journey: [], in_progress: [8, 10, 13] },
-    "08016-041(middle)": { name: "08016-041(middle)", success_journey: [1, 2, 3], failure_journey: [], in_progress: [5] },
-}
\ No newline at end of file
+// onChange, if given, runs after every update (to reload the graph layout).
+// If the server turns the stream away (it caps open streams per worker), or
+// the stream fails for good, falls back to polling pollUrl?since=<seq> every
+// pollInterval seconds.
+function connectStatusFeed(url, pollUrl, pollInterval, onChange) {
+    let seq = null;
+    const source = new EventSource(url);
+    source.addEventListener("snapshot", (event) => {
+        seq = Number(event.lastEventId);
+        Object.keys(statuses).forEach((key) => delete statuses[key]);
+        applyStatusUpdate(JSON.parse(event.data));
+        if (onChange) onChange();
+    });
+    source.addEventListener("status", (event) => {
+        seq = Number(event.lastEventId);
+        applyStatusUpdate(JSON.parse(event.data));
+        if (onChange) onChange();
+    });
+    // EventSource reconnects by itself, resuming from the last event id; it
+    // only ends up CLOSED when the server answers with an error status.
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            pollStatuses(pollUrl, pollInterval, seq, onChange);
+        }
+    };
+    return source;
+}
+
+function pollStatuses(pollUrl, pollInterval, seq, onChange) {
+    const url = seq === null ? pollUrl : `${pollUrl}?since=${seq}`;
+    fetch(url)
+        .then((response) => response.json())
+        .then((data) => {
+            if (seq === null) {
+                Object.keys(statuses).forEach((key) => delete statuses[key]);
+            }
+            seq = data.seq;
+            if (Object.keys(data.statuses).length) {
+                applyStatusUpdate(data.statuses);
+                if (onChange) onChange();
+            }
+        })
+        .catch((error) => console.error("Status poll failed:", error))
+        .finally(() => {
+            setTimeout(() => pollStatuses(pollUrl, pollInterval, seq, onChange), pollInterval * 1000);
+        });
+}
@@ -0,0 +1,57 @@
+// =============================
+// graphLayout.js
+// =============================
+
+// The graph comes from the server already laid out (layout_graph in
+// app/routes/pipeline_layout.py), with x as a fraction of the canvas width
+// and y of its height; this only scales it to the current canvas.
+
+var BOX_WIDTH = 150;
+var BOX_HEIGHT = 30;
+var zones = [];
+var nodes = {};
+var connections = [];
+var graphLayout = null;
+var canvasReady = false;
+
+function setGraphLayout(positioned) {
+    graphLayout = positioned;
+    if (canvasReady) {
+        computeLayout();
+    }
+}
+
+function loadGraphLayout(url) {
+    // The layout's ETag is its graph version: unchanged layouts come back as 304s.
+    return fetch(url, { cache: "no-cache" })
+        .then((response) => response.json())
+        .then(setGraphLayout);
+}
+
+// Called by setup() and windowResized() in app.js.
+function computeLayout() {
+    canvasReady = true;
+    if (!graphLayout) {
+        return;
+    }
+    const container = document.getElementById("canvasContainer");
+    const w = container.clientWidth;
+    const h = container.clientHeight;
+    // Zones may need more than the visible height; the container scrolls.
+    const canvasHeight = Math.max(h, graphLayout.height * h);
+    if (width !== w || height !== canvasHeight) {
+        resizeCanvas(w, canvasHeight);
+    }
+    BOX_WIDTH = graphLayout.box.width * w;
+    BOX_HEIGHT = graphLayout.box.height * h;
+    textSize(BOX_WIDTH * 0.08);
+
+    zones = graphLayout.zones.map((zone) =>
+        Object.assign({}, zone, { yStart: zone.yStart * h, yEnd: zone.yEnd * h })
+    );
+    nodes = {};
+    Object.entries(graphLayout.nodes).forEach(([id, node]) => {
+        nodes[id] = Object.assign({}, node, { x: node.x * w, y: node.y * h });
+    });
+    connections = graphLayout.connections;
+}
@@ -0,0 +1,102 @@
+import gc
+import os
+import mmap
+import time
+import logging
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _tag_tables():
+    """The schema-derived lookup tables (lru-cached) every parse and query consults."""
+    from app.routes.qifschema import (
+        CHARACTERISTIC_KINDS,
+        characteristic_tags,
+        document_sections,
+        schema_complex_types,
+    )
+    from app.routes.qifstats import record_tags
+    from app.routes.qifunits import characteristic_quantity
+    from app.routes.search_index import feature_tags
+
+    for kind in CHARACTERISTIC_KINDS:
+        characteristic_tags(kind)
+    document_sections()
+    schema_complex_types()
+    feature_tags()
+    char_types = {char_type for _, char_type in record_tags().values()}
+    for char_type in char_types:
+        characteristic_quantity(char_type)
+    return len(char_types)
+
+
+def _hot_catalogue(config):
+    """
+    The status feed and pipeline layout over the whole catalogue, plus the
+    content digest, unit table and mapped snapshot of the most recently
+    ingested files. Returns how many files were preloaded.
+    """
+    from app.models import QIFFile
+    from app.routes.pipeline_layout import pipeline_layout
+    from app.routes.qifsnapshot import open_snapshot
+    from app.routes.qifunits import unit_table
+    from app.routes.response_cache import file_digest
+
+    pipeline_layout(config["PIPELINE_STAGE_NODES"])
+    loaded = 0
+    for qif_file in QIFFile.get_recent(config["WARMUP_HOT_FILES"]):
+        path = os.path.join(config["UPLOAD_FOLDER"], qif_file.filename)
+        if not os.path.exists(path):
+            continue
+        digest = file_digest(path)
+        unit_table(path)
+        if config.get("SNAPSHOT_ENABLED"):
+            snapshot = open_snapshot(config["SNAPSHOT_FOLDER"], digest)
+            if snapshot is not None and hasattr(mmap, "MADV_WILLNEED"):
+                snapshot._mm.madvise(mmap.MADV_WILLNEED)  # read ahead into the shared page cache
+        loaded += 1
+    return loaded
+
+
+def warm_up(app):
+    """
+    Loads what every worker would otherwise build on its first requests:
+
+      - the compiled QIFDocument XMLSchema (built when app.routes is imported,
+        so by create_app itself) and the tag tables derived from the XSDs
+      - the compiled XSLT checks of the standard (xsd/Check/Check.xsl), run
+        by every audit
+      - the hot catalogue entries (_hot_catalogue)
+
+    then closes the database connections, so no connection is shared across
+    a fork, and freezes the objects built so far out of the garbage
+    collector, whose passes would otherwise write to (and so un-share) every
+    page holding them. Returns {step: seconds} plus the counts loaded.
+    """
+    from app.routes.qifschema import check_transform
+
+    report = {}
+    with app.app_context():
+        start = time.perf_counter()
+        report["char_types"] = _tag_tables()
+        report["tag_tables"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        check_transform()
+        report["xslt"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            report["hot_files"] = _hot_catalogue(app.config)
+        except Exception as e:  # e.g. tables not migrated yet; workers load lazily
+            logger.warning("Catalogue not preloaded: %s", e)
+            report["hot_files"] = 0
+        report["catalogue"] = time.perf_counter() - start
+
+        db.session.remove()
+        db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+    logger.info("Warmed up: %s", report)
+    return report
@@ -0,0 +1,252 @@
+"""
+Benchmarks QIFSummary operations on synthetic QIF documents at several sizes.
+
+Each operation is timed over --repeat cold runs (min and median wall time), with
+the process-wide section result cache cleared before each, then run once more
+under tracemalloc for peak Python-heap memory. The median of --repeat warm runs,
+answered from that cache, is reported separately as warm_seconds_median. lxml's own C
+allocations are not visible to tracemalloc, so peak_rss_delta (from
+resource.getrusage, where available) is recorded alongside as a coarse
+upper bound.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_qifsummary --sizes small,medium --out bench.json
+    python -m benchmarks.bench_qifsummary --sizes small --baseline bench.json
+
+With --baseline, each result is compared to the matching (size, operation) in
+the earlier run and the process exits non-zero if any op is slower than
+--threshold (default 1.25x).
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lxml import etree
+
+from benchmarks.qif_generator import generate_qif
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(
+    REPO_ROOT, "QIF3.0-2018-ANSI", "xsd", "QIFApplications", "QIFDocument.xsd"
+)
+
+# name -> generate_qif kwargs
+SIZES = {
+    "tiny": dict(features=10, characteristics=20, points_per_feature=10),
+    "small": dict(features=100, characteristics=200, points_per_feature=20),
+    "medium": dict(features=1000, characteristics=2000, points_per_feature=50),
+    "large": dict(features=5000, characteristics=10000, points_per_feature=100),
+}
+
+OPERATIONS = (
+    "init_parse",
+    "get_summary",
+    "get_schema_validation",
+    "compare_to",
+    "compare_full_tree",
+    "chase_feature",
+    "assert_symmetry",
+    "as_dict",
+)
+
+
+def load_schema():
+    """Compiles QIFDocument.xsd the same way app/routes/qif_tools.py does."""
+    return etree.XMLSchema(etree.parse(SCHEMA_PATH))
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _git_revision():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def _operations(QIFSummary, schema, path, other_path, feature_name):
+    """Returns name -> zero-arg callable. Parsing is kept out of every op but init_parse."""
+    qif = QIFSummary(path, schema)
+    other = QIFSummary(other_path, schema)
+    return {
+        "init_parse": lambda: QIFSummary(path, schema),
+        "get_summary": qif.get_summary,
+        "get_schema_validation": qif.get_schema_validation,
+        "compare_to": lambda: qif.compare_to(other),
+        "compare_full_tree": lambda: qif.compare_full_tree(other),
+        "chase_feature": lambda: qif.chase_feature(feature_name),
+        "assert_symmetry": qif.assert_symmetry,
+        "as_dict": qif.as_dict,
+    }
+
+
+def measure(func, repeat, reset=None):
+    """
+    Times func cold (reset() before every run, so cached results don't turn
+    the work into lookups) and warm (straight after a cold run).
+    """
+    reset = reset or (lambda: None)
+    timings = []
+    for _ in range(repeat):
+        reset()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    warm = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        warm.append(time.perf_counter() - start)
+
+    reset()
+    gc.collect()
+    rss_before = _peak_rss()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _peak_rss()
+
+    return {
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "warm_seconds_median": statistics.median(warm),
+        "runs": repeat,
+        "peak_python_bytes": peak,
+        "peak_rss_delta": (rss_after - rss_before) if rss_before is not None else None,
+    }
+
+
+def run(sizes, operations, repeat, workdir):
+    from app.routes.qifsummary import QIFSummary
+    from app.routes.qifsections import section_cache
+
+    schema = load_schema()
+    results = []
+    for size in sizes:
+        params = SIZES[size]
+        path = os.path.join(workdir, f"{size}_a.qif")
+        other_path = os.path.join(workdir, f"{size}_b.qif")
+        info = generate_qif(path, seed=1, **params)
+        generate_qif(other_path, seed=2, **params)
+        names = info["characteristic_names"]
+        feature_name = names[len(names) // 2] if names else ""
+        file_bytes = os.path.getsize(path)
+        print(f"[{size}] {file_bytes / 1024:.0f} KB, {params}", file=sys.stderr)
+
+        ops = _operations(QIFSummary, schema, path, other_path, feature_name)
+        for op in operations:
+            result = measure(ops[op], repeat, reset=section_cache.clear)
+            result.update({"size": size, "operation": op, "file_bytes": file_bytes, **params})
+            results.append(result)
+            print(
+                f"  {op:<22} {result['seconds_median'] * 1000:10.2f} ms"
+                f"  warm {result['warm_seconds_median'] * 1000:10.2f} ms"
+                f"  peak {result['peak_python_bytes'] / 1048576:8.2f} MB",
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Prints current/baseline ratios; returns the (size, op) pairs over the threshold."""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["operation"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["size"], r["operation"]))
+        if base is None:
+            continue
+        ratio = r["seconds_median"] / base["seconds_median"] if base["seconds_median"] else 1.0
+        mem_ratio = (
+            r["peak_python_bytes"] / base["peak_python_bytes"]
+            if base["peak_python_bytes"]
+            else 1.0
+        )
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(
+            f"{r['size']:<8} {r['operation']:<22} time x{ratio:5.2f}  mem x{mem_ratio:5.2f} {flag}"
+        )
+        if ratio > threshold:
+            regressions.append((r["size"], r["operation"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QIFSummary on synthetic QIF files.")
+    parser.add_argument("--sizes", default="tiny,small,medium", help=f"comma list of {list(SIZES)}")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="comma list of operations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against an earlier results JSON")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--workdir", help="keep generated files here (default: temp dir)")
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    operations = [o for o in args.ops.split(",") if o]
+    for name in sizes:
+        if name not in SIZES:
+            parser.error(f"unknown size {name!r}")
+    for name in operations:
+        if name not in OPERATIONS:
+            parser.error(f"unknown operation {name!r}")
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run(sizes, operations, args.repeat, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run(sizes, operations, args.repeat, workdir)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "lxml": ".".join(str(v) for v in etree.LXML_VERSION),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}", file=sys.stderr)
+
+    if args.baseline:
+        if compare(results, args.baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmarks multi-worker startup: how long N workers take to serve their first
+requests, and how much memory they hold between them, in two modes:
+
+  cold     every worker is a fresh interpreter that imports and builds the app
+           itself, compiling the XSD and filling its caches on its own
+           (gunicorn without --preload)
+  preload  the app is built and warmed once, create_app(warmup=True), and the
+           workers are forked from it (gunicorn.conf.py)
+
+Each run happens in a master process of its own, so runs don't share imports.
+Every worker serves GET /qif/details for each generated file and then holds;
+once all are ready, their memory is read from /proc/<pid>/smaps_rollup: PSS
+(shared pages split between the processes sharing them, so the workers' PSS
+adds up to what they really cost) and USS (pages private to the worker).
+Linux only for the memory figures; elsewhere they are reported as null.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup --workers 1,2,4,8 --out startup.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_qifsummary import REPO_ROOT, SIZES, _git_revision
+from benchmarks.qif_generator import generate_qif
+
+MODES = ("cold", "preload")
+
+
+def _config(workdir):
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'app.db')}"
+        UPLOAD_FOLDER = os.path.join(workdir, "uploads")
+        SNAPSHOT_FOLDER = os.path.join(workdir, "snapshots")
+        ASYNC_JOBS_ENABLED = False
+        RESPONSE_CACHE_ENABLED = False  # every worker does the work once
+
+    return BenchConfig
+
+
+def _build_app(workdir, warmup=False):
+    from app import create_app
+
+    return create_app(_config(workdir), warmup=warmup)
+
+
+def _memory(pid):
+    """{"rss", "pss", "uss"} of a process in bytes, or None without /proc/<pid>/smaps_rollup."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss"),
+        "pss": fields.get("Pss"),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def _setup(workdir, files, size):
+    """Generates the files and ingests them into a migrated database (snapshots included)."""
+    from flask_migrate import upgrade
+    from app.routes.warehouse import ingest_file
+
+    uploads = os.path.join(workdir, "uploads")
+    os.makedirs(uploads, exist_ok=True)
+    app = _build_app(workdir)
+    with app.app_context():
+        upgrade(directory=os.path.join(REPO_ROOT, "migrations"))
+        for i in range(files):
+            generate_qif(os.path.join(uploads, f"bench_{i}.qif"), seed=i, **SIZES[size])
+            ingest_file(f"bench_{i}.qif")
+
+
+def _worker(app, workdir, files, started, ready, release):
+    if app is None:
+        app = _build_app(workdir)
+    client = app.test_client()
+    first = time.monotonic()
+    for i in range(files):
+        response = client.get(f"/qif/details/bench_{i}.qif")
+        if response.status_code != 200:
+            raise RuntimeError(f"details of bench_{i}.qif: {response.status_code}")
+    now = time.monotonic()
+    ready.put((os.getpid(), now - started, now - first))
+    release.wait()
+
+
+def _serve(mode, workers, workdir, files, results):
+    """One run: the master (warming up for preload), its workers, then their memory."""
+    started = time.monotonic()
+    app = None
+    if mode == "preload":
+        app = _build_app(workdir, warmup=True)
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+    master_seconds = time.monotonic() - started
+
+    ready = context.Queue()
+    release = context.Event()
+    processes = [
+        context.Process(target=_worker, args=(app, workdir, files, started, ready, release))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [ready.get(timeout=600) for _ in processes]
+    memory = [_memory(pid) for pid, _, _ in reports]
+    master_memory = _memory(os.getpid())
+    release.set()
+    for process in processes:
+        process.join()
+
+    pss = [m["pss"] for m in memory if m]
+    results.put(
+        {
+            "mode": mode,
+            "workers": workers,
+            "files": files,
+            "master_seconds": master_seconds,
+            "ready_seconds": max(seconds for _, seconds, _ in reports),
+            "first_requests_seconds_median": statistics.median(r[2] for r in reports),
+            "workers_pss": sum(pss) if pss else None,
+            "worker_uss_median": statistics.median(m["uss"] for m in memory) if pss else None,
+            "master_pss": master_memory["pss"] if master_memory else None,
+        }
+    )
+
+
+def run(modes, worker_counts, files, size, workdir):
+    spawn = multiprocessing.get_context("spawn")
+    setup = spawn.Process(target=_setup, args=(workdir, files, size))
+    setup.start()
+    setup.join()
+    if setup.exitcode:
+        raise RuntimeError("setup failed")
+
+    results = []
+    for workers in worker_counts:
+        for mode in modes:
+            queue = spawn.Queue()
+            master = spawn.Process(target=_serve, args=(mode, workers, workdir, files, queue))
+            master.start()
+            result = queue.get(timeout=1200)
+            master.join()
+            results.append(result)
+            mb = lambda value: f"{value / 1048576:8.1f} MB" if value is not None else "     n/a"
+            print(
+                f"{mode:<8} x{workers:<3} ready {result['ready_seconds']:6.2f} s"
+                f"  workers PSS {mb(result['workers_pss'])}"
+                f"  USS/worker {mb(result['worker_uss_median'])}"
+                f"  master PSS {mb(result['master_pss'])}",
+                file=sys.stderr,
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time and memory of N app workers.")
+    parser.add_argument("--workers", default="1,2,4", help="comma list of worker counts")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma list of {list(MODES)}")
+    parser.add_argument("--files", type=int, default=4, help="files each worker serves")
+    parser.add_argument("--size", default="small", help=f"one of {list(SIZES)}")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--workdir", help="keep generated files and database here (default: temp dir)")
+    args = parser.parse_args()
+
+    worker_counts = [int(n) for n in args.workers.split(",") if n]
+    modes = [m for m in args.modes.split(",") if m]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode!r}")
+    if args.size not in SIZES:
+        parser.error(f"unknown size {args.size!r}")
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run(modes, worker_counts, args.files, args.size, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run(modes, worker_counts, args.files, args.size, workdir)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
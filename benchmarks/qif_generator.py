@@ -0,0 +1,359 @@
+"""
+Synthetic, schema-valid QIF 3.0 document generator for benchmarking.
+
+Produces a single QIFDocument containing Product (with a PMIDisplaySet),
+Features (definitions / nominals / items), Characteristics (definitions /
+nominals / items) and Results (feature measurements, measured point sets and
+characteristic measurements), cross-referenced the same way real exporter
+output is, so every QIFSummary code path has something to chew on.
+
+Usage:
+    python -m benchmarks.qif_generator out.qif --features 500 --characteristics 1000 \
+        --pmi 1000 --points 50
+"""
+
+import argparse
+import math
+import random
+import uuid
+from xml.sax.saxutils import escape
+
+QIF_NS = "http://qifstandards.org/xsd/qif3"
+
+# Cycled through when assigning characteristics; each gets a matching
+# Definition / Nominal / Item / Measurement quadruple.
+CHARACTERISTIC_TYPES = ("Diameter", "Position", "Flatness", "Perpendicularity")
+
+
+class _Ids:
+    """Sequential QIF id allocator (QIF ids are positive integers, unique per document)."""
+
+    def __init__(self):
+        self.current = 0
+
+    def next(self):
+        self.current += 1
+        return self.current
+
+
+def _fmt(values):
+    return " ".join(f"{v:.6f}" for v in values)
+
+
+def generate_qif(
+    path,
+    features=100,
+    characteristics=200,
+    pmi_displays=None,
+    points_per_feature=20,
+    seed=0,
+):
+    """
+    Writes a synthetic QIF document to `path` and returns a dict describing it.
+
+    Args:
+        path (str): Output file.
+        features (int): Number of circle features (definition, nominal, item, measurement).
+        characteristics (int): Number of characteristics, assigned round-robin to features
+            and cycling through CHARACTERISTIC_TYPES.
+        pmi_displays (int, optional): PMIDisplay annotations, each referencing a
+            characteristic nominal. Defaults to `characteristics`.
+        points_per_feature (int): Measured points per feature (0 disables point sets).
+        seed (int): RNG seed; different seeds give the same structure with different values.
+
+    Returns:
+        dict: Counts plus "characteristic_names", usable for chase_feature benchmarks.
+    """
+    if pmi_displays is None:
+        pmi_displays = characteristics
+    features = max(features, 1)
+    rng = random.Random(seed)
+    ids = _Ids()
+
+    # Allocate ids up front so sections can reference each other in any order.
+    standard_id = ids.next()
+    drf_id = ids.next()
+    datum_id = ids.next()
+    device_id = ids.next()
+    part_id = ids.next()
+    view_id = ids.next()
+    feat = [
+        {
+            "def": ids.next(),
+            "nom": ids.next(),
+            "item": ids.next(),
+            "meas": ids.next(),
+            "points": ids.next() if points_per_feature else None,
+            "diameter": round(rng.uniform(2.0, 40.0), 3),
+            "location": [rng.uniform(-500, 500) for _ in range(3)],
+        }
+        for _ in range(features)
+    ]
+    chars = [
+        {
+            "type": CHARACTERISTIC_TYPES[i % len(CHARACTERISTIC_TYPES)],
+            "feature": feat[i % features],
+            "def": ids.next(),
+            "nom": ids.next(),
+            "item": ids.next(),
+            "meas": ids.next(),
+            "name": f"CH{i + 1}",
+            "tolerance": round(rng.choice((0.01, 0.02, 0.05, 0.1, 0.2, 0.5)), 3),
+        }
+        for i in range(characteristics)
+    ]
+    results_id = ids.next()
+
+    with open(path, "w", encoding="utf-8") as f:
+        w = f.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n')
+        w(f'<QIFDocument xmlns="{QIF_NS}" versionQIF="3.0.0" idMax="{ids.current}">\n')
+        w(f"  <QPId>{uuid.UUID(int=rng.getrandbits(128), version=4)}</QPId>\n")
+        w("  <Version>\n    <TimeCreated>2025-01-01T00:00:00</TimeCreated>\n  </Version>\n")
+        w("  <Header>\n    <Application>\n      <Name>qif_generator</Name>\n")
+        w("    </Application>\n  </Header>\n")
+        w('  <StandardsDefinitions n="1">\n')
+        w(f'    <Standard id="{standard_id}">\n      <Organization>\n')
+        w("        <StandardsOrganizationEnum>ASME</StandardsOrganizationEnum>\n")
+        w("      </Organization>\n      <Designator>Y14.5</Designator>\n")
+        w("      <Year>2009</Year>\n    </Standard>\n  </StandardsDefinitions>\n")
+
+        w("  <FileUnits>\n    <PrimaryUnits>\n")
+        w("      <AngularUnit>\n        <SIUnitName>radian</SIUnitName>\n")
+        w("        <UnitName>degree</UnitName>\n        <UnitConversion>\n")
+        w("          <Factor>0.017453292519943</Factor>\n        </UnitConversion>\n")
+        w("      </AngularUnit>\n")
+        w("      <LinearUnit>\n        <SIUnitName>meter</SIUnitName>\n")
+        w("        <UnitName>mm</UnitName>\n        <UnitConversion>\n")
+        w("          <Factor>0.001</Factor>\n        </UnitConversion>\n")
+        w("      </LinearUnit>\n    </PrimaryUnits>\n  </FileUnits>\n")
+
+        w('  <DatumDefinitions n="1">\n')
+        w(f'    <DatumDefinition id="{datum_id}">\n      <DatumLabel>A</DatumLabel>\n')
+        w("    </DatumDefinition>\n  </DatumDefinitions>\n")
+        w('  <DatumReferenceFrames n="1">\n')
+        w(f'    <DatumReferenceFrame id="{drf_id}">\n      <Datums n="1">\n')
+        w("        <Datum>\n          <SimpleDatum>\n")
+        w(f"            <DatumDefinitionId>{datum_id}</DatumDefinitionId>\n")
+        w("            <MaterialModifier>NONE</MaterialModifier>\n")
+        w("            <ReferencedComponent>ACTUAL</ReferencedComponent>\n")
+        w("          </SimpleDatum>\n          <Precedence>\n")
+        w("            <PrecedenceEnum>PRIMARY</PrecedenceEnum>\n")
+        w("          </Precedence>\n        </Datum>\n      </Datums>\n")
+        w("    </DatumReferenceFrame>\n  </DatumReferenceFrames>\n")
+
+        w('  <MeasurementResources>\n    <MeasurementDevices n="1">\n')
+        w(f'      <MeasurementDevice id="{device_id}">\n        <Name>CMM</Name>\n')
+        w("      </MeasurementDevice>\n    </MeasurementDevices>\n  </MeasurementResources>\n")
+
+        # Product: an annotation view plus PMI displays referencing characteristic nominals
+        w("  <Product>\n")
+        w('    <ViewSet>\n      <AnnotationViewSet n="1">\n')
+        w(f'        <AnnotationView id="{view_id}">\n')
+        w("          <Normal>0 0 1</Normal>\n          <Direction>1 0 0</Direction>\n")
+        w("        </AnnotationView>\n      </AnnotationViewSet>\n    </ViewSet>\n")
+        if pmi_displays and chars:
+            w('    <VisualizationSet>\n      <Fonts n="1">\n')
+            w('        <Font index="0">\n          <Name>Arial</Name>\n')
+            w("          <Size>8</Size>\n        </Font>\n      </Fonts>\n")
+            w(f'      <PMIDisplaySet n="{pmi_displays}">\n')
+            for i in range(pmi_displays):
+                ch = chars[i % len(chars)]
+                w("        <PMIDisplay>\n          <Plane>\n")
+                w(f"            <AnnotationViewId>\n              <Id>{view_id}</Id>\n")
+                w("            </AnnotationViewId>\n          </Plane>\n")
+                w('          <Texts fontIndex="0" n="1">\n            <Text>\n')
+                w(f"              <Data>{escape(ch['name'])} {ch['tolerance']}</Data>\n")
+                w("              <XY>0 0</XY>\n            </Text>\n          </Texts>\n")
+                w(f"          <Reference>\n            <Id>{ch['nom']}</Id>\n")
+                w("          </Reference>\n        </PMIDisplay>\n")
+            w("      </PMIDisplaySet>\n    </VisualizationSet>\n")
+        w('    <PartSet n="1">\n')
+        w(f'      <Part id="{part_id}">\n        <ModelNumber>SYNTHETIC</ModelNumber>\n')
+        w("      </Part>\n    </PartSet>\n  </Product>\n")
+
+        # Features
+        w("  <Features>\n")
+        w(f'    <FeatureDefinitions n="{features}">\n')
+        for fe in feat:
+            w(f'      <CircleFeatureDefinition id="{fe["def"]}">\n')
+            w("        <InternalExternal>INTERNAL</InternalExternal>\n")
+            w(f"        <Diameter>{fe['diameter']}</Diameter>\n")
+            w("      </CircleFeatureDefinition>\n")
+        w("    </FeatureDefinitions>\n")
+        w(f'    <FeatureNominals n="{features}">\n')
+        for fe in feat:
+            w(f'      <CircleFeatureNominal id="{fe["nom"]}">\n')
+            w(f"        <FeatureDefinitionId>{fe['def']}</FeatureDefinitionId>\n")
+            w(f"        <Location>{_fmt(fe['location'])}</Location>\n")
+            w("        <Normal>0 0 1</Normal>\n      </CircleFeatureNominal>\n")
+        w("    </FeatureNominals>\n")
+        w(f'    <FeatureItems n="{features}">\n')
+        for i, fe in enumerate(feat):
+            w(f'      <CircleFeatureItem id="{fe["item"]}">\n')
+            w(f"        <FeatureNominalId>{fe['nom']}</FeatureNominalId>\n")
+            w(f"        <FeatureName>HOLE{i + 1}</FeatureName>\n")
+            w("        <DeterminationMode>\n          <Checked>\n")
+            w("            <CheckDetails>\n              <Measured/>\n")
+            w("            </CheckDetails>\n          </Checked>\n")
+            w("        </DeterminationMode>\n      </CircleFeatureItem>\n")
+        w("    </FeatureItems>\n  </Features>\n")
+
+        # Characteristics
+        if chars:
+            w("  <Characteristics>\n")
+            w(f"    <FormalStandardId>{standard_id}</FormalStandardId>\n")
+            w(f'    <CharacteristicDefinitions n="{len(chars)}">\n')
+            for ch in chars:
+                t = ch["type"]
+                w(f'      <{t}CharacteristicDefinition id="{ch["def"]}">\n')
+                if t == "Diameter":
+                    w("        <Tolerance>\n")
+                    w(f"          <MaxValue>{ch['tolerance']}</MaxValue>\n")
+                    w(f"          <MinValue>{-ch['tolerance']}</MinValue>\n")
+                    w("          <DefinedAsLimit>false</DefinedAsLimit>\n")
+                    w("        </Tolerance>\n")
+                else:
+                    w(f"        <ToleranceValue>{ch['tolerance']}</ToleranceValue>\n")
+                    if t in ("Position", "Perpendicularity"):
+                        w(f"        <DatumReferenceFrameId>{drf_id}</DatumReferenceFrameId>\n")
+                        w("        <MaterialCondition>REGARDLESS</MaterialCondition>\n")
+                        zone = "DiametricalZone" if t == "Position" else "PlanarZone"
+                        w(f"        <ZoneShape>\n          <{zone}/>\n        </ZoneShape>\n")
+                w(f"      </{t}CharacteristicDefinition>\n")
+            w("    </CharacteristicDefinitions>\n")
+            w(f'    <CharacteristicNominals n="{len(chars)}">\n')
+            for ch in chars:
+                t = ch["type"]
+                w(f'      <{t}CharacteristicNominal id="{ch["nom"]}">\n')
+                w(f"        <CharacteristicDefinitionId>{ch['def']}</CharacteristicDefinitionId>\n")
+                w('        <FeatureNominalIds n="1">\n')
+                w(f"          <Id>{ch['feature']['nom']}</Id>\n        </FeatureNominalIds>\n")
+                w(f"        <Name>{escape(ch['name'])}</Name>\n")
+                if t == "Diameter":
+                    w(f"        <TargetValue>{ch['feature']['diameter']}</TargetValue>\n")
+                w(f"      </{t}CharacteristicNominal>\n")
+            w("    </CharacteristicNominals>\n")
+            w(f'    <CharacteristicItems n="{len(chars)}">\n')
+            for ch in chars:
+                t = ch["type"]
+                w(f'      <{t}CharacteristicItem id="{ch["item"]}">\n')
+                w(f"        <Name>{escape(ch['name'])}</Name>\n")
+                w('        <FeatureItemIds n="1">\n')
+                w(f"          <Id>{ch['feature']['item']}</Id>\n        </FeatureItemIds>\n")
+                w('        <MeasurementDeviceIds n="1">\n')
+                w(f"          <Id>{device_id}</Id>\n        </MeasurementDeviceIds>\n")
+                w(f"        <CharacteristicNominalId>{ch['nom']}</CharacteristicNominalId>\n")
+                w(f"      </{t}CharacteristicItem>\n")
+            w("    </CharacteristicItems>\n  </Characteristics>\n")
+
+        # Results
+        w('  <Results>\n    <MeasurementResultsSet n="1">\n')
+        w(f'      <MeasurementResults id="{results_id}">\n')
+        w(f"        <ThisResultsInstanceQPId>{uuid.UUID(int=rng.getrandbits(128), version=4)}")
+        w("</ThisResultsInstanceQPId>\n")
+        w(f'        <MeasuredFeatures n="{features}">\n')
+        for fe in feat:
+            measured_diameter = fe["diameter"] + rng.gauss(0, 0.02)
+            w(f'          <CircleFeatureMeasurement id="{fe["meas"]}">\n')
+            w(f"            <FeatureItemId>{fe['item']}</FeatureItemId>\n")
+            if fe["points"]:
+                w('            <PointList n="1">\n')
+                w(f"              <WholePointSetId>{fe['points']}</WholePointSetId>\n")
+                w("            </PointList>\n")
+            location = [v + rng.gauss(0, 0.01) for v in fe["location"]]
+            w(f"            <Location>{_fmt(location)}</Location>\n")
+            w("            <Normal>0 0 1</Normal>\n")
+            w(f"            <Diameter>{measured_diameter:.6f}</Diameter>\n")
+            w("          </CircleFeatureMeasurement>\n")
+        w("        </MeasuredFeatures>\n")
+        if points_per_feature:
+            w(f'        <MeasuredPointSets n="{features}">\n')
+            for fe in feat:
+                w(f'          <MeasuredPointSet id="{fe["points"]}" count="{points_per_feature}">\n')
+                w("            <Points>")
+                x0, y0, z0 = fe["location"]
+                radius = fe["diameter"] / 2
+                step = 2 * math.pi / points_per_feature
+                for p in range(points_per_feature):
+                    r = radius + rng.gauss(0, 0.005)
+                    w(
+                        f" {x0 + r * math.cos(p * step):.6f} {y0 + r * math.sin(p * step):.6f}"
+                        f" {z0:.6f}"
+                    )
+                w(" </Points>\n            <Compensated>false</Compensated>\n")
+                w("          </MeasuredPointSet>\n")
+            w("        </MeasuredPointSets>\n")
+        all_passed = True
+        if chars:
+            w("        <MeasuredCharacteristics>\n")
+            w(f'          <CharacteristicMeasurements n="{len(chars)}">\n')
+            for ch in chars:
+                t = ch["type"]
+                if t == "Diameter":
+                    deviation = rng.gauss(0, ch["tolerance"] / 2)
+                    value = ch["feature"]["diameter"] + deviation
+                    passed = abs(deviation) <= ch["tolerance"]
+                else:
+                    value = abs(rng.gauss(0, ch["tolerance"] / 2))
+                    passed = value <= ch["tolerance"]
+                all_passed = all_passed and passed
+                w(f'            <{t}CharacteristicMeasurement id="{ch["meas"]}">\n')
+                w("              <Status>\n")
+                w(
+                    "                <CharacteristicStatusEnum>"
+                    f"{'PASS' if passed else 'FAIL'}</CharacteristicStatusEnum>\n"
+                )
+                w("              </Status>\n")
+                w(f"              <CharacteristicItemId>{ch['item']}</CharacteristicItemId>\n")
+                w('              <FeatureMeasurementIds n="1">\n')
+                w(f"                <Id>{ch['feature']['meas']}</Id>\n")
+                w("              </FeatureMeasurementIds>\n")
+                w(f"              <Value>{value:.6f}</Value>\n")
+                w(f"            </{t}CharacteristicMeasurement>\n")
+            w("          </CharacteristicMeasurements>\n")
+            w("        </MeasuredCharacteristics>\n")
+        w("        <InspectionStatus>\n")
+        w(
+            "          <InspectionStatusEnum>"
+            f"{'PASS' if all_passed else 'FAIL'}</InspectionStatusEnum>\n"
+        )
+        w("        </InspectionStatus>\n")
+        w("      </MeasurementResults>\n    </MeasurementResultsSet>\n  </Results>\n")
+        w("</QIFDocument>\n")
+
+    return {
+        "path": path,
+        "features": features,
+        "characteristics": len(chars),
+        "pmi_displays": pmi_displays if chars else 0,
+        "points_per_feature": points_per_feature,
+        "id_max": ids.current,
+        "characteristic_names": [ch["name"] for ch in chars],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic QIF 3.0 document.")
+    parser.add_argument("output")
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--characteristics", type=int, default=200)
+    parser.add_argument("--pmi", type=int, default=None, help="PMIDisplays (default: one per characteristic)")
+    parser.add_argument("--points", type=int, default=20, help="measured points per feature")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    info = generate_qif(
+        args.output,
+        features=args.features,
+        characteristics=args.characteristics,
+        pmi_displays=args.pmi,
+        points_per_feature=args.points,
+        seed=args.seed,
+    )
+    info.pop("characteristic_names")
+    print(info)
+
+
+if __name__ == "__main__":
+    main()
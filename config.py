@@ -32,6 +32,152 @@ class Config:
     # Ensure the upload folder exists
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+    # Bumped on releases; part of every ETag so cached views are invalidated
+    APP_VERSION = os.environ.get("APP_VERSION", "0.1.0")
+
+    # HTTP / rendered-response caching for the per-file QIF views
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_ENTRIES = 256
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+    RESPONSE_CACHE_MAX_AGE = 0  # seconds; 0 => "no-cache" (always revalidate)
+
+    # Background jobs for the heavy QIF operations (compare, search, details, dictxml)
+    ASYNC_JOBS_ENABLED = True
+    JOB_WORKERS = 2
+    JOB_PROGRESS_INTERVAL = 0.5  # seconds between progress writes to the jobs table
+    JOB_MAX_PENDING = 32  # queued + running jobs (per worker process) before submissions get a 429
+    # Finished jobs and their results are deleted after this many seconds. Until
+    # then a done job is handed out again for an identical submission (same
+    # kind, params and file content), e.g. every visualize page load of a file.
+    JOB_RETENTION = 24 * 3600
+    JOB_HOUSEKEEPING_INTERVAL = 600  # seconds between orphan reaping + retention purges
+
+    # Admission control: keys are endpoint names ("qif.serve_qif_dict") or "job.<kind>"
+    ADMISSION_MEMORY_BUDGET = 1024 * 1024 * 1024  # 1 GB of estimated working memory, per worker process
+    ADMISSION_DEFAULT_CONCURRENCY = 4
+    ADMISSION_CONCURRENCY = {
+        "qif.serve_qif_dict": 2,
+        "qif.compare_files": 2,
+        "job.dictxml": 2,
+        "job.compare": 2,
+    }
+    # Estimated peak memory as a multiple of the file size
+    ADMISSION_DEFAULT_COST_FACTOR = 10
+    ADMISSION_COST_FACTORS = {
+        "qif.serve_qif_dict": 40,
+        "job.dictxml": 40,
+        "qif.compare_files": 12,
+        "job.compare": 12,
+        # streamed with iterparse; memory does not grow with file size
+        "qif.capability": 1,
+        "job.capability": 1,
+        "qif.graph_summary": 1,
+        "qif.graph_element": 1,
+        "qif.graph_tree": 1,
+        "qif.raw_diff": 1,  # mapped, not parsed; only line offsets and hashes are kept
+        "qif.resolve_set_characteristic": 1,  # reference graphs of the linked files
+    }
+    ADMISSION_MAX_QUEUE = 16  # requests waiting across all keys before a 429
+    ADMISSION_QUEUE_TIMEOUT = 10  # seconds a queued request waits before a 503
+    ADMISSION_RETRY_AFTER = 5  # seconds, sent in Retry-After
+
+    # On-demand profiling (?profile=cpu,memory or X-Profile) for qif routes.
+    # Disabled unless PROFILING_TOKEN is set; admins send it as X-Profile-Token.
+    PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")
+    PROFILE_FOLDER = os.path.join(basedir, "profiles")
+    PROFILING_TOP_N = 40
+    PROFILING_TRACEMALLOC_FRAMES = 1
+
+    # Decoded point/array data served by /qif/array/<index>/<filename>; larger
+    # arrays are downsampled while decoding
+    ARRAY_JSON_MAX_BYTES = 4 * 1024 * 1024
+    ARRAY_MAX_BYTES = 64 * 1024 * 1024
+
+    # Lot capability statistics (/qif/capability)
+    CAPABILITY_WORKERS = os.cpu_count()  # processes for parsing uncached files
+    CAPABILITY_PARALLEL_MIN = 64  # below this many uncached files, parse in-process
+
+    # Characteristic warehouse (/qif/warehouse), filled on upload
+    WAREHOUSE_MAX_PER_PAGE = 500
+
+    # Binary snapshots of parsed documents, written at ingest and keyed by
+    # content hash; QIFSummary maps them instead of parsing the XML
+    SNAPSHOT_ENABLED = True
+    SNAPSHOT_FOLDER = os.path.join(basedir, "snapshots")
+
+    # Canonical (C14N 2.0) fingerprints, stored in the catalogue at ingest:
+    # reformatted copies of a file skip re-extraction, diff as identical and
+    # share cached section results. Paths below QIFDocument (local names)
+    # left out as volatile; after changing them run `flask qif ingest --force`.
+    CANONICAL_STRIP = ("Version/TimeCreated", "Version/ThisInstanceQPId", "Header/Application")
+
+    # Pre-fork warmup (create_app(warmup=True), gunicorn.conf.py): schema tag
+    # tables and the most recently ingested files are loaded once, before the
+    # workers fork
+    WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED") == "1"
+    WARMUP_HOT_FILES = 32
+
+    # Raw XML line diff (/qif/raw-diff)
+    RAW_DIFF_CONTEXT = 3  # unchanged lines shown around each change
+    RAW_DIFF_ROWS_PER_PAGE = 200
+    RAW_DIFF_MAX_COST = 1000  # edits searched for between two anchor lines before the gap is shown as replaced
+    RAW_DIFF_MAX_LINE_CHARS = 2000  # longer lines are cut in the view
+
+    # Cross-document characteristic chains (/qif/set/characteristic)
+    SET_MAX_STARTS = 20  # elements a name lookup starts from
+
+    # Ad hoc XPath queries (/qif/xpath, `flask qif xpath`)
+    XPATH_WORKERS = os.cpu_count()  # worker processes, each with its own tree cache
+    XPATH_PARALLEL_MIN = 4  # fewer files than this are queried in-process
+    XPATH_TREE_CACHE_BYTES = 256 * 1024 * 1024  # source bytes of parsed trees kept per process
+    XPATH_MAX_RESULTS = 1000  # results per file per page
+    XPATH_MAX_FILES_PER_PAGE = 200
+
+    # Digital pipeline status (/digital_pipelines/status): the nodes of the
+    # pipeline tree (app/routes/pipeline_layout.py) each processing stage
+    # of an upload stands for, in pipeline order. "upload" is the authoring
+    # path that produced the file.
+    PIPELINE_STAGE_NODES = {
+        "upload": [1, 2, 3, 6, 9],
+        "ingest": [11],  # QIF + dimensions read into the warehouse
+        "validation": [13],  # schema-valid, so the inspection software accepts it
+        "audit": [14],  # nominals traced to features, items and PMI
+    }
+    PIPELINE_VALIDATE_ON_UPLOAD = True  # queue validation + audit after each ingest job
+    PIPELINE_STREAM_HEARTBEAT = 15  # seconds between keep-alives on the SSE feed
+    # Each SSE stream holds a worker thread for as long as its page is open.
+    # Past this many per worker (keep it below WEB_THREADS in gunicorn.conf.py)
+    # dashboards poll /status?since= every PIPELINE_POLL_INTERVAL seconds instead.
+    PIPELINE_MAX_STREAMS = int(os.environ.get("PIPELINE_MAX_STREAMS", 4))
+    PIPELINE_POLL_INTERVAL = 5
+    PIPELINE_REFRESH_INTERVAL = 2  # seconds; how stale the feed may be for changes made by other processes
+
+    # Testing game leaderboard (/testing/get-scores, /testing/add-scores)
+    LEADERBOARD_SIZE = 50  # top scores kept in memory
+    LEADERBOARD_MAX_AGE = 60  # seconds before the board is reloaded (picks up other processes' scores)
+    LEADERBOARD_MAX_BATCH = 1000  # scores per /add-scores request
+
+    # Cloud calculator (/testing/calculate). With TESTING or DEBUG set, point
+    # CALCULATOR_URL at /testing/calculator/stand-in to test without the
+    # remote server. /calculate answers 503 until the secret is set.
+    CALCULATOR_URL = os.environ.get("CALCULATOR_URL", "https://www.rsigma.io/arduino")
+    CALCULATOR_SHARED_SECRET = os.environ.get("CALCULATOR_SHARED_SECRET")
+    CALCULATOR_CONNECT_TIMEOUT = 3.05  # seconds to open a connection
+    CALCULATOR_READ_TIMEOUT = 5  # seconds to wait for the answer
+    CALCULATOR_RETRIES = 2  # on connection errors and 502/503/504, never on read timeouts
+    CALCULATOR_BACKOFF = 0.25  # seconds; doubles per retry
+    CALCULATOR_POOL_SIZE = 10  # kept-alive connections to the remote server
+    CALCULATOR_FAILURE_THRESHOLD = 5  # consecutive failures that open the circuit breaker
+    CALCULATOR_RESET_TIMEOUT = 30  # seconds the breaker stays open before a trial call
+    CALCULATOR_CACHE_ENTRIES = 256  # answers kept for repeated identical operations
+    CALCULATOR_CACHE_TTL = 300  # seconds
+    CALCULATOR_STAND_IN_DELAY = 0  # seconds the stand-in server waits before answering
+    CALCULATOR_STAND_IN_MAX_DELAY = 10  # cap on the stand-in's ?delay=
+
+    # `flask qif summary|validate|audit|diff` batch runs
+    BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 0)) or os.cpu_count()
+    BATCH_EXTENSIONS = {"xml", "qif"}  # picked up when a directory is given
+
 
 class DevelopmentConfig(Config):
     """Development-specific settings."""
@@ -0,0 +1,31 @@
+# gunicorn -c gunicorn.conf.py
+#
+# The app is built and warmed up once in the master (preload_app) and the
+# workers are forked from it, so the compiled schema, tag tables and hot
+# catalogue entries are shared copy-on-write rather than rebuilt per worker.
+#
+# Some state is still per worker process, so with several workers:
+#   - background jobs (app/routes/job_runner.py) run in the worker that took
+#     the submission; JOB_WORKERS and JOB_MAX_PENDING apply per worker.
+#     Ownership and cancellation go through the jobs table, so any worker can
+#     report on or cancel any job.
+#   - admission control (app/routes/admission.py) budgets each worker on its
+#     own: ADMISSION_MEMORY_BUDGET, the concurrency limits and the queue are
+#     per worker, so size them as total / WEB_CONCURRENCY.
+#   - /metrics and /qif/admission describe only the worker that answered;
+#     scrape every worker or run a single one when the numbers matter.
+import os
+
+wsgi_app = "app:create_app(warmup=True)"
+preload_app = True
+bind = os.environ.get("BIND", "0.0.0.0:8888")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+# Threads, so a slow request doesn't pin a whole worker. Each open SSE status
+# stream (/digital_pipelines/status/stream) still holds one thread for as long
+# as its page is open, so a worker takes at most PIPELINE_MAX_STREAMS streams
+# (config.py, default 4 of its WEB_THREADS) and further dashboards poll
+# /digital_pipelines/status?since= instead. Raise both together to serve more
+# live dashboards.
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+timeout = 120
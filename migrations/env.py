@@ -90,9 +90,18 @@ def run_migrations_online():
                 directives[:] = []
                 logger.debug('No changes in schema detected.')
 
+    # The FTS5 index and its shadow tables are created by hand in a migration
+    # and have no models; keep autogenerate from proposing to drop them.
+    def include_name(name, type_, parent_names):
+        if type_ == "table":
+            return not name.startswith("search_terms_fts")
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_name") is None:
+        conf_args["include_name"] = include_name
 
     connectable = get_engine()
 
@@ -0,0 +1,25 @@
+import os
+import pytest
+from config import TestingConfig
+from app import create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'app.db'}"
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        SNAPSHOT_FOLDER = str(tmp_path / "snapshots")
+        PROFILE_FOLDER = str(tmp_path / "profiles")
+        CALCULATOR_SHARED_SECRET = "test-secret"
+
+    os.makedirs(Config.UPLOAD_FOLDER)
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
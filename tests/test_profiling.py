@@ -0,0 +1,30 @@
+def test_profiles_need_the_token_header(app, client):
+    app.config["PROFILING_TOKEN"] = "sekret"
+    assert client.get("/qif/profiles/", headers={"X-Profile-Token": "wrong"}).status_code == 403
+    assert client.get("/qif/profiles/?profile_token=sekret").status_code == 403
+    assert client.get("/qif/profiles/", headers={"X-Profile-Token": "sekret"}).status_code == 200
+    # No session unlock: the next request without the header is refused again.
+    assert client.get("/qif/profiles/").status_code == 403
+
+
+def test_profiling_disabled_without_a_token(app, client):
+    app.config["PROFILING_TOKEN"] = None
+    assert client.get("/qif/profiles/", headers={"X-Profile-Token": ""}).status_code == 403
+
+
+def test_profiled_job_submission_runs_the_job(app, client):
+    import pstats
+    import shutil
+
+    app.config.update(PROFILING_TOKEN="sekret", ASYNC_JOBS_ENABLED=True)
+    shutil.copy("uploads/Exploded_Results1.QIF", app.config["UPLOAD_FOLDER"])
+    res = client.post(
+        "/qif/jobs",
+        json={"kind": "dictxml", "filename": "Exploded_Results1.QIF"},
+        headers={"X-Profile": "cpu", "X-Profile-Token": "sekret"},
+    )
+    assert res.status_code == 202
+    # The job ran inside the profiled request, so it is done and in the report.
+    assert client.get(res.get_json()["status_url"]).get_json()["status"] == "done"
+    stats = pstats.Stats(f"{app.config['PROFILE_FOLDER']}/{res.headers['X-Profile-Id']}.prof")
+    assert any(func == "dictxml_job" for _, _, func in stats.stats)
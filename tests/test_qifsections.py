@@ -0,0 +1,21 @@
+from app.routes.qifsections import section_hashes, tree_section_hashes
+from app.routes.qifsnapshot import parse_qif
+
+
+def test_streamed_and_tree_hashes_agree_on_a_file_with_comments():
+    path = "uploads/DMERules1.QIF"
+    with open(path, "rb") as f:
+        assert b"<!--" in f.read()
+    root, _ = parse_qif(path)
+    assert section_hashes(path) == tree_section_hashes(root)
+
+
+def test_streamed_and_tree_hashes_agree_on_an_other_namespace(tmp_path):
+    with open("uploads/Exploded_Results1.QIF", "rb") as f:
+        xml = f.read()
+    xml = xml.replace(b"<Results>", b'<Results xmlns:o="##other" o:note="x">', 1)
+    path = tmp_path / "other.QIF"
+    path.write_bytes(xml)
+    root, xml_errors = parse_qif(str(path))
+    assert xml_errors  # the namespace was patched for the tree
+    assert section_hashes(str(path)) == tree_section_hashes(root)
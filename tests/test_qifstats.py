@@ -0,0 +1,16 @@
+from app.routes.qifstats import extract_results, lot_capability
+
+
+def test_results_against_a_separate_plan_are_reported_not_dropped():
+    extract = extract_results("uploads/Exploded_Results1.QIF")
+    assert len(extract["key"]) == 0
+    assert extract["unjoined"] == 2
+    report = lot_capability(["uploads/Exploded_Results1.QIF"])
+    assert [entry["file"] for entry in report["skipped"]] == ["uploads/Exploded_Results1.QIF"]
+
+
+def test_unnamed_nominals_are_keyed_by_their_item_name():
+    extract = extract_results("uploads/WIDGET_QIF_RESULTS.QIF")
+    assert extract["unnamed"] == 0
+    assert len(extract["key"]) == 42
+    assert not any(key.startswith("#") for key in extract["key"])
@@ -0,0 +1,111 @@
+import threading
+import time
+import pytest
+from werkzeug.serving import make_server
+from config import Config
+from app import create_app
+from app.routes.remote_client import RemoteClient, RemoteError, CircuitOpen
+
+OPERATION = {"device": "test", "operation": {"type": "add", "number1": 2, "number2": 3}}
+HEADERS = {"X-Shared-Secret": "test-secret"}
+
+
+@pytest.fixture
+def stand_in(app):
+    """The app served over real HTTP, with a count of stand-in requests."""
+    hits = []
+
+    @app.before_request
+    def count_hit():
+        hits.append(time.monotonic())
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/testing/calculator/stand-in", hits
+    server.shutdown()
+    thread.join()
+
+
+def make_client(**kwargs):
+    options = dict(read_timeout=2, retries=2, backoff=0, failure_threshold=5, reset_timeout=30)
+    options.update(kwargs)
+    return RemoteClient("calculator-test", **options)
+
+
+def test_answers_and_caches(stand_in):
+    url, hits = stand_in
+    client = make_client()
+    assert client.post_json(url, OPERATION, headers=HEADERS)["result"] == 5
+    assert client.post_json(url, OPERATION, headers=HEADERS)["result"] == 5
+    assert len(hits) == 1
+
+
+def test_read_timeout_is_not_retried(stand_in):
+    url, hits = stand_in
+    client = make_client(read_timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises(RemoteError, match="timed out"):
+        client.post_json(f"{url}?delay=1", OPERATION, headers=HEADERS)
+    assert time.monotonic() - start < 1
+    assert len(hits) == 1
+
+
+def test_retries_gateway_errors(stand_in):
+    url, hits = stand_in
+    client = make_client(retries=2)
+    with pytest.raises(RemoteError, match="503"):
+        client.post_json(f"{url}?status=503", OPERATION, headers=HEADERS)
+    assert len(hits) == 3
+
+
+def test_other_errors_are_not_retried_or_cached(stand_in):
+    url, hits = stand_in
+    client = make_client()
+    for _ in range(2):
+        with pytest.raises(RemoteError, match="500"):
+            client.post_json(f"{url}?status=500", OPERATION, headers=HEADERS)
+    assert len(hits) == 2
+    assert len(client.cache) == 0
+
+
+def test_breaker_opens_and_recovers(stand_in):
+    url, hits = stand_in
+    client = make_client(failure_threshold=2, reset_timeout=0.3)
+    for _ in range(2):
+        with pytest.raises(RemoteError):
+            client.post_json(f"{url}?status=500", OPERATION, headers=HEADERS)
+    with pytest.raises(CircuitOpen):
+        client.post_json(url, OPERATION, headers=HEADERS)
+    assert len(hits) == 2
+    assert client.breaker.state == "open"
+
+    time.sleep(0.3)
+    assert client.breaker.state == "half-open"
+    assert client.post_json(url, OPERATION, headers=HEADERS)["result"] == 5
+    assert client.breaker.state == "closed"
+
+
+def test_stand_in_rejects_wrong_secret(stand_in):
+    url, hits = stand_in
+    with pytest.raises(RemoteError, match="403"):
+        make_client().post_json(url, OPERATION, headers={"X-Shared-Secret": "wrong"})
+
+
+def test_stand_in_clamps_delay(app, client):
+    app.config["CALCULATOR_STAND_IN_MAX_DELAY"] = 0.1
+    start = time.monotonic()
+    response = client.post(
+        "/testing/calculator/stand-in?delay=1000", json=OPERATION, headers=HEADERS
+    )
+    assert response.status_code == 200
+    assert time.monotonic() - start < 1
+
+
+def test_stand_in_only_registered_for_testing_or_debug(tmp_path):
+    class ProductionLike(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'app.db'}"
+
+    client = create_app(ProductionLike).test_client()
+    response = client.post("/testing/calculator/stand-in", json=OPERATION, headers=HEADERS)
+    assert response.status_code == 404